@@ -1,18 +1,112 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
 from database import BillingDatabase
+from metrics import CONTENT_TYPE, REGISTRY
+from serializers import JsonSerializer
+from reports import ACCUMULATORS, REPORT_TYPES
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
 import json
 from dateutil.parser import parse
+from payment_import import read_rows, import_payments
+import codecs
+import csv
+import io
+import time
 
 # Load environment variables
 load_dotenv()
 
+class FastJSONProvider(DefaultJSONProvider):
+    """Encodes responses with the record serializer's JSON encoder (orjson when installed)"""
+
+    _serializer = JsonSerializer()
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            # Formatting options such as indent are left to the standard encoder
+            return super().dumps(obj, **kwargs)
+        return self._serializer.dumps(obj, default=self.default, sort_keys=self.sort_keys).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            self._serializer.dumps(obj, default=self.default, sort_keys=self.sort_keys),
+            mimetype=self.mimetype
+        )
+
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 CORS(app)  # Enable CORS for all routes
 
+# Maximum number of invoices accepted by one batch request
+INVOICE_BATCH_LIMIT = int(os.getenv("INVOICE_BATCH_LIMIT", "10000"))
+
+# Default and maximum page sizes for invoice listing
+INVOICE_PAGE_SIZE = 50
+INVOICE_PAGE_LIMIT = 500
+
+# Served by GET / (here and by the async server in asgi.py)
+API_INFO = {
+    "name": "Chromapages Billing API",
+    "version": "1.0.0",
+    "endpoints": {
+        "health": "/health",
+        "invoices": {
+            "list": "GET /api/invoices",
+            "create": "POST /api/invoices",
+            "create_batch": "POST /api/invoices/batch",
+            "get": "GET /api/invoices/<id>",
+            "update_status": "PUT /api/invoices/<id>/status",
+            "get_overdue": "GET /api/invoices/overdue"
+        },
+        "payments": {
+            "create": "POST /api/payments",
+            "import": "POST /api/payments/import"
+        },
+        "reports": {
+            "generate": "POST /api/reports",
+            "types": "GET /api/reports/types"
+        },
+        "outbox": "GET /api/outbox",
+        "metrics": "GET /metrics"
+    }
+}
+
+# Served by GET /api/reports/types
+REPORT_TYPE_INFO = {
+    "report_types": [
+        {
+            "id": "revenue",
+            "name": "Revenue Report",
+            "description": "Revenue analysis and trends"
+        },
+        {
+            "id": "outstanding",
+            "name": "Outstanding Invoice Report",
+            "description": "Analysis of outstanding invoices"
+        },
+        {
+            "id": "client_analysis",
+            "name": "Client Analysis Report",
+            "description": "Client spending patterns and metrics"
+        },
+        {
+            "id": "service_metrics",
+            "name": "Service Metrics Report",
+            "description": "Service popularity and revenue analysis"
+        },
+        {
+            "id": "payment_trends",
+            "name": "Payment Trends Report",
+            "description": "Payment method analysis and trends"
+        }
+    ]
+}
+
 # Initialize database lazily
 db = None
 
@@ -23,6 +117,42 @@ def get_db():
         db = app.config.get('DATABASE') or BillingDatabase()
     return db
 
+def _outbox_depths():
+    """Outbox queue depths, once the database is open and the outbox enabled"""
+    outbox = db.email_service.outbox if db is not None else None
+    if outbox is None:
+        return []
+    stats = outbox.stats()
+    return [(("pending",), stats["depth"] - stats["in_flight"]), (("in_flight",), stats["in_flight"]),
+            (("failed",), stats["failed"])]
+
+def _outbox_oldest_age():
+    outbox = db.email_service.outbox if db is not None else None
+    return [((), outbox.stats()["oldest_age_seconds"])] if outbox is not None else []
+
+HTTP_SECONDS = REGISTRY.histogram(
+    "billing_http_request_duration_seconds", "Time to produce a response, by route", ["method", "endpoint"])
+HTTP_REQUESTS = REGISTRY.counter(
+    "billing_http_requests_total", "Responses sent, by route and status", ["method", "endpoint", "status"])
+REGISTRY.gauge("billing_email_outbox_messages", "Messages in the email outbox", ["state"], collect=_outbox_depths)
+REGISTRY.gauge("billing_email_outbox_oldest_age_seconds", "Age of the oldest undelivered outbox message",
+               collect=_outbox_oldest_age)
+
+# Request metrics
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+
+@app.after_request
+def record_request(response):
+    start = g.pop("request_start", None)
+    if start is not None and REGISTRY.enabled:
+        # Labelled by route pattern, so invoice IDs do not become label values
+        endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+        HTTP_SECONDS.labels(request.method, endpoint).observe(time.perf_counter() - start)
+        HTTP_REQUESTS.labels(request.method, endpoint, response.status_code).inc()
+    return response
+
 # Error handlers
 @app.errorhandler(404)
 def not_found_error(error):
@@ -58,26 +188,7 @@ def health_check():
 @app.route('/', methods=['GET'])
 def root():
     """Root endpoint with API information"""
-    return jsonify({
-        "name": "Chromapages Billing API",
-        "version": "1.0.0",
-        "endpoints": {
-            "health": "/health",
-            "invoices": {
-                "create": "POST /api/invoices",
-                "get": "GET /api/invoices/<id>",
-                "update_status": "PUT /api/invoices/<id>/status",
-                "get_overdue": "GET /api/invoices/overdue"
-            },
-            "payments": {
-                "create": "POST /api/payments"
-            },
-            "reports": {
-                "generate": "POST /api/reports",
-                "types": "GET /api/reports/types"
-            }
-        }
-    })
+    return jsonify(API_INFO)
 
 # Invoice endpoints
 @app.route('/api/invoices', methods=['POST'])
@@ -107,13 +218,123 @@ def create_invoice():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/invoices', methods=['GET'])
+def list_invoices():
+    """List invoices with optional filters and cursor pagination
+    
+    Query parameters: status, client, service, due_from, due_to,
+    created_from, created_to (ISO dates), limit and cursor (the next_cursor
+    of the previous page).
+    """
+    try:
+        args = request.args
+        dates = {}
+        for param, name in (("due_from", "due_start"), ("due_to", "due_end"),
+                            ("created_from", "created_start"), ("created_to", "created_end")):
+            if param in args:
+                try:
+                    dates[name] = parse(args[param])
+                except (ValueError, OverflowError):
+                    return jsonify({"error": f"Invalid {param} date. Use ISO format (YYYY-MM-DD)"}), 400
+        
+        try:
+            limit = int(args.get("limit", INVOICE_PAGE_SIZE))
+        except ValueError:
+            return jsonify({"error": "limit must be an integer"}), 400
+        if not 1 <= limit <= INVOICE_PAGE_LIMIT:
+            return jsonify({"error": f"limit must be between 1 and {INVOICE_PAGE_LIMIT}"}), 400
+        
+        page = get_db().list_invoices(
+            status=args.get("status"),
+            client_name=args.get("client"),
+            service=args.get("service"),
+            cursor=args.get("cursor"),
+            limit=limit,
+            **dates
+        )
+        return jsonify({
+            "count": len(page["invoices"]),
+            "invoices": page["invoices"],
+            "next_cursor": page["next_cursor"]
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/api/invoices/batch', methods=['POST'])
+def create_invoices_batch():
+    """Create many invoices in one request
+    
+    Accepts a JSON array of invoices, {"invoices": [...]}, or an NDJSON body
+    (Content-Type: application/x-ndjson) with one invoice per line. Every item
+    gets its own result; invalid items do not stop the rest of the batch.
+    """
+    try:
+        results = []
+        items = []
+        positions = []
+        
+        if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+            lines = [line for line in request.get_data(as_text=True).splitlines() if line.strip()]
+            for index, line in enumerate(lines):
+                results.append(None)
+                try:
+                    items.append(json.loads(line))
+                    positions.append(index)
+                except ValueError as e:
+                    results[index] = {"index": index, "status": "error", "errors": [f"Invalid JSON: {str(e)}"]}
+        else:
+            data = request.get_json()
+            if isinstance(data, dict):
+                data = data.get("invoices")
+            if not isinstance(data, list):
+                return jsonify({
+                    "error": "Expected a JSON array of invoices or an object with an 'invoices' array"
+                }), 400
+            items = data
+            positions = list(range(len(items)))
+            results = [None] * len(items)
+        
+        if not results:
+            return jsonify({"error": "No invoices provided"}), 400
+        if len(results) > INVOICE_BATCH_LIMIT:
+            return jsonify({
+                "error": f"Batch too large: {len(results)} invoices (limit {INVOICE_BATCH_LIMIT})"
+            }), 400
+        
+        # Set due date if not provided
+        default_due_date = (datetime.now() + timedelta(days=30)).isoformat()
+        for item in items:
+            if isinstance(item, dict) and "due_date" not in item:
+                item["due_date"] = default_due_date
+        
+        for position, result in zip(positions, get_db().create_invoices(items)):
+            result["index"] = position
+            results[position] = result
+        
+        created = sum(1 for result in results if result["status"] == "created")
+        return jsonify({
+            "message": f"Created {created} of {len(results)} invoices",
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        })
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/api/invoices/<invoice_id>', methods=['GET'])
 def get_invoice(invoice_id):
     """Get invoice details"""
     try:
-        invoice = get_db().get_invoice(invoice_id)
-        if invoice:
-            return jsonify(invoice)
+        entry = get_db().get_invoice_entry(invoice_id)
+        if entry:
+            # Answers If-None-Match / If-Modified-Since with 304 Not Modified
+            response = jsonify(entry.record)
+            response.set_etag(entry.etag)
+            if entry.last_modified:
+                response.last_modified = entry.last_modified
+            return response.make_conditional(request)
         return jsonify({"error": "Invoice not found"}), 404
         
     except Exception as e:
@@ -172,6 +393,39 @@ def record_payment():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/payments/import', methods=['POST'])
+def import_payments_file():
+    """Import a bank or processor payment export
+    
+    Accepts a CSV (text/csv, with a header row) or NDJSON
+    (application/x-ndjson) body, or a multipart upload in a "file" field.
+    The format can also be given as ?format=csv|ndjson. The export is read
+    as a stream, so large files are never held in memory.
+    """
+    try:
+        fmt = request.args.get("format")
+        upload = request.files.get("file")
+        mimetype = upload.mimetype if upload else request.mimetype
+        if not fmt:
+            if mimetype in ("text/csv", "application/csv"):
+                fmt = "csv"
+            elif mimetype in ("application/x-ndjson", "application/jsonl"):
+                fmt = "ndjson"
+            elif upload and upload.filename:
+                fmt = "csv" if upload.filename.lower().endswith(".csv") else "ndjson"
+        if fmt not in ("csv", "ndjson"):
+            return jsonify({
+                "error": "Unsupported format: send text/csv or application/x-ndjson, or pass ?format=csv|ndjson"
+            }), 400
+        
+        stream = codecs.getreader("utf-8")(upload.stream if upload else request.stream)
+        summary = import_payments(get_db(), read_rows(stream, fmt))
+        summary["message"] = f"Imported {summary['imported']} of {summary['rows']} payments"
+        return jsonify(summary)
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
 # Report endpoints
 @app.route('/api/reports', methods=['POST'])
 def generate_report():
@@ -196,55 +450,142 @@ def generate_report():
                 "error": "Invalid date format. Use ISO format (YYYY-MM-DD)"
             }), 400
         
+        # Several report types can be built from a single pass over the data
+        report_type = data["report_type"]
+        if isinstance(report_type, list):
+            unknown_types = [t for t in report_type if t not in REPORT_TYPES]
+            if unknown_types or not report_type:
+                return jsonify({
+                    "error": f"Invalid report types: {', '.join(unknown_types) or 'empty list'}"
+                }), 400
+        
+        # Large periods can be streamed as NDJSON or CSV rows with a summary trailer
+        stream_format = data.get("stream")
+        if not stream_format:
+            accept = request.accept_mimetypes
+            if accept.best in ("application/x-ndjson", "text/csv"):
+                stream_format = "ndjson" if accept.best == "application/x-ndjson" else "csv"
+        if stream_format:
+            if stream_format not in ("ndjson", "csv"):
+                return jsonify({"error": "stream must be 'ndjson' or 'csv'"}), 400
+            if report_type not in REPORT_TYPES:
+                return jsonify({"error": "Streaming requires a single valid report_type"}), 400
+            return _stream_report_response(report_type, start_date, end_date, stream_format)
+        
         # Optional parameters
         export_format = data.get("export_format", "json")
         email_to = data.get("email_to")
         
+        # A client holding the current version needs no new report, unless it
+        # also asked for the report to be exported or emailed
+        if request.if_none_match and not email_to and export_format != "csv":
+            etag = get_db().report_etag(report_type, start_date, end_date, export_format)
+            if request.if_none_match.contains(etag.strip('"')):
+                response = Response(status=304)
+                response.headers["ETag"] = etag
+                return response
+        
         report = get_db().generate_report(
-            data["report_type"],
+            report_type,
             start_date,
             end_date,
             export_format,
             email_to
         )
         
-        return jsonify(report)
+        response = jsonify(report)
+        response.headers["ETag"] = report["cache"]["etag"]
+        response.headers["X-Cache"] = "HIT" if report["cache"]["hit"] else "MISS"
+        return response
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+def _stream_report_response(report_type, start_date, end_date, stream_format):
+    """Stream a report row by row, ending with a summary record
+    
+    NDJSON responses are a header record, one {"type": "row"} record per
+    detail row and a final {"type": "summary"} record. CSV responses are a
+    header line and the rows, then a blank line and a "summary" line carrying
+    the totals as JSON. An error after the response has started is reported
+    as a final {"type": "error"} record (or "error" line).
+    """
+    rows = get_db().stream_report(report_type, start_date, end_date)
+    if stream_format == "csv":
+        response = Response(stream_with_context(report_csv_chunks(report_type, rows)), mimetype="text/csv")
+        response.headers["Content-Disposition"] = f'attachment; filename="{report_type}_report.csv"'
+        return response
+    return Response(stream_with_context(report_ndjson_chunks(report_type, start_date, end_date, rows)),
+                    mimetype="application/x-ndjson")
+
+def report_ndjson_chunks(report_type, start_date, end_date, rows):
+    """NDJSON body of a streamed report, in batches of records"""
+    encode = FastJSONProvider._serializer.dumps
+    chunk = [encode({
+        "type": "header",
+        "report_type": report_type,
+        "period": {"start": start_date.isoformat(), "end": end_date.isoformat()},
+        "generated_at": datetime.now().isoformat()
+    })]
+    try:
+        for kind, record in rows:
+            chunk.append(encode({"type": kind, "data": record}, default=str))
+            # Send rows in batches rather than one small write per row
+            if len(chunk) >= 500:
+                yield b"\n".join(chunk) + b"\n"
+                chunk = []
+    except Exception as e:
+        chunk.append(encode({"type": "error", "error": str(e)}))
+    if chunk:
+        yield b"\n".join(chunk) + b"\n"
+
+def report_csv_chunks(report_type, rows):
+    """CSV body of a streamed report, in chunks of about 64 KB"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    fields = ACCUMULATORS[report_type].row_fields
+    writer.writerow(fields)
+    try:
+        for kind, record in rows:
+            if kind == "row":
+                writer.writerow([record.get(field) for field in fields])
+            else:
+                writer.writerow([])
+                writer.writerow(["summary", json.dumps(record, default=str)])
+            if buffer.tell() >= 64 * 1024:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+    except Exception as e:
+        writer.writerow(["error", str(e)])
+    if buffer.tell():
+        yield buffer.getvalue()
+
 @app.route('/api/reports/types', methods=['GET'])
 def get_report_types():
     """Get available report types"""
-    return jsonify({
-        "report_types": [
-            {
-                "id": "revenue",
-                "name": "Revenue Report",
-                "description": "Revenue analysis and trends"
-            },
-            {
-                "id": "outstanding",
-                "name": "Outstanding Invoice Report",
-                "description": "Analysis of outstanding invoices"
-            },
-            {
-                "id": "client_analysis",
-                "name": "Client Analysis Report",
-                "description": "Client spending patterns and metrics"
-            },
-            {
-                "id": "service_metrics",
-                "name": "Service Metrics Report",
-                "description": "Service popularity and revenue analysis"
-            },
-            {
-                "id": "payment_trends",
-                "name": "Payment Trends Report",
-                "description": "Payment method analysis and trends"
-            }
-        ]
-    })
+    return jsonify(REPORT_TYPE_INFO)
+
+# Email outbox endpoints
+@app.route('/api/outbox', methods=['GET'])
+def get_outbox_stats():
+    """Get email outbox queue depth and the age of the oldest message"""
+    try:
+        outbox = get_db().email_service.outbox
+        if outbox is None:
+            return jsonify({"enabled": False})
+        return jsonify({"enabled": True, **outbox.stats()})
+        
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# Metrics endpoint
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Prometheus metrics of every worker sharing METRICS_DIR"""
+    if not REGISTRY.enabled:
+        return jsonify({"error": "Metrics are disabled"}), 404
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
     # Ensure data directory exists
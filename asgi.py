@@ -0,0 +1,582 @@
+from typing import Dict, Optional
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+import asyncio
+import codecs
+import email
+import io
+import json
+import os
+import re
+import time
+import anyio
+from dateutil.parser import parse
+from flask.json.provider import DefaultJSONProvider
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+from app import (API_INFO, INVOICE_BATCH_LIMIT, INVOICE_PAGE_LIMIT, INVOICE_PAGE_SIZE, REPORT_TYPE_INFO,
+                 FastJSONProvider, HTTP_REQUESTS, HTTP_SECONDS, get_db, report_csv_chunks,
+                 report_ndjson_chunks)
+from async_smtp import AsyncSMTPConnectionPool
+from metrics import CONTENT_TYPE, REGISTRY
+from payment_import import read_rows, import_payments
+from reports import REPORT_TYPES
+
+
+def json_response(data, status: int = 200, headers: Dict = None) -> Response:
+    """JSON response encoded as app.py encodes it"""
+    body = FastJSONProvider._serializer.dumps(data, default=DefaultJSONProvider.default, sort_keys=True)
+    return Response(body, status_code=status, headers=headers, media_type="application/json")
+
+
+async def _get_json(request: Request):
+    return json.loads(await request.body())
+
+
+def _etag_matches(header: Optional[str], etag: str, weak: bool = True) -> bool:
+    """Whether an If-None-Match header lists etag (unquoted) or *"""
+    for tag in (header or "").split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            if not weak:
+                continue
+            tag = tag[2:]
+        if tag.strip('"') == etag:
+            return True
+    return False
+
+
+def _not_modified(request: Request, etag: str, last_modified: Optional[datetime]) -> bool:
+    """Conditional GET: If-None-Match, or else If-Modified-Since"""
+    if "if-none-match" in request.headers:
+        return _etag_matches(request.headers["if-none-match"], etag)
+    since = request.headers.get("if-modified-since")
+    if since and last_modified:
+        try:
+            return last_modified.replace(microsecond=0) <= parsedate_to_datetime(since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _best_accept(header: Optional[str]) -> Optional[str]:
+    """Media type of the Accept header with the highest quality"""
+    best, best_quality = None, 0.0
+    for entry in (header or "").split(","):
+        parts = [part.strip() for part in entry.split(";")]
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if parts[0] and quality > best_quality:
+            best, best_quality = parts[0], quality
+    return best
+
+
+class _BodyReader(io.RawIOBase):
+    """The request body as a blocking file, for code running on a pool thread
+
+    Each read waits for the next chunk from the event loop, so the body is
+    never held in memory as a whole.
+    """
+
+    def __init__(self, request: Request):
+        self._chunks = request.stream()
+        self._buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        while not self._buffer:
+            try:
+                self._buffer = anyio.from_thread.run(self._chunks.__anext__)
+            except StopAsyncIteration:
+                return 0
+        size = min(len(buffer), len(self._buffer))
+        buffer[:size] = self._buffer[:size]
+        self._buffer = self._buffer[size:]
+        return size
+
+
+# Health check endpoint
+async def health_check(request: Request) -> Response:
+    """Quick health check endpoint"""
+    return json_response({
+        "status": "healthy",
+        "timestamp": datetime.now().isoformat()
+    })
+
+
+async def root(request: Request) -> Response:
+    """Root endpoint with API information"""
+    return json_response(API_INFO)
+
+
+# Invoice endpoints
+async def create_invoice(request: Request) -> Response:
+    """Create a new invoice"""
+    try:
+        data = await _get_json(request)
+        required_fields = ["client_name", "services", "amount"]
+
+        # Validate required fields
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return json_response({
+                "error": f"Missing required fields: {', '.join(missing_fields)}"
+            }, 400)
+
+        # Set due date if not provided
+        if "due_date" not in data:
+            data["due_date"] = (datetime.now() + timedelta(days=30)).isoformat()
+
+        invoice_id = await run_in_threadpool(get_db().create_invoice, data)
+        return json_response({
+            "message": "Invoice created successfully",
+            "invoice_id": invoice_id
+        })
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+async def list_invoices(request: Request) -> Response:
+    """List invoices with optional filters and cursor pagination"""
+    try:
+        args = request.query_params
+        dates = {}
+        for param, name in (("due_from", "due_start"), ("due_to", "due_end"),
+                            ("created_from", "created_start"), ("created_to", "created_end")):
+            if param in args:
+                try:
+                    dates[name] = parse(args[param])
+                except (ValueError, OverflowError):
+                    return json_response({"error": f"Invalid {param} date. Use ISO format (YYYY-MM-DD)"}, 400)
+
+        try:
+            limit = int(args.get("limit", INVOICE_PAGE_SIZE))
+        except ValueError:
+            return json_response({"error": "limit must be an integer"}, 400)
+        if not 1 <= limit <= INVOICE_PAGE_LIMIT:
+            return json_response({"error": f"limit must be between 1 and {INVOICE_PAGE_LIMIT}"}, 400)
+
+        page = await run_in_threadpool(
+            get_db().list_invoices,
+            status=args.get("status"),
+            client_name=args.get("client"),
+            service=args.get("service"),
+            cursor=args.get("cursor"),
+            limit=limit,
+            **dates
+        )
+        return json_response({
+            "count": len(page["invoices"]),
+            "invoices": page["invoices"],
+            "next_cursor": page["next_cursor"]
+        })
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+async def create_invoices_batch(request: Request) -> Response:
+    """Create many invoices in one request (JSON array, {"invoices": [...]} or NDJSON)"""
+    try:
+        results = []
+        items = []
+        positions = []
+
+        mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+        if mimetype in ("application/x-ndjson", "application/jsonl"):
+            body = (await request.body()).decode()
+            lines = [line for line in body.splitlines() if line.strip()]
+            for index, line in enumerate(lines):
+                results.append(None)
+                try:
+                    items.append(json.loads(line))
+                    positions.append(index)
+                except ValueError as e:
+                    results[index] = {"index": index, "status": "error", "errors": [f"Invalid JSON: {str(e)}"]}
+        else:
+            data = await _get_json(request)
+            if isinstance(data, dict):
+                data = data.get("invoices")
+            if not isinstance(data, list):
+                return json_response({
+                    "error": "Expected a JSON array of invoices or an object with an 'invoices' array"
+                }, 400)
+            items = data
+            positions = list(range(len(items)))
+            results = [None] * len(items)
+
+        if not results:
+            return json_response({"error": "No invoices provided"}, 400)
+        if len(results) > INVOICE_BATCH_LIMIT:
+            return json_response({
+                "error": f"Batch too large: {len(results)} invoices (limit {INVOICE_BATCH_LIMIT})"
+            }, 400)
+
+        # Set due date if not provided
+        default_due_date = (datetime.now() + timedelta(days=30)).isoformat()
+        for item in items:
+            if isinstance(item, dict) and "due_date" not in item:
+                item["due_date"] = default_due_date
+
+        created_results = await run_in_threadpool(get_db().create_invoices, items)
+        for position, result in zip(positions, created_results):
+            result["index"] = position
+            results[position] = result
+
+        created = sum(1 for result in results if result["status"] == "created")
+        return json_response({
+            "message": f"Created {created} of {len(results)} invoices",
+            "created": created,
+            "failed": len(results) - created,
+            "results": results
+        })
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_invoice(request: Request) -> Response:
+    """Get invoice details"""
+    try:
+        entry = await run_in_threadpool(get_db().get_invoice_entry, request.path_params["invoice_id"])
+        if entry:
+            # Answers If-None-Match / If-Modified-Since with 304 Not Modified
+            headers = {"ETag": f'"{entry.etag}"'}
+            if entry.last_modified:
+                headers["Last-Modified"] = format_datetime(entry.last_modified.astimezone(timezone.utc), usegmt=True)
+            if _not_modified(request, entry.etag, entry.last_modified):
+                return Response(status_code=304, headers=headers)
+            return json_response(entry.record, headers=headers)
+        return json_response({"error": "Invoice not found"}, 404)
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+async def update_invoice_status(request: Request) -> Response:
+    """Update invoice status"""
+    try:
+        data = await _get_json(request)
+        if "status" not in data:
+            return json_response({"error": "Status field is required"}, 400)
+
+        success = await run_in_threadpool(get_db().update_invoice_status,
+                                          request.path_params["invoice_id"], data["status"])
+        if success:
+            return json_response({"message": "Invoice status updated successfully"})
+        return json_response({"error": "Invoice not found"}, 404)
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_overdue_invoices(request: Request) -> Response:
+    """Get all overdue invoices"""
+    try:
+        overdue = await run_in_threadpool(get_db().get_overdue_invoices)
+        return json_response({
+            "count": len(overdue),
+            "invoices": overdue
+        })
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+# Payment endpoints
+async def record_payment(request: Request) -> Response:
+    """Record a payment"""
+    try:
+        data = await _get_json(request)
+        required_fields = ["invoice_id", "amount", "payment_method"]
+
+        # Validate required fields
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return json_response({
+                "error": f"Missing required fields: {', '.join(missing_fields)}"
+            }, 400)
+
+        payment_id = await run_in_threadpool(get_db().record_payment, data)
+        return json_response({
+            "message": "Payment recorded successfully",
+            "payment_id": payment_id
+        })
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+async def import_payments_file(request: Request) -> Response:
+    """Import a CSV or NDJSON payment export, raw or as a multipart "file" upload
+
+    A raw body is read from the event loop as the import consumes it; an
+    upload is spooled to a temporary file by the form parser first.
+    """
+    try:
+        fmt = request.query_params.get("format")
+        mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+        upload = None
+        if mimetype == "multipart/form-data":
+            upload = (await request.form()).get("file")
+            if upload is not None and not hasattr(upload, "file"):
+                upload = None
+            mimetype = upload.content_type.split(";")[0].strip() if upload and upload.content_type else ""
+        if not fmt:
+            if mimetype in ("text/csv", "application/csv"):
+                fmt = "csv"
+            elif mimetype in ("application/x-ndjson", "application/jsonl"):
+                fmt = "ndjson"
+            elif upload and upload.filename:
+                fmt = "csv" if upload.filename.lower().endswith(".csv") else "ndjson"
+        if fmt not in ("csv", "ndjson"):
+            return json_response({
+                "error": "Unsupported format: send text/csv or application/x-ndjson, or pass ?format=csv|ndjson"
+            }, 400)
+
+        stream = codecs.getreader("utf-8")(upload.file if upload else io.BufferedReader(_BodyReader(request)))
+        db = get_db()
+        summary = await run_in_threadpool(lambda: import_payments(db, read_rows(stream, fmt)))
+        summary["message"] = f"Imported {summary['imported']} of {summary['rows']} payments"
+        return json_response(summary)
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+# Report endpoints
+async def generate_report(request: Request) -> Response:
+    """Generate a financial report"""
+    try:
+        data = await _get_json(request)
+        required_fields = ["report_type", "start_date", "end_date"]
+
+        # Validate required fields
+        missing_fields = [field for field in required_fields if field not in data]
+        if missing_fields:
+            return json_response({
+                "error": f"Missing required fields: {', '.join(missing_fields)}"
+            }, 400)
+
+        # Parse dates
+        try:
+            start_date = parse(data["start_date"])
+            end_date = parse(data["end_date"])
+        except ValueError:
+            return json_response({
+                "error": "Invalid date format. Use ISO format (YYYY-MM-DD)"
+            }, 400)
+
+        # Several report types can be built from a single pass over the data
+        report_type = data["report_type"]
+        if isinstance(report_type, list):
+            unknown_types = [t for t in report_type if t not in REPORT_TYPES]
+            if unknown_types or not report_type:
+                return json_response({
+                    "error": f"Invalid report types: {', '.join(unknown_types) or 'empty list'}"
+                }, 400)
+
+        # Large periods can be streamed as NDJSON or CSV rows with a summary trailer
+        stream_format = data.get("stream")
+        if not stream_format:
+            accept = _best_accept(request.headers.get("accept"))
+            if accept in ("application/x-ndjson", "text/csv"):
+                stream_format = "ndjson" if accept == "application/x-ndjson" else "csv"
+        if stream_format:
+            if stream_format not in ("ndjson", "csv"):
+                return json_response({"error": "stream must be 'ndjson' or 'csv'"}, 400)
+            if report_type not in REPORT_TYPES:
+                return json_response({"error": "Streaming requires a single valid report_type"}, 400)
+            rows = await run_in_threadpool(get_db().stream_report, report_type, start_date, end_date)
+            # Chunks are produced on pool threads and sent by the loop
+            if stream_format == "csv":
+                return StreamingResponse(report_csv_chunks(report_type, rows), media_type="text/csv", headers={
+                    "Content-Disposition": f'attachment; filename="{report_type}_report.csv"'
+                })
+            return StreamingResponse(report_ndjson_chunks(report_type, start_date, end_date, rows),
+                                     media_type="application/x-ndjson")
+
+        # Optional parameters
+        export_format = data.get("export_format", "json")
+        email_to = data.get("email_to")
+
+        # A client holding the current version needs no new report, unless it
+        # also asked for the report to be exported or emailed
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and not email_to and export_format != "csv":
+            etag = await run_in_threadpool(get_db().report_etag, report_type, start_date, end_date, export_format)
+            if _etag_matches(if_none_match, etag.strip('"'), weak=False):
+                return Response(status_code=304, headers={"ETag": etag})
+
+        report = await run_in_threadpool(
+            get_db().generate_report,
+            report_type,
+            start_date,
+            end_date,
+            export_format,
+            email_to
+        )
+
+        return json_response(report, headers={
+            "ETag": report["cache"]["etag"],
+            "X-Cache": "HIT" if report["cache"]["hit"] else "MISS"
+        })
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+async def get_report_types(request: Request) -> Response:
+    """Get available report types"""
+    return json_response(REPORT_TYPE_INFO)
+
+
+# Email outbox endpoints
+async def get_outbox_stats(request: Request) -> Response:
+    """Get email outbox queue depth and the age of the oldest message"""
+    try:
+        outbox = get_db().email_service.outbox
+        if outbox is None:
+            return json_response({"enabled": False})
+        return json_response({"enabled": True, **(await run_in_threadpool(outbox.stats))})
+
+    except Exception as e:
+        return json_response({"error": str(e)}, 500)
+
+
+# Metrics endpoint
+async def get_metrics(request: Request) -> Response:
+    """Prometheus metrics of every worker sharing METRICS_DIR"""
+    if not REGISTRY.enabled:
+        return json_response({"error": "Metrics are disabled"}, 404)
+    return Response(await run_in_threadpool(REGISTRY.render), headers={"Content-Type": CONTENT_TYPE})
+
+
+# Error handlers
+async def not_found_error(request: Request, exc: HTTPException) -> Response:
+    return json_response({
+        "error": "Resource not found",
+        "message": "404 Not Found: The requested URL was not found on the server. If you entered "
+                   "the URL manually please check your spelling and try again."
+    }, 404)
+
+
+async def internal_error(request: Request, exc: Exception) -> Response:
+    return json_response({
+        "error": "Internal server error",
+        "message": str(exc)
+    }, 500)
+
+
+class RequestMetrics:
+    """ASGI middleware recording the request metrics app.py records
+
+    Routes are labelled with their Flask-style pattern (/api/invoices/<invoice_id>),
+    so both servers feed the same series. Durations run until the response
+    body has been sent.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not REGISTRY.enabled:
+            await self.app(scope, receive, send)
+            return
+        start = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            endpoint = re.sub(r"\{(\w+)(:\w+)?\}", r"<\1>", route.path) if route else "unmatched"
+            HTTP_SECONDS.labels(scope["method"], endpoint).observe(time.perf_counter() - start)
+            HTTP_REQUESTS.labels(scope["method"], endpoint, status[0]).inc()
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = int(os.getenv("ASYNC_THREADS", "40"))
+    db = await run_in_threadpool(get_db)
+    delivery = None
+    smtp = None
+    outbox = db.email_service.outbox
+    if outbox:
+        config = db.email_service.config
+        smtp = AsyncSMTPConnectionPool(
+            config,
+            max_size=int(os.getenv("SMTP_POOL_SIZE", "4")),
+            idle_timeout=float(os.getenv("SMTP_IDLE_TIMEOUT", "30")),
+            max_messages=int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+        )
+
+        async def deliver(messages):
+            return await smtp.send_many([email.message_from_string(m["message"]) for m in messages])
+
+        delivery = asyncio.create_task(outbox.serve(deliver))
+    try:
+        yield
+    finally:
+        if delivery:
+            delivery.cancel()
+            try:
+                await delivery
+            except asyncio.CancelledError:
+                pass
+            await smtp.close()
+
+
+# Same API as app.py; run with: uvicorn asgi:app --host 0.0.0.0 --port 8080
+app = Starlette(
+    routes=[
+        Route("/health", health_check, methods=["GET"]),
+        Route("/", root, methods=["GET"]),
+        Route("/api/invoices", create_invoice, methods=["POST"]),
+        Route("/api/invoices", list_invoices, methods=["GET"]),
+        Route("/api/invoices/batch", create_invoices_batch, methods=["POST"]),
+        Route("/api/invoices/overdue", get_overdue_invoices, methods=["GET"]),
+        Route("/api/invoices/{invoice_id}", get_invoice, methods=["GET"]),
+        Route("/api/invoices/{invoice_id}/status", update_invoice_status, methods=["PUT"]),
+        Route("/api/payments", record_payment, methods=["POST"]),
+        Route("/api/payments/import", import_payments_file, methods=["POST"]),
+        Route("/api/reports", generate_report, methods=["POST"]),
+        Route("/api/reports/types", get_report_types, methods=["GET"]),
+        Route("/api/outbox", get_outbox_stats, methods=["GET"]),
+        Route("/metrics", get_metrics, methods=["GET"])
+    ],
+    middleware=[
+        Middleware(RequestMetrics),
+        # Enable CORS for all routes, as flask_cors does for app.py
+        Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+    ],
+    exception_handlers={404: not_found_error, 500: internal_error},
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv('PORT', 8080)), access_log=False)
@@ -0,0 +1,135 @@
+from typing import Dict, List, Optional
+from email.message import Message
+import asyncio
+import time
+import aiosmtplib
+from email_service import SMTP_ERRORS, SMTP_REJECTED, SMTP_SENT
+
+
+class AsyncPooledConnection:
+    """An authenticated aiosmtplib connection checked out of an AsyncSMTPConnectionPool"""
+
+    def __init__(self, pool: "AsyncSMTPConnectionPool"):
+        self.pool = pool
+        self.server = None
+        self.sent = 0
+        self.last_used = time.time()
+
+    async def connect(self) -> None:
+        """Open the connection, negotiate TLS and log in"""
+        config = self.pool.config
+        self.server = aiosmtplib.SMTP(hostname=config['host'], port=config['port'],
+                                      timeout=self.pool.timeout, start_tls=bool(config['use_tls']))
+        await self.server.connect()
+        if config['username'] and config['password']:
+            await self.server.login(config['username'], config['password'])
+        self.sent = 0
+
+    async def send_message(self, msg: Message) -> None:
+        """Send a message, reconnecting once if the server dropped the connection"""
+        if self.sent >= self.pool.max_messages:
+            # Start a fresh session rather than exceed the per-connection limit
+            await self.close()
+            await self.connect()
+        try:
+            await self.server.send_message(msg)
+        except aiosmtplib.SMTPServerDisconnected:
+            await self.connect()
+            await self.server.send_message(msg)
+        self.sent += 1
+        self.last_used = time.time()
+
+    async def close(self) -> None:
+        try:
+            await self.server.quit()
+        except Exception:
+            self.server.close()
+
+
+class AsyncSMTPConnectionPool:
+    """Asyncio counterpart of SMTPConnectionPool, built on aiosmtplib
+
+    The async server (asgi.py) delivers outbox messages through this pool,
+    so a message waiting on a slow SMTP server holds no thread: the event
+    loop keeps serving requests and other deliveries meanwhile. Connections
+    are reused, retired after max_messages and expired after idle_timeout as
+    in SMTPConnectionPool, with at most max_size open at once.
+    Deliveries are recorded in the same SMTP latency and failure series as
+    the sync pool's.
+    """
+
+    def __init__(self, config: Dict, max_size: int = 4, idle_timeout: float = 30,
+                 max_messages: int = 100, timeout: float = 30):
+        """Initialize the pool
+
+        Args:
+            config: SMTP configuration (host, port, username, password, use_tls)
+            max_size: Maximum number of open connections
+            idle_timeout: Seconds a connection may sit unused before it is closed
+            max_messages: Messages sent over one connection before it is replaced
+            timeout: Socket timeout in seconds
+        """
+        self.config = config
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._idle: List[AsyncPooledConnection] = []
+        # Created on first use, inside the event loop that runs the pool
+        self._slots = None
+
+    async def _checkout(self) -> AsyncPooledConnection:
+        now = time.time()
+        while self._idle:
+            conn = self._idle.pop()
+            if now - conn.last_used <= self.idle_timeout:
+                return conn
+            await conn.close()
+        conn = AsyncPooledConnection(self)
+        await conn.connect()
+        return conn
+
+    async def _checkin(self, conn: AsyncPooledConnection) -> None:
+        if conn.sent >= self.max_messages:
+            await conn.close()
+            return
+        self._idle.append(conn)
+
+    async def send_many(self, messages: List[Message]) -> List[Optional[str]]:
+        """Deliver messages over one pooled connection
+
+        Returns:
+            List of error strings (None on success), in input order
+        """
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_size)
+        errors = []
+        async with self._slots:
+            conn = None
+            try:
+                conn = await self._checkout()
+                for msg in messages:
+                    start = time.perf_counter()
+                    try:
+                        await conn.send_message(msg)
+                        SMTP_SENT.observe(time.perf_counter() - start)
+                        errors.append(None)
+                    except (aiosmtplib.SMTPRecipientsRefused, aiosmtplib.SMTPResponseException) as e:
+                        # The server rejected this message; the session is still usable
+                        SMTP_REJECTED.inc()
+                        errors.append(str(e))
+            except Exception as e:
+                SMTP_ERRORS.inc(len(messages) - len(errors))
+                errors += [str(e)] * (len(messages) - len(errors))
+                if conn:
+                    await conn.close()
+                    conn = None
+            if conn:
+                await self._checkin(conn)
+        return errors
+
+    async def close(self) -> None:
+        """Close every idle connection"""
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await conn.close()
@@ -0,0 +1,4 @@
+"""Benchmarks and load harnesses for ChromaInvoice.
+
+Run from the repository root, e.g. ``python -m benchmarks.smtp_throughput``.
+"""
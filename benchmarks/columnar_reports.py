@@ -0,0 +1,127 @@
+"""Compare report generation from the columnar snapshot with the accumulators.
+
+Generates a synthetic history in memory, then times:
+
+    accumulators   run_reports over the records (the streaming implementation)
+    build          scanning the records into a columnar snapshot
+    columnar       the same reports computed from the memory-mapped snapshot
+
+Usage:
+    python -m benchmarks.columnar_reports --payments 1000000
+"""
+from typing import Dict, Iterator
+from datetime import datetime, timedelta
+import argparse
+import json
+import random
+import tempfile
+import time
+from columnar import ColumnarSnapshot
+from reports import REPORT_TYPES, run_reports
+from storage import StorageBackend
+
+CLIENTS = [f"Client {i}" for i in range(500)]
+SERVICES = ["Web Design", "SEO", "Hosting", "Maintenance", "Branding", "Content", "Ads"]
+METHODS = ["Credit Card", "Bank Transfer", "PayPal", "Check"]
+
+
+class MemoryStorage(StorageBackend):
+    """Holds records in dicts so the benchmark measures report math, not I/O"""
+
+    def __init__(self):
+        self.records = {"invoices": {}, "payments": {}}
+
+    def get(self, collection: str, record_id: str) -> Dict:
+        return self.records[collection].get(record_id)
+
+    def put(self, collection: str, record_id: str, record: Dict) -> None:
+        self.records[collection][record_id] = record
+
+    def scan(self, collection: str) -> Iterator[Dict]:
+        return iter(self.records[collection].values())
+
+
+def generate(storage: StorageBackend, payments: int, seed: int = 42) -> None:
+    """Fill storage with one invoice per two payments over two years"""
+    rng = random.Random(seed)
+    start = datetime(2023, 1, 1)
+    invoices = max(1, payments // 2)
+    for i in range(invoices):
+        created = start + timedelta(seconds=rng.randrange(730 * 86400))
+        invoice_id = f"INV-{i:08d}"
+        storage.put("invoices", invoice_id, {
+            "invoice_id": invoice_id,
+            "client_name": rng.choice(CLIENTS),
+            "services": rng.sample(SERVICES, rng.randint(1, 3)),
+            "amount": round(rng.uniform(100, 5000), 2),
+            "status": rng.choice(["pending", "paid", "paid", "overdue"]),
+            "created_at": created.isoformat(),
+            "due_date": (created + timedelta(days=30)).isoformat()
+        })
+    for i in range(payments):
+        invoice = storage.get("invoices", f"INV-{rng.randrange(invoices):08d}")
+        recorded = datetime.fromisoformat(invoice["created_at"]) + timedelta(seconds=rng.randrange(60 * 86400))
+        payment_id = f"PAY-{i:08d}"
+        storage.put("payments", payment_id, {
+            "payment_id": payment_id,
+            "invoice_id": invoice["invoice_id"],
+            "amount": round(rng.uniform(50, 5000), 2),
+            "payment_method": rng.choice(METHODS),
+            "recorded_at": recorded.isoformat()
+        })
+
+
+def run(payments: int) -> Dict[str, float]:
+    """Time both implementations and return seconds for each phase"""
+    storage = MemoryStorage()
+    generate(storage, payments)
+    start_date, end_date = datetime(2023, 1, 1), datetime(2024, 12, 31, 23, 59, 59)
+    results = {"payments": payments, "invoices": len(storage.records["invoices"])}
+
+    start = time.perf_counter()
+    run_reports(storage, REPORT_TYPES, start_date, end_date,
+                lambda invoice_id: storage.get("invoices", invoice_id))
+    results["accumulators"] = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot = ColumnarSnapshot(directory)
+        start = time.perf_counter()
+        snapshot.build(storage)
+        results["build"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for report_type in REPORT_TYPES:
+            snapshot.report(report_type, start_date, end_date)
+        results["columnar"] = time.perf_counter() - start
+
+        for report_type in REPORT_TYPES:
+            start = time.perf_counter()
+            snapshot.report(report_type, start_date, end_date)
+            results[f"columnar_{report_type}"] = time.perf_counter() - start
+        snapshot.view = None
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar report benchmark")
+    parser.add_argument("--payments", type=int, default=1000000, help="Payments to generate")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(args.payments)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{results['payments']} payments, {results['invoices']} invoices, all report types")
+    print(f"  accumulators    {results['accumulators']:>8.2f}s")
+    print(f"  snapshot build  {results['build']:>8.2f}s")
+    print(f"  columnar        {results['columnar']:>8.2f}s "
+          f"({results['accumulators'] / results['columnar']:.1f}x faster)")
+    for report_type in REPORT_TYPES:
+        print(f"    {report_type:<18} {results[f'columnar_{report_type}']:>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
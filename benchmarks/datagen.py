@@ -0,0 +1,253 @@
+"""Fill a data directory with a seeded, realistic synthetic billing history.
+
+Clients differ in size (a few large clients hold most invoices), payment
+terms, preferred payment method and punctuality. For each client:
+
+    invoices   1-4 services from a weighted catalogue, priced per service
+               with a log-normal spread, created on business days across
+               the history and due after the client's net terms
+    payments   most invoices due before the end of the history are paid,
+               some early, most within days of the due date and a long
+               tail weeks late; unpaid past-due invoices are "pending" or
+               "overdue", a few carry a partial payment, and a few are void
+
+The app has no client records; clients appear as client_name and
+client_email on their invoices. Records are written through create_storage,
+so STORAGE_BACKEND, JSON_LAYOUT and RECORD_FORMAT apply. The same seed and
+arguments always produce the same records.
+
+Usage:
+    python -m benchmarks.datagen --data-dir /tmp/billing-100k --invoices 100000 --seed 42
+"""
+from typing import Dict, Iterator, List, Tuple
+from datetime import datetime, timedelta
+import argparse
+import itertools
+import math
+import os
+import random
+import time
+from storage import StorageBackend, create_storage
+
+# Service catalogue: (name, popularity, typical low price, typical high price)
+SERVICES = [
+    ("Web Design", 0.14, 1500, 8000),
+    ("SEO Setup", 0.12, 500, 2500),
+    ("Hosting", 0.20, 20, 300),
+    ("Maintenance", 0.18, 100, 1200),
+    ("Branding", 0.07, 800, 5000),
+    ("Content Writing", 0.12, 150, 2000),
+    ("Ads Management", 0.10, 300, 3000),
+    ("Consulting", 0.07, 200, 4000)
+]
+
+# Share of invoices with 1, 2, 3 and 4 services
+SERVICE_COUNTS = [0.55, 0.28, 0.12, 0.05]
+
+PAYMENT_METHODS = [("Bank Transfer", 0.45), ("Credit Card", 0.35), ("PayPal", 0.15), ("Check", 0.05)]
+
+# Net payment terms in days, by share of clients
+PAYMENT_TERMS = [(15, 0.15), (30, 0.55), (45, 0.15), (60, 0.15)]
+
+NAME_PREFIXES = ["Apex", "Blue", "Cedar", "Delta", "Ember", "Falcon", "Granite", "Harbor", "Iron",
+                 "Juniper", "Keystone", "Lumen", "Maple", "Nova", "Orbit", "Pioneer", "Quartz",
+                 "River", "Summit", "Terra", "Union", "Vertex", "Willow", "Zenith"]
+NAME_NOUNS = ["Dental", "Logistics", "Studios", "Bakery", "Fitness", "Legal", "Realty", "Labs",
+              "Consulting", "Outfitters", "Motors", "Analytics", "Kitchens", "Wellness", "Builders"]
+NAME_SUFFIXES = ["LLC", "Inc", "Co", "Group", "Partners", "Ltd"]
+
+NOTES = ["Thank you for your business", "Net terms as agreed", "Monthly retainer",
+         "Includes rush delivery", "Quarterly billing"]
+
+
+def _weighted(rng: random.Random, choices: List[Tuple]) -> object:
+    """Pick the first element of a (value, weight, ...) tuple by weight"""
+    return rng.choices([choice[0] for choice in choices], [choice[1] for choice in choices])[0]
+
+
+def make_clients(rng: random.Random, count: int) -> List[Dict]:
+    """Clients with a size weight, terms, preferred method and punctuality"""
+    clients = []
+    names = set()
+    for i in range(count):
+        name = f"{rng.choice(NAME_PREFIXES)} {rng.choice(NAME_NOUNS)} {rng.choice(NAME_SUFFIXES)}"
+        if name in names:
+            name = f"{name} {i}"
+        names.add(name)
+        slug = "".join(c for c in name.lower() if c.isalnum())
+        clients.append({
+            "name": name,
+            "email": f"billing@{slug}.example.com",
+            # Pareto-distributed size: a few large clients hold most invoices
+            "weight": rng.paretovariate(1.2),
+            "terms": _weighted(rng, PAYMENT_TERMS),
+            "method": _weighted(rng, PAYMENT_METHODS),
+            # Share of due invoices paid at all, and share of those paid late
+            "pays": rng.uniform(0.75, 0.99),
+            "late": rng.betavariate(2, 5),
+            "mean_days_late": rng.uniform(3, 30)
+        })
+    return clients
+
+
+def record_id(prefix: str, when: datetime, index: int) -> str:
+    """An ID in the app's format (see ids.IdAllocator), unique per index"""
+    return (f"{prefix}-{when.strftime('%Y%m%d-%H%M%S')}{when.microsecond // 1000:03d}"
+            f"-{index % 10000:04d}-5{index // 10000:05x}")
+
+
+def _business_time(rng: random.Random, start: datetime, days: int) -> datetime:
+    """A random time between 8:00 and 18:00 on a weekday of the period"""
+    day = start + timedelta(days=rng.randrange(days))
+    if day.weekday() >= 5:
+        day += timedelta(days=7 - day.weekday())
+    return day.replace(hour=8, minute=0, second=0, microsecond=0) + timedelta(
+        seconds=rng.randrange(10 * 3600), microseconds=rng.randrange(1000000))
+
+
+def _amount(rng: random.Random, services: List[str]) -> float:
+    total = 0.0
+    for name, _, low, high in SERVICES:
+        if name in services:
+            # Log-normal around the geometric mean of the typical range
+            total += rng.lognormvariate(math.log(math.sqrt(low * high)), 0.35)
+    return round(total, 2)
+
+
+def generate_records(invoices: int, clients: int = None, seed: int = 42, end: datetime = None,
+                     days: int = 730) -> Iterator[Tuple[str, Dict]]:
+    """Yield ("invoices" | "payments", record) pairs of a synthetic history
+
+    Args:
+        invoices: Number of invoices
+        clients: Number of clients (default: one per 25 invoices, at least 10)
+        seed: Random seed
+        end: End of the history; records never postdate it (default 2025-07-01)
+        days: Length of the history in days
+    """
+    rng = random.Random(seed)
+    end = end or datetime(2025, 7, 1)
+    start = end - timedelta(days=days)
+    client_list = make_clients(rng, clients or max(10, invoices // 25))
+    weights = list(itertools.accumulate(client["weight"] for client in client_list))
+    service_names = [service[0] for service in SERVICES]
+    service_weights = [service[1] for service in SERVICES]
+    payments = 0
+
+    for i in range(invoices):
+        client = rng.choices(client_list, cum_weights=weights)[0]
+        count = rng.choices(range(1, len(SERVICE_COUNTS) + 1), SERVICE_COUNTS)[0]
+        services = []
+        while len(services) < count:
+            service = rng.choices(service_names, service_weights)[0]
+            if service not in services:
+                services.append(service)
+        created = _business_time(rng, start, days)
+        due = (created + timedelta(days=client["terms"])).replace(hour=0, minute=0, second=0, microsecond=0)
+        invoice = {
+            "invoice_id": record_id("INV", created, i),
+            "client_name": client["name"],
+            "client_email": client["email"],
+            "services": services,
+            "amount": _amount(rng, services),
+            "due_date": due.isoformat(),
+            "created_at": created.isoformat(),
+            "status": "pending"
+        }
+        if rng.random() < 0.2:
+            invoice["notes"] = rng.choice(NOTES)
+
+        # When, if at all, the invoice is paid
+        paid_at = None
+        if rng.random() < 0.02:
+            invoice["status"] = "void"
+        elif rng.random() < client["pays"]:
+            if rng.random() < client["late"]:
+                lateness = timedelta(days=rng.expovariate(1 / client["mean_days_late"]))
+            else:
+                lateness = -timedelta(days=min(rng.expovariate(1 / 4), client["terms"]))
+            paid_at = max(due + lateness + timedelta(hours=rng.uniform(8, 18)), created + timedelta(minutes=5))
+            if paid_at > end:
+                paid_at = None
+
+        method = client["method"] if rng.random() < 0.8 else _weighted(rng, PAYMENT_METHODS)
+        if paid_at:
+            invoice["status"] = "paid"
+            invoice["updated_at"] = paid_at.isoformat()
+            yield "invoices", invoice
+            yield "payments", {
+                "payment_id": record_id("PAY", paid_at, payments),
+                "invoice_id": invoice["invoice_id"],
+                "amount": invoice["amount"],
+                "payment_method": method,
+                "recorded_at": paid_at.isoformat()
+            }
+            payments += 1
+            continue
+
+        if invoice["status"] == "pending" and due < end:
+            if rng.random() < 0.5:
+                invoice["status"] = "overdue"
+                invoice["updated_at"] = min(due + timedelta(days=rng.uniform(1, 14)), end).isoformat()
+            if rng.random() < 0.08:
+                # A partial payment that leaves the invoice open
+                partial_at = min(due + timedelta(days=rng.uniform(0, 20)), end - timedelta(minutes=1))
+                yield "payments", {
+                    "payment_id": record_id("PAY", partial_at, payments),
+                    "invoice_id": invoice["invoice_id"],
+                    "amount": round(invoice["amount"] * rng.uniform(0.2, 0.6), 2),
+                    "payment_method": method,
+                    "recorded_at": partial_at.isoformat()
+                }
+                payments += 1
+        yield "invoices", invoice
+
+
+def generate(storage: StorageBackend, invoices: int, clients: int = None, seed: int = 42,
+             end: datetime = None, days: int = 730, batch_size: int = 1000) -> Dict[str, int]:
+    """Write a synthetic history into storage
+
+    Returns:
+        Dict with the number of invoices and payments written and invoices by status
+    """
+    counts = {"invoices": 0, "payments": 0}
+    statuses = {}
+    batches = {"invoices": [], "payments": []}
+    for collection, record in generate_records(invoices, clients, seed, end, days):
+        batch = batches[collection]
+        batch.append(record)
+        if collection == "invoices":
+            statuses[record["status"]] = statuses.get(record["status"], 0) + 1
+        if len(batch) >= batch_size:
+            counts[collection] += storage.put_many(collection, batch)
+            batch.clear()
+    for collection, batch in batches.items():
+        if batch:
+            counts[collection] += storage.put_many(collection, batch)
+    counts["statuses"] = statuses
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic billing data generator")
+    parser.add_argument("--data-dir", required=True, help="Data directory to fill")
+    parser.add_argument("--invoices", type=int, default=1000, help="Number of invoices")
+    parser.add_argument("--clients", type=int, default=None, help="Number of clients (default: invoices / 25)")
+    parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument("--end", default="2025-07-01", help="End date of the history (ISO date)")
+    parser.add_argument("--days", type=int, default=730, help="Length of the history in days")
+    parser.add_argument("--backend", default=None, help="Storage backend (default: STORAGE_BACKEND)")
+    args = parser.parse_args()
+
+    os.makedirs(args.data_dir, exist_ok=True)
+    storage = create_storage(args.backend, data_dir=args.data_dir)
+    began = time.perf_counter()
+    counts = generate(storage, args.invoices, args.clients, args.seed, datetime.fromisoformat(args.end), args.days)
+    storage.close()
+    print(f"Wrote {counts['invoices']} invoices and {counts['payments']} payments to {args.data_dir} "
+          f"in {time.perf_counter() - began:.1f}s")
+    print("Invoices by status: " + ", ".join(f"{status} {count}" for status, count in sorted(counts["statuses"].items())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Measure JSON directory scan throughput at different loader concurrencies.
+
+Writes a directory of payment files, then scans it with ParallelLoader at
+each worker count. Scans are meant to model a fresh instance whose page cache
+is cold:
+
+    --drop-caches        flush the page cache before each scan (Linux, root)
+    --read-latency-ms    add a per-file delay that releases the GIL the way
+                         a disk wait does, where caches cannot be dropped
+
+Usage:
+    python -m benchmarks.parallel_scan --files 20000 --workers 1 4 8 16 --drop-caches
+"""
+from typing import Dict, List
+import argparse
+import json
+import os
+import tempfile
+import time
+from benchmarks.columnar_reports import MemoryStorage, generate
+from loader import ParallelLoader
+
+
+def drop_caches() -> None:
+    """Write dirty pages and evict the page cache"""
+    os.sync()
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def run(files: int, workers: List[int], drop: bool, read_latency_ms: float) -> List[Dict]:
+    """Scan one generated directory once per worker count"""
+    memory = MemoryStorage()
+    generate(memory, files)
+    delay = read_latency_ms / 1000
+
+    def parse(path: str) -> Dict:
+        if delay:
+            time.sleep(delay)
+        with open(path, "r") as f:
+            return json.load(f)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for payment in memory.records["payments"].values():
+            with open(os.path.join(directory, f"{payment['payment_id']}.json"), "w") as f:
+                json.dump(payment, f, indent=2)
+
+        for count in workers:
+            loader = ParallelLoader(workers=count, log_min_files=0)
+            if drop:
+                drop_caches()
+            start = time.perf_counter()
+            with os.scandir(directory) as entries:
+                paths = [entry.path for entry in entries]
+            loaded = sum(1 for _ in loader.load_paths(paths, directory, parse))
+            elapsed = time.perf_counter() - start
+            loader.close()
+            results.append({"workers": count, "files": loaded, "seconds": elapsed,
+                            "files_per_second": loaded / elapsed})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parallel directory scan benchmark")
+    parser.add_argument("--files", type=int, default=20000, help="Record files to write")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8, 16], help="Worker counts to compare")
+    parser.add_argument("--drop-caches", action="store_true", help="Evict the page cache before each scan")
+    parser.add_argument("--read-latency-ms", type=float, default=0.0, help="Delay added to every file read")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(args.files, args.workers, args.drop_caches, args.read_latency_ms)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.files} files, drop caches: {args.drop_caches}, read latency {args.read_latency_ms}ms")
+    for result in results:
+        print(f"  {result['workers']:>3} workers  {result['seconds']:>7.2f}s  "
+              f"{result['files_per_second']:>9.0f} files/s  "
+              f"({results[0]['seconds'] / result['seconds']:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Compare joining payments to invoices per payment against the join stage.
+
+client_analysis and payment_trends need each payment's invoice. Previously
+every payment in range loaded its invoice through get_invoice; run_reports
+now builds an invoice join table during the invoice pass instead. For each
+data set size this times:
+
+    per_payment   accumulators that call get_invoice for every payment
+    join          run_reports with the invoice join table
+
+Records are written as JSON files. --read-latency-ms adds a delay to every
+single-record read to stand in for a cold page cache or network disk; scans
+are not delayed, so the difference isolates the per-payment lookups.
+
+Usage:
+    python -m benchmarks.report_join --payments 2000 10000 50000 --read-latency-ms 0.2
+"""
+from typing import Dict, List, Optional
+from datetime import datetime
+import argparse
+import json
+import tempfile
+import time
+from benchmarks.columnar_reports import generate
+from reports import ACCUMULATORS, run_reports, _stream
+from storage import COLLECTIONS, JsonFileStorage
+
+JOIN_REPORTS = ["client_analysis", "payment_trends"]
+
+
+class SlowReadStorage(JsonFileStorage):
+    """JSON file storage that counts single-record reads and can delay them"""
+
+    def __init__(self, data_dir: str, read_latency: float = 0):
+        super().__init__(data_dir)
+        self.read_latency = read_latency
+        self.reads = 0
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict]:
+        self.reads += 1
+        if self.read_latency:
+            time.sleep(self.read_latency)
+        return super().get(collection, record_id)
+
+
+def per_payment_reports(storage: JsonFileStorage, start_date: datetime, end_date: datetime) -> Dict[str, Dict]:
+    """The reports as built before the join stage: one invoice read per payment"""
+    get_invoice = lambda invoice_id: storage.get("invoices", invoice_id)
+    accumulators = [ACCUMULATORS[t](start_date, end_date, get_invoice=get_invoice) for t in JOIN_REPORTS]
+    for collection in COLLECTIONS:
+        consumers = [a for a in accumulators if collection in a.collections]
+        for record in _stream(storage, collection, consumers):
+            for accumulator in consumers:
+                accumulator.add(record)
+    return {accumulator.report_type: accumulator.finish() for accumulator in accumulators}
+
+
+def run(payments: int, read_latency_ms: float) -> Dict:
+    """Time both approaches over one generated data set"""
+    start_date, end_date = datetime(2023, 1, 1), datetime(2024, 12, 31, 23, 59, 59)
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SlowReadStorage(directory)
+        generate(storage, payments)
+        storage.read_latency = read_latency_ms / 1000
+        get_invoice = lambda invoice_id: storage.get("invoices", invoice_id)
+        results = {"payments": payments, "invoices": storage.count("invoices")}
+
+        # Warm the page cache so both runs read the same files from memory
+        run_reports(storage, JOIN_REPORTS, start_date, end_date, get_invoice)
+
+        storage.reads = 0
+        start = time.perf_counter()
+        expected = per_payment_reports(storage, start_date, end_date)
+        results["per_payment"] = time.perf_counter() - start
+        results["per_payment_reads"] = storage.reads
+
+        storage.reads = 0
+        start = time.perf_counter()
+        joined = run_reports(storage, JOIN_REPORTS, start_date, end_date, get_invoice)
+        results["join"] = time.perf_counter() - start
+        results["join_reads"] = storage.reads
+
+        results["identical"] = json.dumps(expected, sort_keys=True) == json.dumps(joined, sort_keys=True)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Invoice join benchmark")
+    parser.add_argument("--payments", type=int, nargs="+", default=[2000, 10000, 50000],
+                        help="Payment counts to generate, one data set each")
+    parser.add_argument("--read-latency-ms", type=float, default=0.0,
+                        help="Delay added to every single-record read")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results: List[Dict] = [run(payments, args.read_latency_ms) for payments in args.payments]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"client_analysis + payment_trends, read latency {args.read_latency_ms}ms")
+    print(f"{'records':>10} {'per_payment':>12} {'reads':>8} {'join':>8} {'reads':>6} {'us/record':>10} {'speedup':>8}")
+    for result in results:
+        records = result["payments"] + result["invoices"]
+        print(f"{records:>10} {result['per_payment']:>11.2f}s {result['per_payment_reads']:>8} "
+              f"{result['join']:>7.2f}s {result['join_reads']:>6} "
+              f"{result['join'] / records * 1e6:>10.1f} {result['per_payment'] / result['join']:>7.1f}x"
+              + ("" if result["identical"] else "  MISMATCH"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""Measure encode/decode throughput and size of the record formats.
+
+Compares, for an invoice-sized and a payment-sized record:
+
+    json-indent   json.dumps(indent=2), the format records were written in
+    json-stdlib   compact JSON with the standard library encoder
+    json          JsonSerializer (orjson when installed)
+    msgpack       MsgpackSerializer
+
+Usage:
+    python -m benchmarks.serializer_throughput --iterations 200000
+"""
+from typing import Callable, Dict, List, Tuple
+import argparse
+import json
+import time
+from serializers import SERIALIZERS
+
+INVOICE = {
+    "invoice_id": "INV-20250130-033416123-0001-00a3f2",
+    "client_name": "TechCorp Solutions",
+    "client_email": "billing@techcorp.example.com",
+    "services": ["Web Design", "SEO Setup", "Hosting"],
+    "amount": 2450.0,
+    "due_date": "2025-03-01T00:00:00",
+    "notes": "Quarterly retainer, net 30",
+    "created_at": "2025-01-30T03:34:16.123456",
+    "status": "pending",
+    "updated_at": "2025-02-02T10:15:42.654321"
+}
+
+PAYMENT = {
+    "invoice_id": "INV-20250130-033416123-0001-00a3f2",
+    "amount": 2450.0,
+    "payment_method": "Bank Transfer",
+    "payment_id": "PAY-20250215-101542654-0000-00a3f2",
+    "recorded_at": "2025-02-15T10:15:42.654321"
+}
+
+
+def codecs() -> Dict[str, Tuple[Callable, Callable]]:
+    """Encode and decode functions for every format available here"""
+    available = {
+        "json-indent": (lambda r: json.dumps(r, indent=2).encode(), json.loads),
+        "json-stdlib": (lambda r: json.dumps(r, separators=(",", ":")).encode(), json.loads)
+    }
+    for name, cls in SERIALIZERS.items():
+        try:
+            serializer = cls()
+        except ImportError:
+            continue
+        available[name] = (serializer.dumps, serializer.loads)
+    return available
+
+
+def measure(encode: Callable, decode: Callable, record: Dict, iterations: int) -> Dict:
+    """Records per second through encode and decode, and the encoded size"""
+    data = encode(record)
+    assert decode(data) == record
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        encode(record)
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        decode(data)
+    decode_seconds = time.perf_counter() - start
+
+    return {
+        "bytes": len(data),
+        "encode_per_second": iterations / encode_seconds,
+        "decode_per_second": iterations / decode_seconds
+    }
+
+
+def run(iterations: int) -> List[Dict]:
+    results = []
+    for record_name, record in (("invoice", INVOICE), ("payment", PAYMENT)):
+        for codec_name, (encode, decode) in codecs().items():
+            results.append(dict(record=record_name, format=codec_name, **measure(encode, decode, record, iterations)))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Record serializer benchmark")
+    parser.add_argument("--iterations", type=int, default=200000, help="Encodes and decodes per format")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(args.iterations)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'record':<8} {'format':<12} {'bytes':>6} {'encode/s':>11} {'decode/s':>11}")
+    for result in results:
+        print(f"{result['record']:<8} {result['format']:<12} {result['bytes']:>6} "
+              f"{result['encode_per_second']:>11,.0f} {result['decode_per_second']:>11,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+"""Compare the gunicorn and async servers under many slow clients.
+
+Each server is started as deployed on its own copy of a generated data set
+(benchmarks.datagen):
+
+    gunicorn   gunicorn --config gunicorn_config.py app:app (gthread workers)
+    uvicorn    uvicorn asgi:app
+
+For each number of slow clients, that many connections send a request
+one header line every --trickle-ms (a phone on a poor network) for the
+length of the run. Meanwhile --fast-clients connections fetch random
+invoices back to back over keep-alive connections. The run reports the
+fast requests per second and their latency percentiles, how many fast
+requests got no response within --timeout, and how many slow requests
+completed.
+
+Usage:
+    python -m benchmarks.server_load --invoices 2000 --slow 0 50 1000 --duration 10
+"""
+from typing import Dict, List, Optional
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.datagen import generate
+from storage import create_storage
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SERVERS = {
+    "gunicorn": [sys.executable, "-m", "gunicorn", "--config", os.path.join(ROOT, "gunicorn_config.py"), "app:app"],
+    "uvicorn": [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "0.0.0.0", "--no-access-log",
+                "--log-level", "warning"]
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+
+def start_server(name: str, work_dir: str, workers: int) -> tuple:
+    """Start a server on a data directory under work_dir
+
+    Returns:
+        Tuple of (process, port)
+    """
+    port = _free_port()
+    command = list(SERVERS[name])
+    if name == "uvicorn":
+        command += ["--port", str(port)]
+        if workers > 1:
+            command += ["--workers", str(workers)]
+    env = dict(os.environ, PORT=str(port), GUNICORN_WORKERS=str(workers),
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.getenv("PYTHONPATH")])))
+    process = subprocess.Popen(command, cwd=work_dir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+                sock.sendall(b"GET /health HTTP/1.1\r\nHost: bench\r\nConnection: close\r\n\r\n")
+                if sock.recv(12).startswith(b"HTTP/1.1 200"):
+                    return process, port
+        except OSError:
+            pass
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with status {process.returncode}")
+        time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{name} did not start on port {port}")
+
+
+async def _read_response(reader: asyncio.StreamReader) -> int:
+    """Read one response, returning its status code"""
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    length = 0
+    for line in lines[1:]:
+        name, _, value = line.partition(":")
+        if name.lower() == "content-length":
+            length = int(value)
+    await reader.readexactly(length)
+    return int(lines[0].split()[1])
+
+
+async def fast_client(port: int, invoice_ids: List[str], until: float, timeout: float,
+                      latencies: List[float], failures: List[str]) -> None:
+    """Fetch random invoices back to back until the run ends"""
+    rng = random.Random()
+    reader = writer = None
+    while time.perf_counter() < until:
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection("127.0.0.1", port), timeout)
+            writer.write(f"GET /api/invoices/{rng.choice(invoice_ids)} HTTP/1.1\r\nHost: bench\r\n\r\n".encode())
+            status = await asyncio.wait_for(_read_response(reader), timeout)
+            if status != 200:
+                failures.append(f"status {status}")
+            latencies.append(time.perf_counter() - start)
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError) as e:
+            failures.append(type(e).__name__)
+            if writer is not None:
+                writer.close()
+            reader = writer = None
+
+
+async def slow_client(port: int, until: float, trickle: float, completed: List[int]) -> None:
+    """Send one request a header line at a time until the run ends"""
+    try:
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    except OSError:
+        return
+    try:
+        writer.write(b"GET /health HTTP/1.1\r\nHost: bench\r\n")
+        line = 0
+        while time.perf_counter() + trickle < until:
+            await asyncio.sleep(trickle)
+            writer.write(f"X-Trickle-{line}: {line}\r\n".encode())
+            await writer.drain()
+            line += 1
+        writer.write(b"Connection: close\r\n\r\n")
+        if await asyncio.wait_for(_read_response(reader), trickle + 5) == 200:
+            completed.append(1)
+    except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+        pass
+    finally:
+        writer.close()
+
+
+def _percentile(ordered: List[float], p: float) -> Optional[float]:
+    if not ordered:
+        return None
+    return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+
+async def load(port: int, invoice_ids: List[str], slow: int, args) -> Dict:
+    """One run: slow clients trickling while fast clients fetch invoices"""
+    until = time.perf_counter() + args.duration
+    latencies, failures, completed = [], [], []
+    slow_tasks = [asyncio.ensure_future(slow_client(port, until, args.trickle_ms / 1000, completed))
+                  for _ in range(slow)]
+    # Let the slow clients connect before the fast ones start
+    await asyncio.sleep(min(1.0, args.duration / 10))
+    await asyncio.gather(*(fast_client(port, invoice_ids, until, args.timeout, latencies, failures)
+                           for _ in range(args.fast_clients)))
+    await asyncio.gather(*slow_tasks)
+    ordered = sorted(latencies)
+    return {
+        "slow_clients": slow,
+        "slow_completed": len(completed),
+        "fast_requests": len(latencies),
+        "fast_per_second": round(len(latencies) / args.duration, 1),
+        "fast_failures": len(failures),
+        "p50_ms": _percentile(ordered, 0.50),
+        "p99_ms": _percentile(ordered, 0.99)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="gunicorn vs async server load comparison")
+    parser.add_argument("--invoices", type=int, default=2000, help="Invoices in the generated data set")
+    parser.add_argument("--servers", nargs="+", default=list(SERVERS), choices=list(SERVERS), help="Servers to compare")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes per server")
+    parser.add_argument("--slow", type=int, nargs="+", default=[0, 50, 1000], help="Slow client counts")
+    parser.add_argument("--fast-clients", type=int, default=8, help="Concurrent fast clients")
+    parser.add_argument("--duration", type=float, default=10, help="Seconds per run")
+    parser.add_argument("--trickle-ms", type=float, default=500, help="Delay between a slow client's header lines")
+    parser.add_argument("--timeout", type=float, default=5, help="Seconds before a fast request counts as failed")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    base = tempfile.mkdtemp(prefix="server-load-")
+    try:
+        data_dir = os.path.join(base, "template", "data")
+        os.makedirs(data_dir)
+        storage = create_storage(data_dir=data_dir)
+        generate(storage, args.invoices)
+        invoice_ids = [invoice["invoice_id"] for invoice in storage.scan("invoices")]
+        storage.close()
+
+        results = []
+        for name in args.servers:
+            work_dir = os.path.join(base, name)
+            shutil.copytree(os.path.join(base, "template"), work_dir)
+            process, port = start_server(name, work_dir, args.workers)
+            try:
+                for slow in args.slow:
+                    result = asyncio.run(load(port, invoice_ids, slow, args))
+                    result["server"] = name
+                    results.append(result)
+                    if not args.json:
+                        print(f"{name:<9} slow {slow:>5} ({result['slow_completed']:>5} done)  "
+                              f"fast {result['fast_per_second']:>8.1f}/s  p50 {result['p50_ms'] or 0:>8.2f} ms  "
+                              f"p99 {result['p99_ms'] or 0:>8.2f} ms  failed {result['fast_failures']}")
+            finally:
+                process.terminate()
+                process.wait(10)
+    finally:
+        shutil.rmtree(base, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""Measure email delivery throughput against a local SMTP stand-in.
+
+Starts an in-process SMTP sink (aiosmtpd when installed, otherwise a minimal
+socketserver implementation) and compares three delivery strategies:
+
+    per_connection  a new SMTP session per message (the previous behaviour)
+    pooled          one message per call over pooled connections
+    send_many       EmailService.send_many, one session per batch
+
+Usage:
+    python -m benchmarks.smtp_throughput --messages 500 --handshake-ms 20
+
+--handshake-ms adds a delay to every new session to stand in for the TLS and
+login round trips of a real mail server.
+"""
+from typing import Dict, List
+import argparse
+import json
+import socket
+import socketserver
+import threading
+import time
+from email_service import EmailService
+from smtp_pool import SMTPConnectionPool
+
+
+class _SinkHandler(socketserver.StreamRequestHandler):
+    """Accepts and discards mail, speaking just enough SMTP for smtplib"""
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+        self.wfile.flush()
+
+    def handle(self):
+        time.sleep(self.server.handshake_delay)
+        self._reply("220 localhost SMTP sink ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors="replace").strip().upper()
+            if command.startswith("EHLO"):
+                self.wfile.write(b"250-localhost\r\n250-8BITMIME\r\n250 SIZE 10485760\r\n")
+                self.wfile.flush()
+            elif command.startswith("DATA"):
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.received += 1
+                self._reply("250 OK")
+            elif command.startswith("QUIT"):
+                self._reply("221 Bye")
+                return
+            else:
+                # HELO, MAIL, RCPT, RSET and NOOP all succeed
+                self._reply("250 OK")
+
+
+class _SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, handshake_delay: float):
+        super().__init__(("127.0.0.1", 0), _SinkHandler)
+        self.handshake_delay = handshake_delay
+        self.received = 0
+        self.lock = threading.Lock()
+
+
+def start_sink(handshake_delay: float = 0.0):
+    """Start an SMTP sink on a free local port
+
+    Returns:
+        Tuple of (port, stop callable, received-count callable)
+    """
+    try:
+        from aiosmtpd.controller import Controller
+    except ImportError:
+        Controller = None
+
+    if Controller is not None:
+        import asyncio
+
+        class Handler:
+            received = 0
+
+            async def handle_EHLO(self, server, session, envelope, hostname, responses):
+                await asyncio.sleep(handshake_delay)
+                session.host_name = hostname
+                return responses
+
+            async def handle_DATA(self, server, session, envelope):
+                Handler.received += 1
+                return "250 OK"
+
+        # aiosmtpd needs a concrete port, so borrow a free one from the OS
+        with socket.socket() as probe:
+            probe.bind(("127.0.0.1", 0))
+            port = probe.getsockname()[1]
+        controller = Controller(Handler(), hostname="127.0.0.1", port=port)
+        controller.start()
+        return port, controller.stop, lambda: Handler.received
+
+    server = _SinkServer(handshake_delay)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    def stop():
+        server.shutdown()
+        server.server_close()
+
+    return server.server_address[1], stop, lambda: server.received
+
+
+def _messages(count: int) -> List[Dict]:
+    return [
+        {
+            "to_email": f"client{i}@example.com",
+            "subject": f"Payment Reminder - Invoice INV-{i:06d}",
+            "body": "This is a friendly reminder that your invoice is overdue.\n" * 5
+        }
+        for i in range(count)
+    ]
+
+
+def run(messages: int, batch_size: int, handshake_ms: float) -> Dict[str, float]:
+    """Run every delivery strategy and return messages per second for each"""
+    port, stop, received = start_sink(handshake_ms / 1000)
+    config = {
+        "host": "127.0.0.1",
+        "port": port,
+        "username": "",
+        "password": "",
+        "use_tls": False,
+        "from_email": "billing@chromapages.com",
+        "from_name": "Chromapages Billing"
+    }
+    results = {}
+    try:
+        batch = _messages(messages)
+
+        # A pool that retires every connection after one message behaves like
+        # the original connect-per-email code path
+        service = EmailService(config)
+        service.pool = SMTPConnectionPool(config, max_messages=1)
+        start = time.perf_counter()
+        for m in batch:
+            service._send_email(m["to_email"], m["subject"], m["body"])
+        results["per_connection"] = messages / (time.perf_counter() - start)
+
+        service = EmailService(config)
+        start = time.perf_counter()
+        for m in batch:
+            service._send_email(m["to_email"], m["subject"], m["body"])
+        results["pooled"] = messages / (time.perf_counter() - start)
+        service.pool.close()
+
+        service = EmailService(config)
+        start = time.perf_counter()
+        for i in range(0, messages, batch_size):
+            service.send_many(batch[i:i + batch_size])
+        results["send_many"] = messages / (time.perf_counter() - start)
+        service.pool.close()
+
+        # Give the sink a moment to count the final messages
+        time.sleep(0.1)
+        results["delivered"] = received()
+    finally:
+        stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SMTP delivery throughput benchmark")
+    parser.add_argument("--messages", type=int, default=500, help="Messages sent per strategy")
+    parser.add_argument("--batch-size", type=int, default=100, help="Messages per send_many call")
+    parser.add_argument("--handshake-ms", type=float, default=20, help="Simulated session setup latency")
+    parser.add_argument("--json", action="store_true", help="Print machine-readable results")
+    args = parser.parse_args()
+
+    results = run(args.messages, args.batch_size, args.handshake_ms)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.messages} messages, {args.handshake_ms}ms simulated handshake")
+    for strategy in ["per_connection", "pooled", "send_many"]:
+        print(f"  {strategy:<15} {results[strategy]:>10.1f} msg/s")
+    print(f"  delivered       {results['delivered']:>10d}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,222 @@
+"""Benchmark the BillingDatabase operations behind the API at several data sizes.
+
+For each size a synthetic history (benchmarks.datagen) is generated into a
+fresh data directory, a BillingDatabase is opened on it and these are timed:
+
+    startup                  opening the database (index, rollup and snapshot loading)
+    get_invoice              random existing invoices
+    get_overdue_invoices     the overdue listing
+    generate_report:<type>   every report type over the last year, report cache off
+    create_invoice           new invoices with client emails (spooled to the outbox)
+    record_payment           full payments of pending invoices
+
+Emails go to a local SMTP sink. The storage backend, layout, format, sync
+mode and report settings come from the environment as for the server, and
+are recorded with the results. Results are written as JSON, one entry per
+(size, operation) with latency percentiles, so runs can be diffed or
+compared with --compare.
+
+Usage:
+    python -m benchmarks.suite --sizes 1000 100000 1000000 --output results.json
+    python -m benchmarks.suite --sizes 1000 --compare baseline.json
+"""
+from typing import Callable, Dict, List
+from datetime import datetime, timedelta
+import argparse
+import atexit
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.datagen import generate, generate_records
+from benchmarks.smtp_throughput import start_sink
+from reports import REPORT_TYPES
+from storage import create_storage
+
+# Settings that change what is measured, recorded with every run
+CONFIG_VARS = ["STORAGE_BACKEND", "JSON_LAYOUT", "RECORD_FORMAT", "RECORD_SYNC", "SCAN_WORKERS",
+               "REPORT_ROLLUPS", "REPORT_COLUMNAR", "REPORT_CACHE", "INVOICE_CACHE", "INDEX_SNAPSHOT",
+               "EMAIL_OUTBOX", "CHANGE_FEED", "METRICS"]
+
+# End of the generated histories, so report periods are the same on every run
+HISTORY_END = datetime(2025, 7, 1)
+
+
+def summarize(latencies: List[float]) -> Dict:
+    """Throughput and latency percentiles, in milliseconds, of one operation"""
+    ordered = sorted(latencies)
+    total = sum(ordered)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 4)
+
+    return {
+        "iterations": len(ordered),
+        "total_seconds": round(total, 6),
+        "ops_per_second": round(len(ordered) / total, 2) if total else None,
+        "first_ms": round(latencies[0] * 1000, 4),
+        "mean_ms": round(total / len(ordered) * 1000, 4),
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(ordered[-1] * 1000, 4)
+    }
+
+
+def timed(calls: List[Callable[[], object]]) -> Dict:
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def bench_size(size: int, args, smtp_config: Dict) -> List[Dict]:
+    """Generate one data set and time every operation on it"""
+    from database import BillingDatabase
+
+    data_dir = tempfile.mkdtemp(prefix=f"bench-{size}-", dir=args.work_dir)
+    storage = create_storage(data_dir=data_dir)
+    start = time.perf_counter()
+    counts = generate(storage, size, seed=args.seed, end=HISTORY_END)
+    storage.close()
+    generated = time.perf_counter() - start
+    print(f"[{size}] generated {counts['invoices']} invoices and {counts['payments']} payments in {generated:.1f}s")
+
+    results = []
+
+    def record(operation: str, stats: Dict) -> None:
+        results.append(dict(size=size, operation=operation, invoices=counts["invoices"],
+                            payments=counts["payments"], **stats))
+        print(f"[{size}] {operation:<34} p50 {stats['p50_ms']:>10.3f} ms  p99 {stats['p99_ms']:>10.3f} ms  "
+              f"{stats['ops_per_second'] or 0:>10.1f}/s")
+
+    start = time.perf_counter()
+    db = BillingDatabase(data_dir, smtp_config=smtp_config)
+    record("startup", summarize([time.perf_counter() - start]))
+    try:
+        rng = random.Random(args.seed)
+        indexed = db.invoice_index.records()
+        invoice_ids = [invoice["invoice_id"] for invoice in indexed]
+        sample = [rng.choice(invoice_ids) for _ in range(args.reads)]
+        record("get_invoice", timed([lambda i=i: db.get_invoice(i) for i in sample]))
+        record("get_overdue_invoices", timed([db.get_overdue_invoices] * args.overdue_iterations))
+
+        report_start, report_end = HISTORY_END - timedelta(days=365), HISTORY_END
+        for report_type in REPORT_TYPES:
+            record(f"generate_report:{report_type}", timed(
+                [lambda t=report_type: db.generate_report(t, report_start, report_end)] * args.report_iterations
+            ))
+
+        fields = ("client_name", "client_email", "services", "amount", "due_date", "notes")
+        new_invoices = [
+            {key: value for key, value in invoice.items() if key in fields}
+            for collection, invoice in generate_records(args.writes, seed=args.seed + 1, end=HISTORY_END)
+            if collection == "invoices"
+        ]
+        record("create_invoice", timed([lambda d=invoice: db.create_invoice(dict(d)) for invoice in new_invoices]))
+
+        pending = [invoice["invoice_id"] for invoice in indexed if invoice["status"] == "pending"]
+        payees = rng.sample(pending, min(args.writes, len(pending)))
+        amounts = {invoice_id: db.get_invoice(invoice_id)["amount"] for invoice_id in payees}
+        record("record_payment", timed([
+            lambda i=invoice_id: db.record_payment({"invoice_id": i, "amount": amounts[i], "payment_method": "Credit Card"})
+            for invoice_id in payees
+        ]))
+    finally:
+        # The data set may be deleted before exit, so no snapshot is saved then
+        atexit.unregister(db._refresh_index_snapshot)
+        if db.email_service.outbox:
+            db.email_service.outbox.stop()
+        if db.rollups:
+            db.rollups.close()
+        db.storage.close()
+        if not args.keep:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    return results
+
+
+def metadata(args) -> Dict:
+    """Where and how the results were measured"""
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "started_at": datetime.now().isoformat(),
+        "git_commit": commit,
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "seed": args.seed,
+        "config": {name: os.getenv(name) for name in CONFIG_VARS}
+    }
+
+
+def compare(base_path: str, results: List[Dict]) -> None:
+    """Print median latency changes against an earlier results file"""
+    with open(base_path, "r") as f:
+        base = {(r["size"], r["operation"]): r for r in json.load(f)["results"]}
+    print(f"\nCompared with {base_path} (ratio > 1 is slower):")
+    print(f"{'size':>8} {'operation':<34} {'base p50':>10} {'p50':>10} {'ratio':>7}")
+    for result in results:
+        old = base.get((result["size"], result["operation"]))
+        if not old:
+            continue
+        ratio = result["p50_ms"] / old["p50_ms"] if old["p50_ms"] else float("inf")
+        print(f"{result['size']:>8} {result['operation']:<34} {old['p50_ms']:>10.3f} {result['p50_ms']:>10.3f} {ratio:>7.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Storage and report benchmark suite")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 100000, 1000000], help="Invoices per data set")
+    parser.add_argument("--seed", type=int, default=42, help="Data generator seed")
+    parser.add_argument("--reads", type=int, default=2000, help="get_invoice calls per size")
+    parser.add_argument("--writes", type=int, default=200, help="create_invoice and record_payment calls per size")
+    parser.add_argument("--overdue-iterations", type=int, default=5, help="get_overdue_invoices calls per size")
+    parser.add_argument("--report-iterations", type=int, default=3, help="generate_report calls per report type")
+    parser.add_argument("--work-dir", default=None, help="Directory for the generated data sets (default: temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated data sets")
+    parser.add_argument("--output", default="benchmark_results.json", help="Results file")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare with")
+    args = parser.parse_args()
+
+    # Every report call is computed, and the snapshot thread stays out of the timings
+    os.environ.setdefault("REPORT_CACHE", "false")
+    os.environ.setdefault("INDEX_SNAPSHOT_INTERVAL", "0")
+
+    port, stop_sink, _ = start_sink()
+    smtp_config = {
+        "host": "127.0.0.1",
+        "port": port,
+        "username": "",
+        "password": "",
+        "use_tls": False,
+        "from_email": "billing@chromapages.com",
+        "from_name": "Chromapages Billing"
+    }
+    run = metadata(args)
+    results = []
+    try:
+        for size in args.sizes:
+            results.extend(bench_size(size, args, smtp_config))
+    finally:
+        stop_sink()
+
+    with open(args.output, "w") as f:
+        json.dump({"metadata": run, "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {len(results)} results to {args.output}")
+    if args.compare:
+        compare(args.compare, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -96,7 +96,7 @@ class BillingAgent(BaseAgent):
         def track_invoice(invoice_id: str) -> str:
             """
             Tracks the status of an invoice by ID.
-            Example: "INV-20240301-123456"
+            Example: "INV-20240301-123456789-0000-00a3f2"
             """
             try:
                 invoice = self.db.get_invoice(invoice_id)
@@ -121,7 +121,7 @@ class BillingAgent(BaseAgent):
             """
             Sends payment reminder for overdue invoices.
             Input should be a JSON string with: invoice_id
-            Example: {"invoice_id": "INV-20240301-123456"}
+            Example: {"invoice_id": "INV-20240301-123456789-0000-00a3f2"}
             """
             try:
                 if isinstance(invoice_data, str):
@@ -156,7 +156,7 @@ class BillingAgent(BaseAgent):
             """
             Records a payment for an invoice.
             Input should be a JSON string with: invoice_id, amount, payment_method
-            Example: {"invoice_id": "INV-20240301-123456", "amount": 2000, "payment_method": "Credit Card"}
+            Example: {"invoice_id": "INV-20240301-123456789-0000-00a3f2", "amount": 2000, "payment_method": "Credit Card"}
             """
             try:
                 if isinstance(payment_data, str):
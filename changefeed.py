@@ -0,0 +1,150 @@
+from typing import Iterable, List, Optional, Tuple
+import os
+import threading
+from locks import FileLock
+
+
+class ChangeFeed:
+    """Tells each gunicorn worker which records the other workers wrote
+
+    Every worker keeps its own invoice indexes, report cache and columnar
+    snapshot. Writers append one line per written record to a shared log
+    file; before answering from that in-memory state, a worker polls the log
+    and applies the lines written by other processes since its last poll.
+    A poll with nothing new costs one stat().
+
+    Appends hold a FileLock, and once the log reaches max_bytes the next
+    writer starts a new one. Each log begins with its sequence number, so a
+    worker that slept through more than one rotation knows it missed changes.
+    """
+
+    def __init__(self, path: str, max_bytes: int = 16 * 1024 * 1024):
+        """Open the feed, positioned at its current end
+
+        Args:
+            path: Log file shared by the workers
+            max_bytes: Size at which the log is rotated
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self._write_lock = FileLock(f"{path}.lock")
+        with self._write_lock:
+            if not os.path.exists(path):
+                self._start_log(1)
+        self._inode, self._offset, self._sequence = self._tail()
+        self._reset()
+        # A forked gunicorn worker reopens the log at the parent's position
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._file = None
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+
+    def _start_log(self, sequence: int) -> None:
+        """Replace the log with an empty one; caller holds the write lock"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(f"#{sequence}\n".encode())
+        os.replace(tmp_path, self.path)
+
+    def _tail(self) -> Tuple[int, int, int]:
+        """Inode, size and sequence number of the current log"""
+        with open(self.path, "rb") as f:
+            header = f.readline()
+            stat = os.fstat(f.fileno())
+        return stat.st_ino, stat.st_size, int(header[1:])
+
+    def publish(self, collection: str, record_ids: Iterable[str]) -> None:
+        """Announce records written by this process"""
+        pid = os.getpid()
+        data = "".join(f"{pid}\t{collection}\t{record_id}\n" for record_id in record_ids).encode()
+        if not data:
+            return
+        with self._write_lock:
+            if os.path.getsize(self.path) >= self.max_bytes:
+                self._start_log(self._tail()[2] + 1)
+            with open(self.path, "ab") as f:
+                f.write(data)
+
+    def poll(self) -> Optional[List[Tuple[str, str]]]:
+        """Changes written by other processes since the last poll
+
+        Returns:
+            List of (collection, record ID), or None when changes were lost
+            to log rotation and the caller must reload everything
+        """
+        with self._lock:
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return []
+            if stat.st_ino == self._inode and stat.st_size == self._offset:
+                return []
+
+            if self._file is None and not self._open_current():
+                return None
+            lines = []
+            # Everything appended to a rotated log was written before the
+            # stat above saw the new one, so reading to its end misses nothing
+            lines.extend(self._read())
+            if stat.st_ino != self._inode:
+                self._file.close()
+                self._file = None
+                sequence = self._sequence
+                self._open_current()
+                if self._sequence != sequence + 1:
+                    return None
+                lines.extend(self._read())
+
+        changes = []
+        pid = str(self._pid)
+        for line in lines:
+            if line.startswith(b"#"):
+                continue
+            parts = line.decode().split("\t")
+            if len(parts) == 3 and parts[0] != pid:
+                changes.append((parts[1], parts[2]))
+        return changes
+
+    def position(self) -> Tuple[int, int, int]:
+        """Where the last poll stopped reading: (log inode, log sequence, offset)
+
+        Workers that polled up to the same position have seen the same writes.
+        """
+        with self._lock:
+            return self._inode, self._sequence, self._offset
+
+    def _open_current(self) -> bool:
+        """Open the log, resuming at the last position if it is still the same file
+
+        Returns:
+            bool: False if the log was rotated, so the end of the previous
+            one could not be read
+        """
+        self._file = open(self.path, "rb")
+        stat = os.fstat(self._file.fileno())
+        sequence = int(self._file.readline()[1:])
+        # The sequence number tells a reused inode from the same log
+        if stat.st_ino == self._inode and sequence == self._sequence:
+            self._file.seek(self._offset)
+            return True
+        self._sequence = sequence
+        self._inode = stat.st_ino
+        self._offset = self._file.tell()
+        return False
+
+    def _read(self) -> List[bytes]:
+        """Complete lines from the current position; a partial last line is left for later"""
+        data = self._file.read()
+        end = data.rfind(b"\n") + 1
+        self._file.seek(self._offset + end)
+        self._offset += end
+        return data[:end].splitlines()
+
+    def close(self) -> None:
+        """Close the log"""
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
@@ -0,0 +1,478 @@
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from locks import FileLock
+from storage import StorageBackend
+
+# Timestamps are stored as microseconds since the epoch, read as naive local times
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+DAY_US = 86400 * 1000000
+
+# Report types answered from the snapshot
+COLUMNAR_REPORTS = ["revenue", "outstanding", "client_analysis", "service_metrics", "payment_trends"]
+
+# Arrays of a snapshot generation; generations missing any are rebuilt
+COLUMNS = ("invoice_id", "invoice_created", "invoice_due", "invoice_cents", "invoice_integral",
+           "invoice_status", "invoice_client", "service_offsets", "service_codes", "payment_invoice_id",
+           "payment_recorded", "payment_cents", "payment_integral", "payment_method", "payment_invoice")
+
+
+def _micros(value: datetime) -> int:
+    return (value - EPOCH) // MICROSECOND
+
+
+def _isoformat(micros: np.ndarray) -> np.ndarray:
+    """Format timestamps like datetime.isoformat(), which omits zero microseconds"""
+    values = micros.astype("datetime64[us]")
+    return np.where(micros % 1000000 == 0,
+                    np.datetime_as_string(values, unit="s"),
+                    np.datetime_as_string(values, unit="us"))
+
+
+class _Encoder:
+    """Dictionary-encodes strings to dense integer codes"""
+
+    def __init__(self):
+        self.codes: Dict[str, int] = {}
+        self.values: List[str] = []
+
+    def encode(self, value: str) -> int:
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+def _amount(cents, integral) -> float:
+    """An amount in currency units from cents
+
+    Amounts stored as ints, and sums of only such amounts, come back as ints
+    as the streaming accumulators return them; anything else is a float.
+    """
+    return int(round(cents)) // 100 if integral else float(cents) / 100
+
+
+def _sum_by(codes: np.ndarray, weights: np.ndarray, labels: List[str]) -> Dict[str, float]:
+    """Sum cents per dictionary code, returning amounts keyed by label"""
+    totals = np.bincount(codes, weights=weights, minlength=len(labels))
+    present = np.bincount(codes, minlength=len(labels)) > 0
+    return {labels[code]: float(totals[code]) / 100 for code in np.flatnonzero(present)}
+
+
+def _sum_by_period(micros: np.ndarray, cents: np.ndarray, unit: str) -> Dict[str, float]:
+    """Sum cents per calendar day ("D") or month ("M")"""
+    if not len(micros):
+        return {}
+    periods = micros.astype("datetime64[us]").astype(f"datetime64[{unit}]")
+    keys, inverse = np.unique(periods, return_inverse=True)
+    totals = np.bincount(inverse, weights=cents)
+    return {str(key): float(total) / 100 for key, total in zip(keys, totals)}
+
+
+class ColumnarSnapshot:
+    """Memory-mapped, column-oriented copy of invoices and payments for reports
+
+    Each field is one NumPy array saved under snapshot_dir: timestamps as
+    epoch microseconds, amounts as integer cents, and clients, statuses,
+    payment methods and services as dictionary codes. Invoice services are
+    stored as a flat code array with per-invoice offsets. Payments carry the
+    row of their invoice so reports join the two without lookups.
+
+    Reports are computed with vectorized masks, bincount and unique over the
+    arrays. The arrays are opened with mmap_mode="r", so the snapshot is
+    shared through the page cache rather than copied into each process.
+
+    Writes mark the snapshot stale. A stale snapshot older than
+    max_staleness seconds does not answer reports: ensure_fresh() starts a
+    rebuild on a background thread and the caller computes reports another
+    way until it is done, so a report after a write never waits for a full
+    rebuild. Builds hold a lock file in snapshot_dir, and a worker that finds
+    a generation built by another worker since its data went stale opens that
+    one instead of building.
+    """
+
+    def __init__(self, snapshot_dir: str, max_staleness: float = 0):
+        """Initialize the snapshot
+
+        Args:
+            snapshot_dir: Directory holding the snapshot generations
+            max_staleness: Seconds a stale snapshot may still answer reports
+        """
+        self.snapshot_dir = snapshot_dir
+        self.max_staleness = max_staleness
+        self.view: Optional[SnapshotView] = None
+        self.built_at = 0.0
+        self.stale = True
+        # Generations built before this process started may miss earlier writes
+        self._changed_at = time.time()
+        self._lock = threading.Lock()
+        self._refreshing = False
+        os.makedirs(snapshot_dir, exist_ok=True)
+        self._build_lock = FileLock(os.path.join(snapshot_dir, "build.lock"))
+        self._load_current()
+
+    def _current_generation(self) -> Optional[str]:
+        try:
+            with open(os.path.join(self.snapshot_dir, "current"), "r") as f:
+                return f.read().strip()
+        except OSError:
+            return None
+
+    def _load_current(self) -> None:
+        """Open the snapshot left by a previous run; it starts out stale"""
+        try:
+            generation = self._current_generation()
+            self._open(os.path.join(self.snapshot_dir, generation))
+            self.built_at = int(generation[len("gen-"):]) / 1000
+        except (OSError, TypeError, ValueError):
+            self.view = None
+
+    def mark_stale(self) -> None:
+        """Record that storage changed since the snapshot was built"""
+        self._changed_at = time.time()
+        self.stale = True
+
+    def ensure_fresh(self, storage: StorageBackend) -> bool:
+        """Whether the snapshot may answer reports now
+
+        When storage changed and the snapshot is too old to serve, a
+        generation another worker built since the change is opened if there
+        is one; otherwise a rebuild is started in the background and False
+        is returned.
+        """
+        if not self.stale or (self.view and time.time() - self.built_at <= self.max_staleness):
+            return True
+        with self._lock:
+            if self._refreshing:
+                return False
+            if self._adopt_current():
+                return True
+            self._refreshing = True
+        threading.Thread(target=self._refresh, args=(storage,), name="columnar-build", daemon=True).start()
+        return False
+
+    def _refresh(self, storage: StorageBackend) -> None:
+        """Bring the snapshot up to date; runs on the background build thread"""
+        try:
+            with self._build_lock:
+                if self.stale and not self._adopt_current():
+                    self.build(storage)
+        except Exception as e:
+            self.stale = True
+            print(f"Error building columnar snapshot: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _adopt_current(self) -> bool:
+        """Open a generation another worker started building after the last change seen here"""
+        generation = self._current_generation()
+        try:
+            built_at = int(generation[len("gen-"):]) / 1000
+        except (TypeError, ValueError):
+            return False
+        changed_at = self._changed_at
+        if built_at <= max(changed_at, self.built_at):
+            return False
+        self.stale = False
+        try:
+            self._open(os.path.join(self.snapshot_dir, generation))
+        except (OSError, ValueError):
+            self.stale = True
+            return False
+        self.built_at = built_at
+        # A write that arrived while the generation was opened keeps it stale
+        if self._changed_at != changed_at:
+            self.stale = True
+        return True
+
+    def build(self, storage: StorageBackend) -> Dict[str, int]:
+        """Scan storage into a new snapshot generation and switch to it
+
+        Returns:
+            Dict with the number of invoices and payments in the snapshot
+        """
+        # Writes during the build (a changed _changed_at) leave the snapshot stale
+        changed_at = self._changed_at
+        built_at = time.time()
+        clients, statuses, methods, services = _Encoder(), _Encoder(), _Encoder(), _Encoder()
+
+        invoice_rows = {}
+        invoice_ids, created, due, invoice_cents, invoice_integral, status_codes, client_codes = [], [], [], [], [], [], []
+        service_offsets, service_codes = [0], []
+        for invoice in storage.scan("invoices"):
+            invoice_rows[invoice["invoice_id"]] = len(invoice_ids)
+            invoice_ids.append(invoice["invoice_id"])
+            created.append(_micros(datetime.fromisoformat(invoice["created_at"])))
+            due.append(_micros(datetime.fromisoformat(invoice["due_date"])))
+            invoice_cents.append(round(invoice["amount"] * 100))
+            invoice_integral.append(isinstance(invoice["amount"], int))
+            status_codes.append(statuses.encode(invoice["status"]))
+            client_codes.append(clients.encode(invoice["client_name"]))
+            service_codes.extend(services.encode(service) for service in invoice["services"])
+            service_offsets.append(len(service_codes))
+
+        payment_invoice_ids, recorded, payment_cents, payment_integral, method_codes, invoice_refs = [], [], [], [], [], []
+        for payment in storage.scan("payments"):
+            payment_invoice_ids.append(payment["invoice_id"])
+            recorded.append(_micros(datetime.fromisoformat(payment["recorded_at"])))
+            payment_cents.append(round(payment["amount"] * 100))
+            payment_integral.append(isinstance(payment["amount"], int))
+            method_codes.append(methods.encode(payment.get("payment_method") or "unknown"))
+            invoice_refs.append(invoice_rows.get(payment["invoice_id"], -1))
+
+        columns = {
+            "invoice_id": np.array(invoice_ids, dtype=str),
+            "invoice_created": np.array(created, dtype=np.int64),
+            "invoice_due": np.array(due, dtype=np.int64),
+            "invoice_cents": np.array(invoice_cents, dtype=np.int64),
+            "invoice_integral": np.array(invoice_integral, dtype=bool),
+            "invoice_status": np.array(status_codes, dtype=np.int32),
+            "invoice_client": np.array(client_codes, dtype=np.int32),
+            "service_offsets": np.array(service_offsets, dtype=np.int64),
+            "service_codes": np.array(service_codes, dtype=np.int32),
+            "payment_invoice_id": np.array(payment_invoice_ids, dtype=str),
+            "payment_recorded": np.array(recorded, dtype=np.int64),
+            "payment_cents": np.array(payment_cents, dtype=np.int64),
+            "payment_integral": np.array(payment_integral, dtype=bool),
+            "payment_method": np.array(method_codes, dtype=np.int32),
+            "payment_invoice": np.array(invoice_refs, dtype=np.int64)
+        }
+        labels = {
+            "client": clients.values,
+            "status": statuses.values,
+            "method": methods.values,
+            "service": services.values
+        }
+
+        # Write a complete new generation, then switch the "current" pointer
+        generation = f"gen-{int(built_at * 1000)}"
+        directory = os.path.join(self.snapshot_dir, generation)
+        os.makedirs(directory, exist_ok=True)
+        for name, values in columns.items():
+            np.save(os.path.join(directory, f"{name}.npy"), values)
+        with open(os.path.join(directory, "labels.json"), "w") as f:
+            json.dump(labels, f)
+        tmp_path = os.path.join(self.snapshot_dir, f"current.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(generation)
+        os.replace(tmp_path, os.path.join(self.snapshot_dir, "current"))
+
+        self._open(directory)
+        self.built_at = built_at
+        self.stale = self._changed_at != changed_at
+        for name in os.listdir(self.snapshot_dir):
+            if name.startswith("gen-") and name != generation:
+                shutil.rmtree(os.path.join(self.snapshot_dir, name), ignore_errors=True)
+
+        return {"invoices": len(invoice_ids), "payments": len(recorded)}
+
+    def _open(self, directory: str) -> None:
+        """Memory-map the arrays of one snapshot generation"""
+        columns = {
+            filename[:-4]: np.load(os.path.join(directory, filename), mmap_mode="r")
+            for filename in os.listdir(directory) if filename.endswith(".npy")
+        }
+        missing = set(COLUMNS) - set(columns)
+        if missing:
+            raise ValueError(f"Snapshot {directory} lacks columns: {', '.join(sorted(missing))}")
+        with open(os.path.join(directory, "labels.json"), "r") as f:
+            labels = json.load(f)
+        self.view = SnapshotView(columns, labels)
+
+    def report(self, report_type: str, start_date: datetime, end_date: datetime) -> Dict:
+        """Compute one report from the current snapshot"""
+        return self.view.report(report_type, start_date, end_date)
+
+
+class SnapshotView:
+    """Report computations over one immutable snapshot generation"""
+
+    def __init__(self, columns: Dict[str, np.ndarray], labels: Dict[str, List[str]]):
+        self.columns = columns
+        self.labels = labels
+
+
+    def report(self, report_type: str, start_date: datetime, end_date: datetime) -> Dict:
+        """Compute one report from the snapshot arrays"""
+        return getattr(self, f"_{report_type}")(_micros(start_date), _micros(end_date))
+
+    def _payments_in(self, start: int, end: int) -> np.ndarray:
+        recorded = self.columns["payment_recorded"]
+        return np.flatnonzero((recorded >= start) & (recorded <= end))
+
+    def _invoices_created_in(self, start: int, end: int) -> np.ndarray:
+        created = self.columns["invoice_created"]
+        return np.flatnonzero((created >= start) & (created <= end))
+
+    def _revenue(self, start: int, end: int) -> Dict:
+        rows = self._payments_in(start, end)
+        cents = self.columns["payment_cents"][rows]
+        monthly = _sum_by_period(self.columns["payment_recorded"][rows], cents, "M")
+        total = _amount(cents.sum(), self.columns["payment_integral"][rows].all())
+        return {
+            "total_revenue": total,
+            "paid_invoices_count": len(rows),
+            "paid_invoices": self.columns["payment_invoice_id"][rows].tolist(),
+            "monthly_breakdown": monthly,
+            "payment_methods": _sum_by(self.columns["payment_method"][rows], cents, self.labels["method"]),
+            "average_monthly_revenue": total / len(monthly) if monthly else 0
+        }
+
+    def _outstanding(self, start: int, end: int) -> Dict:
+        c = self.columns
+        due = c["invoice_due"]
+        pending = self.labels["status"].index("pending") if "pending" in self.labels["status"] else -1
+        rows = np.flatnonzero((c["invoice_status"] == pending) & (due >= start) & (due <= end))
+
+        days_overdue = (_micros(datetime.now()) - due[rows]) // DAY_US
+        cents = c["invoice_cents"][rows]
+        integral = c["invoice_integral"][rows]
+        # Buckets: <= 30, 31-60, 61-90 and more than 90 days overdue
+        bucket = np.searchsorted([30, 60, 90], days_overdue, side="left")
+        totals = np.bincount(bucket, weights=cents, minlength=4)
+        # A bucket holding any float amount sums to a float
+        fractional = np.bincount(bucket, weights=~integral, minlength=4) > 0
+
+        clients = self.labels["client"]
+        return {
+            "total_outstanding": _amount(cents.sum(), integral.all()),
+            "outstanding_count": len(rows),
+            "aging_analysis": {
+                name: _amount(totals[i], not fractional[i])
+                for i, name in enumerate(("30_days", "60_days", "90_days", "90_plus_days"))
+            },
+            "outstanding_invoices": [
+                {
+                    "invoice_id": invoice_id,
+                    "client_name": clients[client],
+                    "amount": _amount(amount, is_int),
+                    "days_overdue": days
+                }
+                for invoice_id, client, amount, is_int, days in zip(
+                    c["invoice_id"][rows].tolist(), c["invoice_client"][rows].tolist(),
+                    cents.tolist(), integral.tolist(), days_overdue.tolist()
+                )
+            ]
+        }
+
+    def _service_rows(self, invoices: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Expand invoice rows to one entry per (invoice, service)"""
+        offsets = self.columns["service_offsets"]
+        counts = offsets[invoices + 1] - offsets[invoices]
+        owners = np.repeat(invoices, counts)
+        # Position of each entry in the flat service array
+        positions = np.repeat(offsets[invoices] - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        return owners, self.columns["service_codes"][positions]
+
+    @staticmethod
+    def _pairs(first: np.ndarray, second: np.ndarray) -> Dict[int, List[int]]:
+        """Group the distinct (first, second) code pairs by first"""
+        grouped = {}
+        if len(first):
+            width = int(second.max()) + 1
+            keys = np.unique(first.astype(np.int64) * width + second)
+            for a, b in zip((keys // width).tolist(), (keys % width).tolist()):
+                grouped.setdefault(a, []).append(b)
+        return grouped
+
+    def _client_analysis(self, start: int, end: int) -> Dict:
+        c = self.columns
+        clients = self.labels["client"]
+        services = self.labels["service"]
+
+        invoices = self._invoices_created_in(start, end)
+        invoice_counts = np.bincount(c["invoice_client"][invoices], minlength=len(clients))
+        owners, service_codes = self._service_rows(invoices)
+        services_used = self._pairs(c["invoice_client"][owners], service_codes)
+
+        payments = self._payments_in(start, end)
+        payments = payments[c["payment_invoice"][payments] >= 0]
+        payer = c["invoice_client"][c["payment_invoice"][payments]]
+        cents = c["payment_cents"][payments]
+        integral = c["payment_integral"][payments]
+        spent = np.bincount(payer, weights=cents, minlength=len(clients))
+        fractional = np.bincount(payer, weights=~integral, minlength=len(clients)) > 0
+
+        active = np.flatnonzero((invoice_counts > 0) | (np.bincount(payer, minlength=len(clients)) > 0))
+        metrics = {
+            clients[code]: {
+                "total_spent": _amount(spent[code], not fractional[code]),
+                "invoices_count": int(invoice_counts[code]),
+                "services_used": [services[s] for s in services_used.get(code, [])],
+                "payment_history": []
+            }
+            for code in active.tolist()
+        }
+        # Group payments by client, keeping their storage order within a client
+        order = np.argsort(payer, kind="stable")
+        grouped = payer[order]
+        starts = np.flatnonzero(np.diff(grouped, prepend=-1)).tolist()
+        dates = _isoformat(c["payment_recorded"][payments][order]).tolist()
+        amounts = [_amount(amount, is_int) for amount, is_int in zip(cents[order].tolist(), integral[order].tolist())]
+        methods = np.array(self.labels["method"] or [""], dtype=object)[c["payment_method"][payments][order]].tolist()
+        for first, last in zip(starts, starts[1:] + [len(order)]):
+            history = metrics[clients[grouped[first]]]["payment_history"]
+            history.extend(
+                {"date": date, "amount": amount, "method": method}
+                for date, amount, method in zip(dates[first:last], amounts[first:last], methods[first:last])
+            )
+
+        return {
+            "client_metrics": metrics,
+            "total_active_clients": len(metrics),
+            "average_client_spend": float(spent.sum()) / 100 / len(metrics) if metrics else 0
+        }
+
+    def _service_metrics(self, start: int, end: int) -> Dict:
+        c = self.columns
+        services = self.labels["service"]
+        clients = self.labels["client"]
+
+        invoices = self._invoices_created_in(start, end)
+        owners, service_codes = self._service_rows(invoices)
+        offsets = c["service_offsets"]
+        # Each service gets an equal share of the invoice amount
+        share = c["invoice_cents"][owners] / (offsets[owners + 1] - offsets[owners])
+        revenue = np.bincount(service_codes, weights=share, minlength=len(services))
+        usage = np.bincount(service_codes, minlength=len(services))
+        service_clients = self._pairs(service_codes, c["invoice_client"][owners])
+
+        metrics = {
+            services[code]: {
+                "total_revenue": float(revenue[code]) / 100,
+                "usage_count": int(usage[code]),
+                "clients": [clients[client] for client in service_clients[code]],
+                "average_revenue": float(revenue[code]) / 100 / int(usage[code])
+            }
+            for code in np.flatnonzero(usage).tolist()
+        }
+        return {
+            "service_metrics": metrics,
+            "top_services": sorted(metrics.items(), key=lambda x: x[1]["total_revenue"], reverse=True)[:5]
+        }
+
+    def _payment_trends(self, start: int, end: int) -> Dict:
+        c = self.columns
+        rows = self._payments_in(start, end)
+        cents = c["payment_cents"][rows]
+        recorded = c["payment_recorded"][rows]
+
+        invoices = c["payment_invoice"][rows]
+        joined = invoices >= 0
+        days_to_payment = (recorded[joined] - c["invoice_created"][invoices[joined]]) // DAY_US
+        days, counts = np.unique(days_to_payment, return_counts=True)
+
+        return {
+            "daily_volumes": _sum_by_period(recorded, cents, "D"),
+            "payment_methods": _sum_by(c["payment_method"][rows], cents, self.labels["method"]),
+            "average_payment_size": float(cents.sum()) / 100 / len(rows) if len(rows) else 0,
+            "payment_timing": dict(zip(days.tolist(), counts.tolist()))
+        }
@@ -1,19 +1,220 @@
-from typing import Dict, List, Optional
-from datetime import datetime
-import json
+from typing import Dict, Iterable, List, Optional, Tuple, Union
+from datetime import date, datetime
 import os
 import csv
-from collections import defaultdict
+import atexit
+import contextlib
+import copy
+import hashlib
+import itertools
+import threading
+import time
+import uuid
 from email_service import EmailService
+from storage import StorageBackend, TimedStorage, create_storage
+from metrics import REGISTRY
+from locks import FileLock, RecordLocks
+from changefeed import ChangeFeed
+from indexes import DueDateIndex, InvoiceIndex
+from index_snapshot import IndexSnapshot
+from ids import allocator
+from reports import ACCUMULATORS, REPORT_TYPES, run_reports, stream_report
+from rollups import RollupStore
+from report_cache import ReportCache
+from record_cache import CachedRecord, RecordCache, record_etag, record_last_modified
+from timestamps import normalize_timestamp, parse_timestamp
+try:
+    from columnar import COLUMNAR_REPORTS, ColumnarSnapshot
+except ImportError:
+    # NumPy is optional; reports fall back to streaming accumulators
+    ColumnarSnapshot = None
+
+# Fields every new invoice must provide
+INVOICE_REQUIRED_FIELDS = ["client_name", "services", "amount"]
+
+# Fields every new payment must provide
+PAYMENT_REQUIRED_FIELDS = ["invoice_id", "amount", "payment_method"]
+
+REPORT_SECONDS = REGISTRY.histogram(
+    "billing_report_generation_seconds",
+    "Time spent computing report data, by report type (joined when built in one pass) and source",
+    ["report_type", "source"])
+COLUMNAR_REFRESH_SECONDS = REGISTRY.histogram(
+    "billing_columnar_refresh_seconds", "Time spent bringing the columnar snapshot up to date before a report")
+REPORT_CACHE_REQUESTS = REGISTRY.counter(
+    "billing_report_cache_requests_total", "Reports served from the report cache or computed", ["result"])
+
+# The latest invoice index load in this process, as returned by _load_indexes
+_index_load = {}
+
+def _index_load_seconds():
+    return [((_index_load["source"],), _index_load["seconds"])] if _index_load else []
+
+REGISTRY.gauge("billing_index_load_seconds", "Time the latest invoice index load took in this worker, by source",
+               ["source"], collect=_index_load_seconds)
 
 class BillingDatabase:
     """Simple database interface for billing operations"""
     
-    def __init__(self, data_dir: str = "data", smtp_config: Dict = None):
+    def __init__(self, data_dir: str = "data", smtp_config: Dict = None, storage: StorageBackend = None, use_rollups: bool = None,
+                 deliver_email: bool = True):
         self.data_dir = data_dir
         self._ensure_data_directory()
-        self.email_service = EmailService(smtp_config)
+        self.storage = storage or create_storage(data_dir=data_dir)
+        if REGISTRY.enabled:
+            self.storage = TimedStorage(self.storage, type(self.storage).__name__)
+        
+        # Several gunicorn workers may share data_dir: read-modify-write of a
+        # record holds its lock, and each worker learns of the others' writes
+        # through the change feed
+        self.locks = RecordLocks(os.path.join(data_dir, "locks"))
+        self.changes = None
+        if os.getenv("CHANGE_FEED", "true").lower() == "true":
+            self.changes = ChangeFeed(os.path.join(data_dir, "changes.log"))
+        # Emails are spooled to data/outbox and sent in the background unless disabled
+        outbox_dir = None
+        if os.getenv("EMAIL_OUTBOX", "true").lower() == "true":
+            outbox_dir = os.path.join(data_dir, "outbox")
+        self.email_service = EmailService(smtp_config, outbox_dir=outbox_dir, deliver=deliver_email)
+        
+        # Revenue and payment trend totals, updated by record_payment
+        if use_rollups is None:
+            use_rollups = os.getenv("REPORT_ROLLUPS", "true").lower() == "true"
+        self.rollups = RollupStore(os.path.join(data_dir, "rollups.db")) if use_rollups else None
+        if self.rollups:
+            # Workers starting together rebuild the rollups only once
+            with FileLock(os.path.join(data_dir, "locks", "rollups.lock")):
+                self.rollups.sync(self.storage)
+        
+        # Data generation, advanced by every write; cached reports from an
+        # older generation are no longer served
+        self._instance = uuid.uuid4().hex
+        self._generations = itertools.count(1)
+        self.generation = 0
+        # Change feed position this worker has applied, shared by every worker
+        # and restart at that position; report entity tags are derived from it
+        self._sync_lock = threading.Lock()
+        self.data_version = self.changes.position() if self.changes else None
+        self.report_cache = None
+        if os.getenv("REPORT_CACHE", "true").lower() == "true":
+            self.report_cache = ReportCache(
+                max_entries=int(os.getenv("REPORT_CACHE_ENTRIES", "64")),
+                max_bytes=int(os.getenv("REPORT_CACHE_MB", "64")) * 1024 * 1024
+            )
+        
+        # Parsed invoices, validated against the storage version on every read
+        self.invoice_cache = None
+        if self.storage.versioned and os.getenv("INVOICE_CACHE", "true").lower() == "true":
+            self.invoice_cache = RecordCache(
+                self.storage, "invoices",
+                max_entries=int(os.getenv("INVOICE_CACHE_ENTRIES", "10000"))
+            )
+        
+        # Column snapshot for vectorized reports, rebuilt in the background after writes
+        self.columnar = None
+        if ColumnarSnapshot and os.getenv("REPORT_COLUMNAR", "true").lower() == "true":
+            self.columnar = ColumnarSnapshot(
+                os.path.join(data_dir, "columnar"),
+                max_staleness=float(os.getenv("COLUMNAR_MAX_STALENESS", "0"))
+            )
         
+        # Invoice listing filters and pending invoices ordered by due date,
+        # loaded from the index snapshot or one scan and kept current by the
+        # write methods
+        self.invoice_index = InvoiceIndex()
+        self.due_index = DueDateIndex()
+        self.index_snapshot = None
+        if os.getenv("INDEX_SNAPSHOT", "true").lower() == "true":
+            self.index_snapshot = IndexSnapshot(os.path.join(data_dir, "index_snapshot.json"))
+        self.startup = self._load_indexes()
+        
+        # The snapshot is refreshed periodically while invoices change and on exit
+        if self.index_snapshot:
+            self._snapshot_generation = self.generation if self.startup["source"] == "snapshot" and not self.startup["replayed"] else None
+            interval = float(os.getenv("INDEX_SNAPSHOT_INTERVAL", "300"))
+            if interval > 0:
+                threading.Thread(target=self._snapshot_loop, args=(interval,), name="index-snapshot", daemon=True).start()
+            atexit.register(self._refresh_index_snapshot)
+        
+    def _load_indexes(self) -> Dict:
+        """Build the invoice indexes and publish how long it took as billing_index_load_seconds
+        
+        Returns:
+            Dict with the index "source" ("snapshot" or "scan"), startup
+            "seconds", the number of "invoices" and how many were "replayed"
+        """
+        result = self._build_indexes()
+        _index_load.clear()
+        _index_load.update(result)
+        return result
+    
+    def _build_indexes(self) -> Dict:
+        """Build the invoice indexes, from the snapshot when it is usable
+        
+        Invoices written since the snapshot was taken are replayed on top of
+        it, as found by the storage backend's changed_since. If the result
+        does not account for every stored invoice (for example after
+        invoices were removed), the snapshot is discarded and every invoice
+        is scanned.
+        """
+        start = time.perf_counter()
+        snapshot = self.index_snapshot.load() if self.index_snapshot else None
+        if snapshot:
+            invoices = {invoice["invoice_id"]: invoice for invoice in snapshot["invoices"]}
+            replayed = 0
+            for invoice in self.storage.changed_since("invoices", snapshot["taken_at"] - IndexSnapshot.CLOCK_MARGIN):
+                invoices[invoice["invoice_id"]] = invoice
+                replayed += 1
+            if len(invoices) == self.storage.count("invoices"):
+                self.invoice_index.build(invoices.values())
+                self.due_index.build(invoices.values())
+                return {"source": "snapshot", "seconds": time.perf_counter() - start,
+                        "invoices": len(invoices), "replayed": replayed}
+            print(f"Index snapshot is out of date ({len(invoices)} invoices, "
+                  f"{self.storage.count('invoices')} stored); scanning invoices")
+        
+        pending = []
+        
+        def scan_invoices():
+            for invoice in self.storage.scan("invoices"):
+                if invoice["status"] == "pending":
+                    pending.append({key: invoice[key] for key in ("invoice_id", "status", "due_date")})
+                yield invoice
+        
+        self.invoice_index.build(scan_invoices())
+        self.due_index.build(pending)
+        return {"source": "scan", "seconds": time.perf_counter() - start,
+                "invoices": len(self.invoice_index), "replayed": 0}
+    
+    def save_index_snapshot(self, only_if_changed: bool = False) -> None:
+        """Write the invoice indexes to the index snapshot
+        
+        Args:
+            only_if_changed: Skip the write when no invoice or payment was
+                written since the last snapshot
+        """
+        generation = self.generation
+        if only_if_changed and generation == self._snapshot_generation:
+            return
+        # Taken before the indexes are read, so writes racing with the
+        # snapshot are replayed when it is loaded
+        taken_at = time.time()
+        self.index_snapshot.save(self.invoice_index.records(), taken_at)
+        self._snapshot_generation = generation
+    
+    def _snapshot_loop(self, interval: float) -> None:
+        """Refresh the index snapshot every interval seconds while data changes"""
+        while True:
+            time.sleep(interval)
+            self._refresh_index_snapshot()
+    
+    def _refresh_index_snapshot(self) -> None:
+        """Save the index snapshot if data changed, reporting rather than raising errors"""
+        try:
+            self.save_index_snapshot(only_if_changed=True)
+        except Exception as e:
+            print(f"Error saving index snapshot: {str(e)}")
+    
     def _ensure_data_directory(self):
         """Create data directory if it doesn't exist"""
         if not os.path.exists(self.data_dir):
@@ -29,47 +230,195 @@ class BillingDatabase:
                 if not os.path.exists(path):
                     os.makedirs(path)
     
+    def validate_invoice(self, invoice_data: Dict) -> List[str]:
+        """Check invoice data before it is created
+        
+        A due_date with a UTC offset is rewritten as naive local time.
+        
+        Returns:
+            List[str]: Validation errors, empty when the invoice is valid
+        """
+        if not isinstance(invoice_data, dict):
+            return ["Invoice must be a JSON object"]
+        
+        errors = []
+        missing_fields = [field for field in INVOICE_REQUIRED_FIELDS if field not in invoice_data]
+        if missing_fields:
+            errors.append(f"Missing required fields: {', '.join(missing_fields)}")
+        
+        services = invoice_data.get("services")
+        if "services" in invoice_data and not (isinstance(services, list) and services):
+            errors.append("services must be a non-empty list")
+        
+        amount = invoice_data.get("amount")
+        if "amount" in invoice_data and (isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount < 0):
+            errors.append("amount must be a non-negative number")
+        
+        if "due_date" in invoice_data:
+            try:
+                # Due dates with a UTC offset are stored as naive local time
+                invoice_data["due_date"] = normalize_timestamp(invoice_data["due_date"])
+            except (TypeError, ValueError):
+                errors.append("due_date must be an ISO date")
+        
+        return errors
+    
     def create_invoice(self, invoice_data: Dict) -> str:
         """Create a new invoice and return its ID"""
-        invoice_id = f"INV-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        invoice_id = allocator.next_id("INV")
+        self._prepare_invoice(invoice_data, invoice_id)
+        self._commit_invoices([invoice_data])
+        return invoice_id
+    
+    def create_invoices(self, invoices: List[Dict]) -> List[Dict]:
+        """Validate and create a batch of invoices
+        
+        Valid invoices are written in one bulk storage operation and their
+        notification emails are queued as one batch. Invalid invoices are
+        reported without affecting the rest of the batch.
+        
+        Args:
+            invoices: Invoice data dictionaries
+            
+        Returns:
+            List[Dict]: One result per input, in order, with "index", "status"
+            ("created" or "error") and either "invoice_id" or "errors"
+        """
+        results = []
+        valid = []
+        
+        for index, invoice_data in enumerate(invoices):
+            errors = self.validate_invoice(invoice_data)
+            if errors:
+                results.append({"index": index, "status": "error", "errors": errors})
+                continue
+            
+            invoice_id = allocator.next_id("INV")
+            valid.append(self._prepare_invoice(invoice_data, invoice_id))
+            results.append({"index": index, "status": "created", "invoice_id": invoice_id})
+        
+        if valid:
+            try:
+                self._commit_invoices(valid)
+            except Exception as e:
+                for result in results:
+                    if result["status"] == "created":
+                        result["status"] = "error"
+                        result["errors"] = [str(e)]
+                        del result["invoice_id"]
+        
+        return results
+    
+    def _prepare_invoice(self, invoice_data: Dict, invoice_id: str) -> Dict:
+        """Stamp a new invoice with its ID, creation time and initial status
+        
+        Raises:
+            ValueError: If due_date is not an ISO date
+        """
+        if "due_date" in invoice_data:
+            invoice_data["due_date"] = normalize_timestamp(invoice_data["due_date"])
         invoice_data["invoice_id"] = invoice_id
         invoice_data["created_at"] = datetime.now().isoformat()
         invoice_data["status"] = "pending"
-        
-        with open(os.path.join(self.data_dir, "invoices", f"{invoice_id}.json"), "w") as f:
-            json.dump(invoice_data, f, indent=2)
+        return invoice_data
+    
+    def _commit_invoices(self, invoices: List[Dict]) -> None:
+        """Write prepared invoices, index them and queue their notification emails"""
+        self.storage.insert_many("invoices", invoices)
+        self._records_changed("invoices", [invoice["invoice_id"] for invoice in invoices])
+        for invoice in invoices:
+            self._index_invoice(invoice)
         
         # Send invoice email if client email is provided
-        if "client_email" in invoice_data:
-            self.email_service.send_invoice(
-                invoice_data,
-                invoice_data["client_email"],
-                invoice_data["client_name"]
-            )
+        with_email = [invoice for invoice in invoices if "client_email" in invoice]
+        if with_email:
+            self.email_service.send_invoices(with_email)
+    
+    def _records_changed(self, collection: str, record_ids: List[str]) -> None:
+        """Note that invoices or payments were written, and tell the other workers"""
+        # The generation moves first, so no report cached before the write
+        # is served under a data_version that includes it
+        self._data_changed()
+        if self.changes:
+            self.changes.publish(collection, record_ids)
+    
+    def _data_changed(self) -> None:
+        """Invalidate state derived from invoices and payments"""
+        self.generation = next(self._generations)
+        if self.columnar:
+            self.columnar.mark_stale()
+    
+    def sync_changes(self) -> None:
+        """Apply invoices and payments written by other workers to the in-memory state
         
-        return invoice_id
+        Called before answering from the indexes or the report cache.
+        """
+        if not self.changes:
+            return
+        with self._sync_lock:
+            changes = self.changes.poll()
+            if changes is None:
+                print("Missed changes from other workers; reloading invoice indexes")
+                self.startup = self._load_indexes()
+                if self.invoice_cache:
+                    self.invoice_cache.clear()
+                self._data_changed()
+            elif changes:
+                for invoice_id in {record_id for collection, record_id in changes if collection == "invoices"}:
+                    invoice = self.storage.get("invoices", invoice_id)
+                    if invoice:
+                        self._index_invoice(invoice)
+                self._data_changed()
+            # Only once the changes are applied, so a report is never tagged
+            # with a version newer than its data
+            self.data_version = self.changes.position()
+    
+    def _index_invoice(self, invoice: Dict) -> None:
+        """Bring the in-memory invoice indexes and cache up to date after a write"""
+        self.due_index.update(invoice)
+        self.invoice_index.update(invoice)
+        if self.invoice_cache:
+            self.invoice_cache.invalidate(invoice["invoice_id"])
     
     def get_invoice(self, invoice_id: str) -> Optional[Dict]:
         """Retrieve invoice by ID"""
-        try:
-            with open(os.path.join(self.data_dir, "invoices", f"{invoice_id}.json"), "r") as f:
-                return json.load(f)
-        except FileNotFoundError:
+        if self.invoice_cache:
+            entry = self.invoice_cache.get(invoice_id)
+            # Callers may modify the invoice, so they get their own copy
+            return copy.deepcopy(entry.record) if entry else None
+        return self.storage.get("invoices", invoice_id)
+    
+    def get_invoice_entry(self, invoice_id: str) -> Optional[CachedRecord]:
+        """Retrieve an invoice with its entity tag and last modification time
+        
+        The returned invoice may be shared with the cache and must not be modified.
+        
+        Returns:
+            CachedRecord with the invoice as "record", "etag" and "last_modified",
+            or None if the invoice does not exist
+        """
+        if self.invoice_cache:
+            return self.invoice_cache.get(invoice_id)
+        invoice = self.storage.get("invoices", invoice_id)
+        if invoice is None:
             return None
+        return CachedRecord(invoice, None, record_etag(invoice), record_last_modified(invoice))
     
     def update_invoice_status(self, invoice_id: str, status: str) -> bool:
         """Update invoice status"""
-        invoice = self.get_invoice(invoice_id)
+        with self.locks.lock("invoices", invoice_id):
+            invoice = self.get_invoice(invoice_id)
+            if invoice:
+                invoice["status"] = status
+                invoice["updated_at"] = datetime.now().isoformat()
+                
+                self.storage.put("invoices", invoice_id, invoice)
+                self._records_changed("invoices", [invoice_id])
+                self._index_invoice(invoice)
         if invoice:
-            invoice["status"] = status
-            invoice["updated_at"] = datetime.now().isoformat()
-            
-            with open(os.path.join(self.data_dir, "invoices", f"{invoice_id}.json"), "w") as f:
-                json.dump(invoice, f, indent=2)
-            
             # Send payment reminder if status is overdue and client email exists
             if status == "overdue" and "client_email" in invoice:
-                due_date = datetime.fromisoformat(invoice["due_date"])
+                due_date = parse_timestamp(invoice["due_date"])
                 days_overdue = (datetime.now() - due_date).days
                 self.email_service.send_payment_reminder(
                     invoice,
@@ -81,33 +430,61 @@ class BillingDatabase:
             return True
         return False
     
+    def list_invoices(self, status: str = None, client_name: str = None, service: str = None,
+                      due_start: datetime = None, due_end: datetime = None,
+                      created_start: datetime = None, created_end: datetime = None,
+                      cursor: str = None, limit: int = 50) -> Dict:
+        """List invoices matching the given filters, one page at a time
+        
+        Args:
+            status: Exact invoice status
+            client_name: Exact client name
+            service: Service that must appear on the invoice
+            due_start: Earliest due date (inclusive)
+            due_end: Latest due date (inclusive)
+            created_start: Earliest creation date (inclusive)
+            created_end: Latest creation date (inclusive)
+            cursor: next_cursor from the previous page
+            limit: Page size
+            
+        Returns:
+            Dict with the page of "invoices" (oldest first) and "next_cursor",
+            which is None on the last page
+        """
+        self.sync_changes()
+        invoice_ids, next_cursor = self.invoice_index.query(
+            status=status, client_name=client_name, service=service,
+            due_start=due_start, due_end=due_end,
+            created_start=created_start, created_end=created_end,
+            after=cursor, limit=limit
+        )
+        invoices = [invoice for invoice in map(self.get_invoice, invoice_ids) if invoice]
+        return {"invoices": invoices, "next_cursor": next_cursor}
+    
     def get_overdue_invoices(self) -> List[Dict]:
         """Get all overdue invoices"""
+        self.sync_changes()
         overdue = []
-        invoices_dir = os.path.join(self.data_dir, "invoices")
-        
-        for filename in os.listdir(invoices_dir):
-            if filename.endswith(".json"):
-                with open(os.path.join(invoices_dir, filename), "r") as f:
-                    invoice = json.load(f)
-                    due_date = datetime.fromisoformat(invoice["due_date"])
-                    if due_date < datetime.now() and invoice["status"] == "pending":
-                        overdue.append(invoice)
+        for invoice_id in self.due_index.due_before(datetime.now()):
+            invoice = self.get_invoice(invoice_id)
+            if invoice and invoice["status"] == "pending":
+                overdue.append(invoice)
         
         return overdue
     
     def record_payment(self, payment_data: Dict) -> str:
         """Record a payment"""
-        payment_id = f"PAY-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        payment_id = allocator.next_id("PAY")
         payment_data["payment_id"] = payment_id
         payment_data["recorded_at"] = datetime.now().isoformat()
         
-        with open(os.path.join(self.data_dir, "payments", f"{payment_id}.json"), "w") as f:
-            json.dump(payment_data, f, indent=2)
-        
-        # Update invoice status if payment is complete
         invoice_id = payment_data["invoice_id"]
         invoice = self.get_invoice(invoice_id)
+        with self._folding_payments([(payment_data, invoice)]):
+            self.storage.insert("payments", payment_id, payment_data)
+        self._records_changed("payments", [payment_id])
+        
+        # Update invoice status if payment is complete
         if invoice:
             if payment_data["amount"] >= invoice["amount"]:
                 self.update_invoice_status(invoice_id, "paid")
@@ -123,19 +500,205 @@ class BillingDatabase:
         
         return payment_id
     
-    def generate_report(self, report_type: str, start_date: datetime, end_date: datetime, export_format: str = "json", email_to: Dict = None) -> Dict:
+    def _folding_payments(self, payments: Iterable[Tuple[Dict, Optional[Dict]]]):
+        """Context for storing payments, folding them into the rollups alongside
+        
+        The rollup rows are written first and committed only if the block
+        (the storage write) succeeds. See RollupStore.adding.
+        """
+        if self.rollups:
+            return self.rollups.adding(payments)
+        return contextlib.nullcontext()
+    
+    def validate_payment(self, payment_data: Dict) -> List[str]:
+        """Check payment data before it is recorded
+        
+        A recorded_at with a UTC offset is rewritten as naive local time.
+        
+        Returns:
+            List[str]: Validation errors, empty when the payment is valid
+        """
+        if not isinstance(payment_data, dict):
+            return ["Payment must be a JSON object"]
+        
+        errors = []
+        missing_fields = [field for field in PAYMENT_REQUIRED_FIELDS if field not in payment_data]
+        if missing_fields:
+            errors.append(f"Missing required fields: {', '.join(missing_fields)}")
+        
+        amount = payment_data.get("amount")
+        if "amount" in payment_data and (isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount <= 0):
+            errors.append("amount must be a positive number")
+        
+        if "recorded_at" in payment_data:
+            try:
+                # Timestamps with a UTC offset are stored as naive local time
+                payment_data["recorded_at"] = normalize_timestamp(payment_data["recorded_at"])
+            except (TypeError, ValueError):
+                errors.append("recorded_at must be an ISO date")
+        
+        return errors
+    
+    def invoice_summaries(self) -> Dict[str, tuple]:
+        """Map every invoice ID to its (amount, status, created_at)
+        
+        Bulk payment imports match rows against this map instead of reading
+        the invoice for every row.
+        """
+        return {
+            invoice["invoice_id"]: (invoice["amount"], invoice["status"], invoice["created_at"])
+            for invoice in self.storage.scan("invoices")
+        }
+    
+    def record_payments(self, payments: List[Dict], invoices: Dict[str, tuple]) -> int:
+        """Record a batch of validated payments for known invoices
+        
+        Payments are written in one bulk storage operation. Each invoice that a
+        payment covers is marked paid once, however many payments in the batch
+        cover it, and the confirmation emails are queued as one batch.
+        
+        Args:
+            payments: Validated payment dicts whose invoice_id is in invoices
+            invoices: Map from invoice_summaries(), updated in place as invoices are paid
+            
+        Returns:
+            int: Number of invoices marked paid
+        """
+        now = datetime.now()
+        for payment, payment_id in zip(payments, allocator.next_ids("PAY", len(payments))):
+            payment["payment_id"] = payment_id
+            payment.setdefault("recorded_at", now.isoformat())
+        
+        # Folded into the rollups in the same step, so a payment the rollups
+        # reject is never stored (and a failed write never counted)
+        with self._folding_payments(
+            (payment, {"created_at": invoices[payment["invoice_id"]][2]}) for payment in payments
+        ):
+            self.storage.insert_many("payments", payments)
+        self._records_changed("payments", [payment["payment_id"] for payment in payments])
+        
+        # Coalesce status updates so each invoice is rewritten at most once
+        covering = {}
+        for payment in payments:
+            if payment["amount"] >= invoices[payment["invoice_id"]][0]:
+                covering.setdefault(payment["invoice_id"], []).append(payment)
+        
+        updated = []
+        confirmations = []
+        with self.locks.lock_many("invoices", covering):
+            for invoice_id, invoice_payments in covering.items():
+                invoice = self.get_invoice(invoice_id)
+                if not invoice:
+                    continue
+                if invoice["status"] != "paid":
+                    invoice["status"] = "paid"
+                    invoice["updated_at"] = now.isoformat()
+                    updated.append(invoice)
+                invoices[invoice_id] = (invoice["amount"], "paid", invoice["created_at"])
+                
+                # Send payment confirmation if client email exists
+                if "client_email" in invoice:
+                    confirmations.extend((payment, invoice) for payment in invoice_payments)
+            
+            if updated:
+                self.storage.put_many("invoices", updated)
+                self._records_changed("invoices", [invoice["invoice_id"] for invoice in updated])
+                for invoice in updated:
+                    self._index_invoice(invoice)
+        if confirmations:
+            self.email_service.send_payment_confirmations(confirmations)
+        
+        return len(updated)
+    
+    def generate_report(self, report_type: Union[str, List[str]], start_date: datetime, end_date: datetime, export_format: str = "json", email_to: Dict = None) -> Dict:
         """Generate financial report
         
         Args:
-            report_type: Type of report ("revenue", "outstanding", "client_analysis", "service_metrics", "payment_trends")
+            report_type: Type of report ("revenue", "outstanding", "client_analysis", "service_metrics", "payment_trends"),
+                a list of report types, or "all" to build several reports from a single pass over the data
             start_date: Start date for the report period
             end_date: End date for the report period
             export_format: Output format ("json" or "csv")
             email_to: Optional dict with keys 'email' and 'name' to send report via email
             
         Returns:
-            Dict containing the report data
+            Dict containing the report data. When several report types are requested,
+            each report is returned under "reports" keyed by its type. "cache" holds
+            whether the report came from the report cache, the data generation it
+            reflects and its entity tag.
         """
+        self.sync_changes()
+        key = self._report_key(report_type, start_date, end_date, export_format)
+        # Version before generation: a write between the two reads leaves the
+        # tag older than the data, which only costs a client a full response
+        version = self._report_version()
+        generation = self.generation
+        report = self.report_cache.get(key, generation) if self.report_cache else None
+        cache_hit = report is not None
+        if self.report_cache:
+            REPORT_CACHE_REQUESTS.labels("hit" if cache_hit else "miss").inc()
+        if not cache_hit:
+            if key[0]:
+                report = self._assemble_reports(list(key[1]), start_date, end_date)
+            else:
+                report = self._assemble_report(report_type, start_date, end_date)
+            if self.report_cache:
+                self.report_cache.put(key, generation, report)
+        
+        for delivered in (report["reports"].values() if key[0] else [report]):
+            self._deliver_report(delivered, export_format, email_to)
+        
+        # Cached reports are shared, so the metadata goes on a shallow copy
+        return dict(report, cache={
+            "hit": cache_hit,
+            "generation": generation,
+            "etag": self._report_etag(key, version)
+        })
+    
+    def _report_key(self, report_type: Union[str, List[str]], start_date: datetime, end_date: datetime, export_format: str) -> tuple:
+        """Cache key: (several reports?, report types, period, format, day)
+        
+        Day is today's date for reports computed relative to the current
+        time (such as days overdue), so they are rebuilt and given a new
+        entity tag at least once a day, and None for the others.
+        """
+        if report_type == "all" or isinstance(report_type, (list, tuple)):
+            report_types = REPORT_TYPES if report_type == "all" else list(dict.fromkeys(report_type))
+            unknown = [t for t in report_types if t not in ACCUMULATORS]
+            if unknown:
+                raise ValueError(f"Unknown report types: {', '.join(unknown)}")
+            several = True
+        else:
+            report_types = [report_type]
+            several = False
+        depends_on_now = any(t in ACCUMULATORS and ACCUMULATORS[t].depends_on_now for t in report_types)
+        day = date.today().isoformat() if depends_on_now else None
+        return (several, tuple(report_types), start_date.isoformat(), end_date.isoformat(), export_format, day)
+    
+    def _report_version(self) -> tuple:
+        """The data a report is built from, as the same value in every worker
+
+        Without the change feed, the generation of this process stands in.
+        """
+        if self.data_version is not None:
+            return self.data_version
+        return (self._instance, self.generation)
+    
+    def _report_etag(self, key: tuple, version: tuple) -> str:
+        """Entity tag for a report built from the given data version"""
+        digest = hashlib.sha1(repr((version, key)).encode()).hexdigest()
+        return f'"{digest}"'
+    
+    def report_etag(self, report_type: Union[str, List[str]], start_date: datetime, end_date: datetime, export_format: str = "json") -> str:
+        """Return the entity tag generate_report would give this report right now
+        
+        Lets a client's cached copy be validated without building the report.
+        """
+        self.sync_changes()
+        return self._report_etag(self._report_key(report_type, start_date, end_date, export_format), self._report_version())
+    
+    def _assemble_report(self, report_type: str, start_date: datetime, end_date: datetime) -> Dict:
+        """Build a single report"""
         report = {
             "type": report_type,
             "period": {
@@ -146,17 +709,85 @@ class BillingDatabase:
             "data": {}
         }
         
-        if report_type == "revenue":
-            report["data"] = self._generate_revenue_report(start_date, end_date)
-        elif report_type == "outstanding":
-            report["data"] = self._generate_outstanding_report(start_date, end_date)
-        elif report_type == "client_analysis":
-            report["data"] = self._generate_client_analysis(start_date, end_date)
-        elif report_type == "service_metrics":
-            report["data"] = self._generate_service_metrics(start_date, end_date)
-        elif report_type == "payment_trends":
-            report["data"] = self._generate_payment_trends(start_date, end_date)
+        if report_type in ACCUMULATORS:
+            report["data"] = self._build_reports([report_type], start_date, end_date)[report_type]
+        return report
+    
+    def _assemble_reports(self, report_types: List[str], start_date: datetime, end_date: datetime) -> Dict:
+        """Build several reports sharing one scan of invoices and payments"""
+        period = {
+            "start": start_date.isoformat(),
+            "end": end_date.isoformat()
+        }
+        generated_at = datetime.now().isoformat()
+        results = self._build_reports(report_types, start_date, end_date)
+        
+        reports = {}
+        for report_type in report_types:
+            reports[report_type] = {
+                "type": report_type,
+                "period": period,
+                "generated_at": generated_at,
+                "data": results[report_type]
+            }
+        
+        return {
+            "types": report_types,
+            "period": period,
+            "generated_at": generated_at,
+            "reports": reports
+        }
+    
+    def _build_reports(self, report_types: List[str], start_date: datetime, end_date: datetime) -> Dict[str, Dict]:
+        """Compute report data, using the rollups where they can answer the report"""
+        results = {}
+        if self.rollups:
+            rollup_reports = {
+                "revenue": self.rollups.revenue_report,
+                "payment_trends": self.rollups.payment_trends_report
+            }
+            for report_type in report_types:
+                if report_type in rollup_reports:
+                    with REPORT_SECONDS.labels(report_type, "rollups").time():
+                        results[report_type] = rollup_reports[report_type](start_date, end_date)
+        
+        if self.columnar:
+            columnar = [t for t in report_types if t not in results and t in COLUMNAR_REPORTS]
+            if columnar:
+                # A stale snapshot is rebuilt in the background; until then the reports are streamed
+                with COLUMNAR_REFRESH_SECONDS.time():
+                    fresh = self.columnar.ensure_fresh(self.storage)
+                for report_type in columnar if fresh else ():
+                    with REPORT_SECONDS.labels(report_type, "columnar").time():
+                        results[report_type] = self.columnar.report(report_type, start_date, end_date)
+        
+        streamed = [t for t in report_types if t not in results]
+        if streamed:
+            with REPORT_SECONDS.labels(",".join(streamed), "scan").time():
+                results.update(run_reports(self.storage, streamed, start_date, end_date, self.get_invoice))
+        return results
+    
+    def stream_report(self, report_type: str, start_date: datetime, end_date: datetime):
+        """Stream one report as detail rows followed by a summary
         
+        Unlike generate_report, the detail rows are yielded as the data is
+        scanned rather than collected, so memory use does not grow with the
+        size of the report period.
+        
+        Args:
+            report_type: A single report type
+            start_date: Start date for the report period
+            end_date: End date for the report period
+            
+        Returns:
+            Iterator of ("row", row) tuples followed by ("summary", totals)
+        """
+        if report_type not in ACCUMULATORS:
+            raise ValueError(f"Unknown report type: {report_type}")
+        return stream_report(self.storage, report_type, start_date, end_date, self.get_invoice)
+    
+    def _deliver_report(self, report: Dict, export_format: str, email_to: Dict) -> None:
+        """Export a generated report and email it when requested"""
         # Export to CSV if requested
         if export_format == "csv":
             self._export_to_csv(report)
@@ -169,215 +800,6 @@ class BillingDatabase:
                 email_to["name"],
                 attach_csv=(export_format == "csv")
             )
-        
-        return report
-    
-    def _generate_revenue_report(self, start_date: datetime, end_date: datetime) -> Dict:
-        """Generate detailed revenue report"""
-        total_revenue = 0
-        paid_invoices = []
-        monthly_revenue = defaultdict(float)
-        payment_methods = defaultdict(float)
-        
-        for filename in os.listdir(os.path.join(self.data_dir, "payments")):
-            if filename.endswith(".json"):
-                with open(os.path.join(self.data_dir, "payments", filename), "r") as f:
-                    payment = json.load(f)
-                    payment_date = datetime.fromisoformat(payment["recorded_at"])
-                    if start_date <= payment_date <= end_date:
-                        amount = payment["amount"]
-                        total_revenue += amount
-                        paid_invoices.append(payment["invoice_id"])
-                        
-                        # Track monthly revenue
-                        month_key = payment_date.strftime("%Y-%m")
-                        monthly_revenue[month_key] += amount
-                        
-                        # Track payment methods
-                        payment_methods[payment.get("payment_method", "unknown")] += amount
-        
-        return {
-            "total_revenue": total_revenue,
-            "paid_invoices_count": len(paid_invoices),
-            "paid_invoices": paid_invoices,
-            "monthly_breakdown": dict(monthly_revenue),
-            "payment_methods": dict(payment_methods),
-            "average_monthly_revenue": total_revenue / len(monthly_revenue) if monthly_revenue else 0
-        }
-    
-    def _generate_outstanding_report(self, start_date: datetime, end_date: datetime) -> Dict:
-        """Generate report on outstanding invoices"""
-        outstanding_invoices = []
-        total_outstanding = 0
-        aging_buckets = {
-            "30_days": 0,
-            "60_days": 0,
-            "90_days": 0,
-            "90_plus_days": 0
-        }
-        
-        for filename in os.listdir(os.path.join(self.data_dir, "invoices")):
-            if filename.endswith(".json"):
-                with open(os.path.join(self.data_dir, "invoices", filename), "r") as f:
-                    invoice = json.load(f)
-                    if invoice["status"] == "pending":
-                        due_date = datetime.fromisoformat(invoice["due_date"])
-                        if start_date <= due_date <= end_date:
-                            days_overdue = (datetime.now() - due_date).days
-                            amount = invoice["amount"]
-                            
-                            outstanding_invoices.append({
-                                "invoice_id": invoice["invoice_id"],
-                                "client_name": invoice["client_name"],
-                                "amount": amount,
-                                "days_overdue": days_overdue
-                            })
-                            
-                            total_outstanding += amount
-                            
-                            # Categorize by aging
-                            if days_overdue <= 30:
-                                aging_buckets["30_days"] += amount
-                            elif days_overdue <= 60:
-                                aging_buckets["60_days"] += amount
-                            elif days_overdue <= 90:
-                                aging_buckets["90_days"] += amount
-                            else:
-                                aging_buckets["90_plus_days"] += amount
-        
-        return {
-            "total_outstanding": total_outstanding,
-            "outstanding_count": len(outstanding_invoices),
-            "aging_analysis": aging_buckets,
-            "outstanding_invoices": outstanding_invoices
-        }
-    
-    def _generate_client_analysis(self, start_date: datetime, end_date: datetime) -> Dict:
-        """Generate client-focused analysis"""
-        client_metrics = defaultdict(lambda: {
-            "total_spent": 0,
-            "invoices_count": 0,
-            "services_used": set(),
-            "payment_history": []
-        })
-        
-        # Analyze invoices and payments
-        for filename in os.listdir(os.path.join(self.data_dir, "invoices")):
-            if filename.endswith(".json"):
-                with open(os.path.join(self.data_dir, "invoices", filename), "r") as f:
-                    invoice = json.load(f)
-                    invoice_date = datetime.fromisoformat(invoice["created_at"])
-                    if start_date <= invoice_date <= end_date:
-                        client_name = invoice["client_name"]
-                        client_metrics[client_name]["invoices_count"] += 1
-                        client_metrics[client_name]["services_used"].update(invoice["services"])
-        
-        # Add payment information
-        for filename in os.listdir(os.path.join(self.data_dir, "payments")):
-            if filename.endswith(".json"):
-                with open(os.path.join(self.data_dir, "payments", filename), "r") as f:
-                    payment = json.load(f)
-                    payment_date = datetime.fromisoformat(payment["recorded_at"])
-                    if start_date <= payment_date <= end_date:
-                        invoice = self.get_invoice(payment["invoice_id"])
-                        if invoice:
-                            client_name = invoice["client_name"]
-                            client_metrics[client_name]["total_spent"] += payment["amount"]
-                            client_metrics[client_name]["payment_history"].append({
-                                "date": payment["recorded_at"],
-                                "amount": payment["amount"],
-                                "method": payment.get("payment_method", "unknown")
-                            })
-        
-        # Convert sets to lists for JSON serialization
-        for client_data in client_metrics.values():
-            client_data["services_used"] = list(client_data["services_used"])
-        
-        return {
-            "client_metrics": dict(client_metrics),
-            "total_active_clients": len(client_metrics),
-            "average_client_spend": sum(c["total_spent"] for c in client_metrics.values()) / len(client_metrics) if client_metrics else 0
-        }
-    
-    def _generate_service_metrics(self, start_date: datetime, end_date: datetime) -> Dict:
-        """Generate metrics about services offered"""
-        service_metrics = defaultdict(lambda: {
-            "total_revenue": 0,
-            "usage_count": 0,
-            "clients": set()
-        })
-        
-        for filename in os.listdir(os.path.join(self.data_dir, "invoices")):
-            if filename.endswith(".json"):
-                with open(os.path.join(self.data_dir, "invoices", filename), "r") as f:
-                    invoice = json.load(f)
-                    invoice_date = datetime.fromisoformat(invoice["created_at"])
-                    if start_date <= invoice_date <= end_date:
-                        # Assuming equal distribution of invoice amount across services
-                        amount_per_service = invoice["amount"] / len(invoice["services"])
-                        for service in invoice["services"]:
-                            service_metrics[service]["total_revenue"] += amount_per_service
-                            service_metrics[service]["usage_count"] += 1
-                            service_metrics[service]["clients"].add(invoice["client_name"])
-        
-        # Convert sets to lists for JSON serialization
-        for service_data in service_metrics.values():
-            service_data["clients"] = list(service_data["clients"])
-            service_data["average_revenue"] = service_data["total_revenue"] / service_data["usage_count"]
-        
-        return {
-            "service_metrics": dict(service_metrics),
-            "top_services": sorted(
-                service_metrics.items(),
-                key=lambda x: x[1]["total_revenue"],
-                reverse=True
-            )[:5]
-        }
-    
-    def _generate_payment_trends(self, start_date: datetime, end_date: datetime) -> Dict:
-        """Generate analysis of payment trends"""
-        payment_trends = {
-            "daily_volumes": defaultdict(float),
-            "payment_methods": defaultdict(float),
-            "average_payment_size": 0,
-            "payment_timing": defaultdict(int)  # Days from invoice to payment
-        }
-        
-        total_payments = 0
-        total_amount = 0
-        
-        for filename in os.listdir(os.path.join(self.data_dir, "payments")):
-            if filename.endswith(".json"):
-                with open(os.path.join(self.data_dir, "payments", filename), "r") as f:
-                    payment = json.load(f)
-                    payment_date = datetime.fromisoformat(payment["recorded_at"])
-                    if start_date <= payment_date <= end_date:
-                        amount = payment["amount"]
-                        total_payments += 1
-                        total_amount += amount
-                        
-                        # Daily volume
-                        date_key = payment_date.strftime("%Y-%m-%d")
-                        payment_trends["daily_volumes"][date_key] += amount
-                        
-                        # Payment methods
-                        method = payment.get("payment_method", "unknown")
-                        payment_trends["payment_methods"][method] += amount
-                        
-                        # Payment timing
-                        invoice = self.get_invoice(payment["invoice_id"])
-                        if invoice:
-                            invoice_date = datetime.fromisoformat(invoice["created_at"])
-                            days_to_payment = (payment_date - invoice_date).days
-                            payment_trends["payment_timing"][days_to_payment] += 1
-        
-        # Calculate averages and convert defaultdicts to regular dicts
-        payment_trends["average_payment_size"] = total_amount / total_payments if total_payments > 0 else 0
-        payment_trends["daily_volumes"] = dict(payment_trends["daily_volumes"])
-        payment_trends["payment_methods"] = dict(payment_trends["payment_methods"])
-        payment_trends["payment_timing"] = dict(payment_trends["payment_timing"])
-        
-        return payment_trends
     
     def _export_to_csv(self, report: Dict) -> None:
         """Export report data to CSV format"""
@@ -0,0 +1,153 @@
+from typing import Dict, Iterable, Optional, Set
+import ctypes
+import ctypes.util
+import os
+import threading
+import time
+
+# Durability modes for record writes
+SYNC_MODES = ("none", "always", "group")
+
+
+def _load_syncfs():
+    """Return libc's syncfs(fd) where available (Linux), else None"""
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        syncfs = libc.syncfs
+    except (OSError, AttributeError, TypeError):
+        return None
+    syncfs.argtypes = [ctypes.c_int]
+    return syncfs
+
+
+_syncfs = _load_syncfs()
+
+
+def fsync_path(path: str) -> None:
+    """fsync a file, or a directory to make renames into it durable"""
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class GroupCommit:
+    """Shares fsyncs between concurrent writers
+
+    A writer that needs its files or directories on disk calls sync() and
+    blocks until a flush covering them has finished. The first writer to
+    arrive becomes the leader: it waits up to window seconds for others to
+    join, then flushes the whole batch, with a single syncfs() of the file
+    system where available and one fsync per file and directory elsewhere.
+    Writers arriving while a flush runs form the next batch, so under load
+    many writes share each flush and no writer pays for one of its own.
+    """
+
+    def __init__(self, window: float = 0.0):
+        """Initialize the committer
+
+        Args:
+            window: Seconds the leader waits for more writers before flushing
+        """
+        self.window = window
+        self._cond = threading.Condition()
+        self._paths: Set[str] = set()
+        self._batch = 0
+        self._completed = -1
+        self._leading = False
+        self._errors: Dict[int, OSError] = {}
+        self.flushes = 0
+        self.syncs = 0
+
+    def sync(self, paths: Iterable[str]) -> None:
+        """Block until the given files and directories are durable
+
+        Raises:
+            OSError: If the flush covering this write failed
+        """
+        with self._cond:
+            self._paths.update(paths)
+            self.syncs += 1
+            batch = self._batch
+            while True:
+                if self._completed >= batch:
+                    error = self._errors.get(batch)
+                    if error:
+                        raise error
+                    return
+                if not self._leading:
+                    self._leading = True
+                    break
+                self._cond.wait()
+
+        if self.window:
+            time.sleep(self.window)
+        with self._cond:
+            paths, self._paths = self._paths, set()
+            self._batch += 1
+
+        error = None
+        try:
+            self._flush(paths)
+        except OSError as e:
+            error = e
+        with self._cond:
+            self._completed = batch
+            if error:
+                self._errors[batch] = error
+            # Only batches writers may still be waiting on are kept
+            for old in [b for b in self._errors if b < batch - 1000]:
+                del self._errors[old]
+            self._leading = False
+            self.flushes += 1
+            self._cond.notify_all()
+        if error:
+            raise error
+
+    def _flush(self, paths: Set[str]) -> None:
+        if not paths:
+            return
+        if _syncfs is not None:
+            # One call writes back everything pending on the file system
+            fd = os.open(next(iter(paths)), os.O_RDONLY)
+            try:
+                if _syncfs(fd) != 0:
+                    errno = ctypes.get_errno()
+                    raise OSError(errno, os.strerror(errno))
+            finally:
+                os.close(fd)
+            return
+        for path in paths:
+            fsync_path(path)
+
+
+class Durability:
+    """Applies a sync mode to the writes of a storage backend
+
+    Modes:
+        none    files are replaced atomically but never fsynced; a crash can
+                lose recent writes, though never leaves a partial record
+        always  every write fsyncs its file and directory itself
+        group   writes share fsyncs through a GroupCommit
+    """
+
+    def __init__(self, mode: str = "group", window: float = 0.0):
+        if mode not in SYNC_MODES:
+            raise ValueError(f"Unknown sync mode: {mode}")
+        self.mode = mode
+        self.committer = GroupCommit(window) if mode == "group" else None
+
+    def sync(self, paths: Iterable[str]) -> None:
+        """Make written files, or renames into directories, durable"""
+        if self.mode == "always":
+            for path in paths:
+                fsync_path(path)
+        elif self.mode == "group":
+            self.committer.sync(paths)
+
+    def stats(self) -> Optional[Dict]:
+        """Return how many syncs were requested and flushes performed in group mode"""
+        if self.committer is None:
+            return None
+        return {"syncs": self.committer.syncs, "flushes": self.committer.flushes}
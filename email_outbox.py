@@ -0,0 +1,298 @@
+from typing import Awaitable, Callable, Dict, List, Optional
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+
+class EmailOutbox:
+    """Durable on-disk queue of outgoing emails
+
+    Messages are spooled as JSON files under spool_dir and delivered by a pool
+    of background worker threads, so request handlers only pay for a small
+    file write. Spool files move between subdirectories as they progress:
+
+        pending/   waiting for delivery; the file name starts with the time of
+                   the next attempt so a sorted listing yields ready messages first
+        inflight/  claimed by a worker (claims are atomic renames, which makes
+                   the spool safe to share between gunicorn workers)
+        failed/    gave up after max_attempts
+
+    Failed deliveries are retried with exponential backoff. When a batch
+    delivery callable is given, each worker claims up to batch_size messages
+    at a time so they can share one SMTP session. An asyncio server can run
+    the workers as tasks on its event loop instead, with serve().
+    """
+
+    def __init__(self, spool_dir: str, deliver: Callable[[Dict], None], workers: int = 2,
+                 max_attempts: int = 5, base_delay: float = 30, max_delay: float = 3600,
+                 poll_interval: float = 1.0, claim_timeout: float = 600,
+                 deliver_batch: Callable[[List[Dict]], List[Optional[str]]] = None, batch_size: int = 50):
+        """Initialize the outbox
+
+        Args:
+            spool_dir: Directory holding the spooled messages
+            deliver: Callable that sends one spooled message and raises on failure
+            workers: Number of delivery threads; with 0 the outbox only spools
+                messages, for another process's workers to deliver
+            max_attempts: Delivery attempts before a message is moved to failed/
+            base_delay: Delay in seconds before the first retry, doubled per attempt
+            max_delay: Upper bound for the retry delay in seconds
+            poll_interval: Seconds an idle worker waits before checking the spool again
+            claim_timeout: Seconds after which an in-flight message is assumed
+                abandoned by a crashed worker and requeued; workers look for such
+                messages every claim_timeout / 4 seconds
+            deliver_batch: Optional callable that sends several messages and returns
+                an error string (or None on success) per message
+            batch_size: Messages claimed at once when deliver_batch is set
+        """
+        self.spool_dir = spool_dir
+        self.deliver = deliver
+        self.deliver_batch = deliver_batch
+        self.batch_size = batch_size if deliver_batch else 1
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+
+        for subdir in ["tmp", "pending", "inflight", "failed"]:
+            os.makedirs(os.path.join(spool_dir, subdir), exist_ok=True)
+
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self._requeue_lock = threading.Lock()
+        self._next_requeue = 0.0
+        # Event loop and event of serve(), when the workers run as tasks
+        self._loop = None
+        self._loop_wakeup = None
+
+    def _dir(self, subdir: str) -> str:
+        return os.path.join(self.spool_dir, subdir)
+
+    @staticmethod
+    def _filename(message: Dict) -> str:
+        return f"{int(message['next_attempt_at'] * 1000):013d}-{message['id']}.json"
+
+    def enqueue(self, message: Dict) -> str:
+        """Spool a message for delivery
+
+        Args:
+            message: Message fields understood by the deliver callable
+
+        Returns:
+            str: ID of the spooled message
+        """
+        return self.enqueue_many([message])[0]
+
+    def enqueue_many(self, messages: List[Dict]) -> List[str]:
+        """Spool several messages, waking the workers once
+
+        Args:
+            messages: Message dicts understood by the deliver callable
+
+        Returns:
+            List[str]: IDs of the spooled messages
+        """
+        ids = []
+        for message in messages:
+            now = time.time()
+            message = dict(message)
+            message["id"] = f"{int(now * 1000):013d}-{uuid.uuid4().hex[:12]}"
+            message["created_at"] = now
+            message["next_attempt_at"] = now
+            message["attempts"] = 0
+            self._write("pending", message)
+            ids.append(message["id"])
+        self.start()
+        self._wakeup.set()
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop_wakeup.set)
+        return ids
+
+    def _write(self, subdir: str, message: Dict) -> None:
+        """Write a spool file atomically so workers never see a partial message"""
+        filename = self._filename(message)
+        tmp_path = os.path.join(self._dir("tmp"), filename)
+        with open(tmp_path, "w") as f:
+            json.dump(message, f)
+        os.rename(tmp_path, os.path.join(self._dir(subdir), filename))
+
+    def start(self) -> None:
+        """Start the delivery threads if they are not running"""
+        with self._start_lock:
+            if self._threads or self._loop is not None:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, name=f"email-outbox-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 5) -> None:
+        """Stop the delivery threads; undelivered messages stay spooled"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping.clear()
+
+    def _requeue_abandoned(self) -> None:
+        """Move messages left in flight by a crashed worker back to pending"""
+        cutoff = time.time() - self.claim_timeout
+        for filename in os.listdir(self._dir("inflight")):
+            path = os.path.join(self._dir("inflight"), filename)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.rename(path, os.path.join(self._dir("pending"), filename))
+            except FileNotFoundError:
+                continue
+
+    def _requeue_due(self) -> None:
+        """Requeue abandoned messages if no worker of this process has lately"""
+        with self._requeue_lock:
+            now = time.time()
+            if now < self._next_requeue:
+                return
+            self._next_requeue = now + self.claim_timeout / 4
+        self._requeue_abandoned()
+
+    def _claim(self, limit: int) -> List[str]:
+        """Claim up to limit messages that are due, returning their in-flight paths"""
+        claimed = []
+        now_ms = int(time.time() * 1000)
+        for filename in sorted(os.listdir(self._dir("pending"))):
+            if len(claimed) >= limit:
+                break
+            due, _, _ = filename.partition("-")
+            if not due.isdigit():
+                # Not a spool file
+                continue
+            if int(due) > now_ms:
+                break
+            inflight_path = os.path.join(self._dir("inflight"), filename)
+            try:
+                os.rename(os.path.join(self._dir("pending"), filename), inflight_path)
+                # Restart the claim timeout from now
+                os.utime(inflight_path)
+            except FileNotFoundError:
+                # Claimed by another worker first, or requeued before the claim was stamped
+                continue
+            claimed.append(inflight_path)
+        return claimed
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            paths = []
+            try:
+                self._requeue_due()
+                paths = self._claim(self.batch_size)
+                if paths:
+                    self._process(paths)
+            except Exception as e:
+                print(f"Error processing outbox messages {paths}: {str(e)}")
+            if not paths:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+
+    async def serve(self, deliver_batch: Callable[[List[Dict]], Awaitable[List[Optional[str]]]]) -> None:
+        """Deliver messages from the running event loop until cancelled
+
+        Replaces the delivery threads with as many tasks, which await
+        deliver_batch instead of blocking a thread per SMTP session. Spool
+        files are still read and moved in the loop's default executor.
+
+        Args:
+            deliver_batch: Coroutine function sending several messages and
+                returning an error string (or None on success) per message
+        """
+        self.stop()
+        loop = asyncio.get_running_loop()
+        self._loop_wakeup = asyncio.Event()
+        with self._start_lock:
+            self._loop = loop
+
+        async def worker():
+            while True:
+                paths = []
+                try:
+                    await loop.run_in_executor(None, self._requeue_due)
+                    paths = await loop.run_in_executor(None, self._claim, self.batch_size)
+                    if paths:
+                        messages = await loop.run_in_executor(None, self._load, paths)
+                        errors = await deliver_batch(messages)
+                        await loop.run_in_executor(None, self._finish, paths, messages, errors)
+                except Exception as e:
+                    print(f"Error processing outbox messages {paths}: {str(e)}")
+                if not paths:
+                    try:
+                        await asyncio.wait_for(self._loop_wakeup.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self._loop_wakeup.clear()
+
+        try:
+            await asyncio.gather(*(worker() for _ in range(self.workers)))
+        finally:
+            with self._start_lock:
+                self._loop = None
+
+    def _load(self, paths: List[str]) -> List[Dict]:
+        messages = []
+        for path in paths:
+            with open(path, "r") as f:
+                messages.append(json.load(f))
+        return messages
+
+    def _process(self, paths: List[str]) -> None:
+        messages = self._load(paths)
+
+        if self.deliver_batch:
+            errors = self.deliver_batch(messages)
+        else:
+            errors = []
+            for message in messages:
+                try:
+                    self.deliver(message)
+                    errors.append(None)
+                except Exception as e:
+                    errors.append(str(e))
+        self._finish(paths, messages, errors)
+
+    def _finish(self, paths: List[str], messages: List[Dict], errors: List[Optional[str]]) -> None:
+        """Retry or drop delivered messages and release their claims"""
+        for path, message, error in zip(paths, messages, errors):
+            if error:
+                self._retry(message, error)
+            os.remove(path)
+
+    def _retry(self, message: Dict, error: str) -> None:
+        """Reschedule a failed message with backoff, or park it in failed/"""
+        message["attempts"] += 1
+        message["last_error"] = error
+        if message["attempts"] >= self.max_attempts:
+            print(f"Giving up on email {message['id']} after {message['attempts']} attempts: {error}")
+            self._write("failed", message)
+        else:
+            delay = min(self.base_delay * 2 ** (message["attempts"] - 1), self.max_delay)
+            message["next_attempt_at"] = time.time() + delay * random.uniform(0.8, 1.2)
+            self._write("pending", message)
+
+    def stats(self) -> Dict:
+        """Return queue depth and the age of the oldest undelivered message"""
+        pending = os.listdir(self._dir("pending"))
+        inflight = os.listdir(self._dir("inflight"))
+        # Message IDs start with their creation time in milliseconds
+        created = [int(filename.split("-")[1]) for filename in pending + inflight]
+        return {
+            "depth": len(pending) + len(inflight),
+            "in_flight": len(inflight),
+            "failed": len(os.listdir(self._dir("failed"))),
+            "oldest_age_seconds": round(time.time() - min(created) / 1000, 3) if created else 0
+        }
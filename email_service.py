@@ -3,19 +3,47 @@ import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
+import email
 import os
+import time
 from datetime import datetime
 import json
+from email_outbox import EmailOutbox
+from smtp_pool import SMTPConnectionPool
+from metrics import REGISTRY
+
+SMTP_SEND_SECONDS = REGISTRY.histogram("billing_smtp_send_seconds", "Time to hand one message to the SMTP server")
+SMTP_FAILURES = REGISTRY.counter(
+    "billing_smtp_failures_total", "Messages the SMTP server rejected, that failed to send, or that could not be spooled",
+    ["reason"])
+# Bound once and shared with async_smtp, so deliveries by either server land
+# in the same series
+SMTP_SENT = SMTP_SEND_SECONDS.labels()
+SMTP_REJECTED = SMTP_FAILURES.labels("rejected")
+SMTP_ERRORS = SMTP_FAILURES.labels("error")
+SMTP_SPOOL_FAILURES = SMTP_FAILURES.labels("spool")
+
+
+def _failure_counter(error: Exception):
+    """Failure series: a rejection by the server or any other error"""
+    if isinstance(error, (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException)):
+        return SMTP_REJECTED
+    return SMTP_ERRORS
+
 
 class EmailService:
     """Email service for sending billing notifications"""
     
-    def __init__(self, smtp_config: Dict = None):
+    def __init__(self, smtp_config: Dict = None, outbox_dir: str = None, deliver: bool = True):
         """Initialize email service
         
         Args:
             smtp_config: Dictionary containing SMTP configuration
                 Required keys: host, port, username, password, use_tls
+            outbox_dir: Optional spool directory. When set, emails are queued in a
+                durable outbox and delivered by background workers instead of inline.
+            deliver: Whether this process runs the outbox delivery workers. Short-lived
+                processes (manage.py) pass False and leave delivery to the server.
         """
         self.config = smtp_config or {
             "host": os.getenv("SMTP_HOST", "smtp.gmail.com"),
@@ -26,6 +54,25 @@ class EmailService:
             "from_email": os.getenv("FROM_EMAIL", "billing@chromapages.com"),
             "from_name": os.getenv("FROM_NAME", "Chromapages Billing")
         }
+        
+        # Authenticated connections are reused across messages
+        self.pool = SMTPConnectionPool(
+            self.config,
+            max_size=int(os.getenv("SMTP_POOL_SIZE", "4")),
+            idle_timeout=float(os.getenv("SMTP_IDLE_TIMEOUT", "30")),
+            max_messages=int(os.getenv("SMTP_MAX_MESSAGES_PER_CONNECTION", "100"))
+        )
+        
+        self.outbox = None
+        if outbox_dir:
+            self.outbox = EmailOutbox(
+                outbox_dir,
+                self._deliver_spooled,
+                workers=int(os.getenv("EMAIL_OUTBOX_WORKERS", "2")) if deliver else 0,
+                max_attempts=int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5")),
+                deliver_batch=self._deliver_spooled_batch
+            )
+            self.outbox.start()
     
     def send_invoice(self, invoice: Dict, to_email: str, to_name: str) -> bool:
         """Send invoice notification email
@@ -38,6 +85,25 @@ class EmailService:
         Returns:
             bool: True if email was sent successfully
         """
+        message = self._invoice_email(invoice, to_email, to_name)
+        return self._send_email(message["to_email"], message["subject"], message["body"])
+    
+    def send_invoices(self, invoices: List[Dict]) -> List[bool]:
+        """Send invoice notification emails for a batch of invoices over one connection
+        
+        Args:
+            invoices: Invoice data dictionaries with client_email and client_name
+            
+        Returns:
+            List[bool]: Whether each email was sent successfully, in input order
+        """
+        return self.send_many([
+            self._invoice_email(invoice, invoice["client_email"], invoice["client_name"])
+            for invoice in invoices
+        ])
+    
+    def _invoice_email(self, invoice: Dict, to_email: str, to_name: str) -> Dict:
+        """Render the invoice notification email"""
         subject = f"Invoice {invoice['invoice_id']} from Chromapages"
         
         # Create email body
@@ -60,7 +126,7 @@ If you have any questions, please don't hesitate to contact us.
 Best regards,
 Chromapages Billing Team"""
         
-        return self._send_email(to_email, subject, body)
+        return {"to_email": to_email, "subject": subject, "body": body}
     
     def send_payment_reminder(self, invoice: Dict, to_email: str, to_name: str, days_overdue: int) -> bool:
         """Send payment reminder email
@@ -143,6 +209,26 @@ Chromapages Billing Team"""
         Returns:
             bool: True if email was sent successfully
         """
+        message = self._payment_confirmation_email(payment, invoice, to_email, to_name)
+        return self._send_email(message["to_email"], message["subject"], message["body"])
+    
+    def send_payment_confirmations(self, confirmations: List[tuple]) -> List[bool]:
+        """Send payment confirmation emails for a batch of payments over one connection
+        
+        Args:
+            confirmations: (payment, invoice) pairs; each invoice must have
+                client_email and client_name
+            
+        Returns:
+            List[bool]: Whether each email was sent successfully, in input order
+        """
+        return self.send_many([
+            self._payment_confirmation_email(payment, invoice, invoice["client_email"], invoice["client_name"])
+            for payment, invoice in confirmations
+        ])
+    
+    def _payment_confirmation_email(self, payment: Dict, invoice: Dict, to_email: str, to_name: str) -> Dict:
+        """Render the payment confirmation email"""
         subject = f"Payment Confirmation - Invoice {invoice['invoice_id']}"
         
         body = f"""Dear {to_name},
@@ -167,7 +253,7 @@ Thank you for your business!
 Best regards,
 Chromapages Billing Team"""
         
-        return self._send_email(to_email, subject, body)
+        return {"to_email": to_email, "subject": subject, "body": body}
     
     def send_report(self, report: Dict, to_email: str, to_name: str, attach_csv: bool = False) -> bool:
         """Send report email
@@ -212,7 +298,7 @@ Chromapages Billing Team"""
         return self._send_email(to_email, subject, body, attachments)
     
     def _send_email(self, to_email: str, subject: str, body: str, attachments: List = None) -> bool:
-        """Send email using SMTP
+        """Send email using SMTP, or queue it when an outbox is configured
         
         Args:
             to_email: Recipient email address
@@ -221,35 +307,121 @@ Chromapages Billing Team"""
             attachments: List of email attachments
             
         Returns:
-            bool: True if email was sent successfully
+            bool: True if email was sent (or queued) successfully
         """
         try:
-            msg = MIMEMultipart()
-            msg['From'] = f"{self.config['from_name']} <{self.config['from_email']}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            msg.attach(MIMEText(body, 'plain'))
+            msg = self._build_message(to_email, subject, body, attachments)
             
-            if attachments:
-                for attachment in attachments:
-                    msg.attach(attachment)
-            
-            with smtplib.SMTP(self.config['host'], self.config['port']) as server:
-                if self.config['use_tls']:
-                    server.starttls()
-                
-                if self.config['username'] and self.config['password']:
-                    server.login(self.config['username'], self.config['password'])
-                
-                server.send_message(msg)
+            if self.outbox:
+                self.outbox.enqueue(self._spool_entry(msg))
+            else:
+                self._timed_send(self.pool.send_message, msg)
             
             return True
             
         except Exception as e:
+            if self.outbox:
+                SMTP_SPOOL_FAILURES.inc()
             print(f"Error sending email: {str(e)}")
             return False
     
+    def send_many(self, messages: List[Dict]) -> List[bool]:
+        """Send a batch of emails over a single SMTP connection
+        
+        Args:
+            messages: List of dicts with keys to_email, subject, body and
+                optionally attachments
+            
+        Returns:
+            List[bool]: Whether each email was sent (or queued) successfully, in input order
+        """
+        try:
+            built = [
+                self._build_message(m["to_email"], m["subject"], m["body"], m.get("attachments"))
+                for m in messages
+            ]
+            
+            if self.outbox:
+                self.outbox.enqueue_many([self._spool_entry(msg) for msg in built])
+                return [True] * len(built)
+            
+        except Exception as e:
+            if self.outbox:
+                SMTP_SPOOL_FAILURES.inc(len(messages))
+            print(f"Error sending emails: {str(e)}")
+            return [False] * len(messages)
+        
+        errors = self._deliver_many(built)
+        for msg, error in zip(built, errors):
+            if error:
+                print(f"Error sending email to {msg['To']}: {error}")
+        return [error is None for error in errors]
+    
+    def _build_message(self, to_email: str, subject: str, body: str, attachments: List = None) -> MIMEMultipart:
+        """Build a MIME message from the sender configuration"""
+        msg = MIMEMultipart()
+        msg['From'] = f"{self.config['from_name']} <{self.config['from_email']}>"
+        msg['To'] = to_email
+        msg['Subject'] = subject
+        
+        msg.attach(MIMEText(body, 'plain'))
+        
+        if attachments:
+            for attachment in attachments:
+                msg.attach(attachment)
+        
+        return msg
+    
+    def _timed_send(self, send, msg) -> None:
+        """Send one message, recording its latency or the failure"""
+        start = time.perf_counter()
+        try:
+            send(msg)
+        except Exception as e:
+            _failure_counter(e).inc()
+            raise
+        SMTP_SENT.observe(time.perf_counter() - start)
+    
+    def _spool_entry(self, msg: MIMEMultipart) -> Dict:
+        """Outbox entry for a rendered message"""
+        return {
+            "to": msg['To'],
+            "subject": msg['Subject'],
+            "message": msg.as_string()
+        }
+    
+    def _deliver_many(self, messages: List) -> List[Optional[str]]:
+        """Deliver messages over one pooled connection
+        
+        Returns:
+            List of error strings (None on success), in input order
+        """
+        errors = []
+        try:
+            with self.pool.connection() as conn:
+                for msg in messages:
+                    start = time.perf_counter()
+                    try:
+                        conn.send_message(msg)
+                        SMTP_SENT.observe(time.perf_counter() - start)
+                        errors.append(None)
+                    except (smtplib.SMTPRecipientsRefused, smtplib.SMTPResponseException) as e:
+                        # The server rejected this message; the session is still usable
+                        SMTP_REJECTED.inc()
+                        errors.append(str(e))
+        except Exception as e:
+            SMTP_ERRORS.inc(len(messages) - len(errors))
+            errors += [str(e)] * (len(messages) - len(errors))
+        return errors
+    
+    def _deliver_spooled(self, message: Dict) -> None:
+        """Deliver a message taken from the outbox"""
+        self._timed_send(self.pool.send_message, email.message_from_string(message["message"]))
+    
+    def _deliver_spooled_batch(self, messages: List[Dict]) -> List[Optional[str]]:
+        """Deliver a batch of messages taken from the outbox over one connection"""
+        return self._deliver_many([email.message_from_string(m["message"]) for m in messages])
+    
     def _format_services(self, services: List[str]) -> str:
         """Format services list for email body"""
         return "\n".join(f"- {service}" for service in services)
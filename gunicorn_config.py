@@ -1,11 +1,20 @@
 import os
+from dotenv import load_dotenv
+
+# STORAGE_BACKEND and GUNICORN_WORKERS may come from .env, as in app.py
+load_dotenv()
 
 # Server socket
 port = int(os.getenv("PORT", 8080))
 bind = f"0.0.0.0:{port}"
 
-# Worker processes
-workers = 1
+# Worker processes: one per CPU by default. Record locks and the change
+# feed keep workers consistent; the journal backend's offset index belongs
+# to a single process, so it always runs one worker (JournalStorage also
+# refuses to open a journal another process holds).
+workers = int(os.getenv("GUNICORN_WORKERS") or os.cpu_count() or 1)
+if os.getenv("STORAGE_BACKEND", "json").lower() == "journal":
+    workers = 1
 worker_class = 'gthread'
 threads = 8
 timeout = 0
@@ -0,0 +1,78 @@
+from typing import List
+from datetime import datetime
+import os
+import threading
+import time
+
+
+class IdAllocator:
+    """Generates time-sortable record IDs that stay unique under load
+
+    IDs look like INV-20240301-123456789-0001-00a3f2: the creation time to the
+    millisecond, a sequence number within that millisecond and a worker
+    suffix. IDs from one process never repeat, and IDs from different
+    processes differ in the worker suffix, built from the process ID (unique
+    among the gunicorn workers on a host). Deployments that run several hosts
+    against one data directory should set ID_WORKER to a short, distinct
+    prefix per host.
+
+    Sorting IDs sorts records by creation time, to the millisecond.
+    """
+
+    # IDs per millisecond; beyond this the allocator borrows the next millisecond
+    MAX_SEQUENCE = 10000
+
+    def __init__(self, host: str = None):
+        """Initialize the allocator
+
+        Args:
+            host: Prefix for the worker suffix; defaults to ID_WORKER
+        """
+        self._host = host if host is not None else os.getenv("ID_WORKER", "")
+        self._reset()
+        # Forked gunicorn workers must not share the parent's worker suffix
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self.worker = f"{self._host}{os.getpid():06x}"
+        self._last_ms = 0
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def _tick(self) -> int:
+        """Advance to the next (millisecond, sequence) slot; caller holds the lock"""
+        now_ms = int(time.time() * 1000)
+        if now_ms > self._last_ms:
+            self._last_ms = now_ms
+            self._sequence = 0
+        else:
+            # Same millisecond, or the clock stepped back: keep counting from
+            # the last millisecond handed out so IDs never repeat
+            self._sequence += 1
+            if self._sequence >= self.MAX_SEQUENCE:
+                self._last_ms += 1
+                self._sequence = 0
+        return self._last_ms
+
+    def _format(self, prefix: str, ms: int, sequence: int) -> str:
+        stamp = datetime.fromtimestamp(ms / 1000)
+        return f"{prefix}-{stamp.strftime('%Y%m%d-%H%M%S')}{ms % 1000:03d}-{sequence:04d}-{self.worker}"
+
+    def next_id(self, prefix: str) -> str:
+        """Allocate one ID with the given prefix (e.g. "INV")"""
+        with self._lock:
+            ms = self._tick()
+            return self._format(prefix, ms, self._sequence)
+
+    def next_ids(self, prefix: str, count: int) -> List[str]:
+        """Allocate several IDs at once, in ascending order"""
+        with self._lock:
+            ids = []
+            for _ in range(count):
+                ms = self._tick()
+                ids.append(self._format(prefix, ms, self._sequence))
+            return ids
+
+
+# Process-wide allocator shared by every BillingDatabase
+allocator = IdAllocator()
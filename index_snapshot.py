@@ -0,0 +1,68 @@
+from typing import Dict, List, Optional
+import json
+import os
+
+# Bumped whenever the snapshot layout changes; other versions are ignored
+SNAPSHOT_VERSION = 1
+
+
+class IndexSnapshot:
+    """Invoice index contents saved to disk for fast startup
+
+    Building the invoice indexes means reading every invoice. The snapshot
+    keeps the indexed fields of every invoice in one file, together with the
+    time it was taken, so a new process can load it and then read only the
+    invoices written since. Snapshots are written to a temporary file and
+    renamed into place, so a crash never leaves a partial snapshot behind.
+    """
+
+    # Invoices modified up to this many seconds before the snapshot are
+    # replayed too, to allow for file system timestamp granularity
+    CLOCK_MARGIN = 2.0
+
+    def __init__(self, path: str):
+        """Initialize the snapshot
+
+        Args:
+            path: Snapshot file location
+        """
+        self.path = path
+
+    def load(self) -> Optional[Dict]:
+        """Read the snapshot
+
+        Returns:
+            Dict with "taken_at" (Unix time) and "invoices" (index fields per
+            invoice), or None when there is no usable snapshot
+        """
+        try:
+            with open(self.path, "r") as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Ignoring unreadable index snapshot {self.path}: {str(e)}")
+            return None
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            return None
+        return snapshot
+
+    def save(self, invoices: List[Dict], taken_at: float) -> None:
+        """Atomically replace the snapshot
+
+        Args:
+            invoices: Indexed fields of every invoice
+            taken_at: Unix time before the invoices were collected; writes
+                after it are replayed when the snapshot is loaded
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": SNAPSHOT_VERSION,
+                "taken_at": taken_at,
+                "invoice_count": len(invoices),
+                "invoices": invoices
+            }, f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
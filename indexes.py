@@ -0,0 +1,213 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from datetime import datetime
+import bisect
+import threading
+from timestamps import parse_timestamp
+
+
+class DueDateIndex:
+    """In-memory index of pending invoices ordered by due date
+
+    Entries are kept in a sorted list of (due_date, invoice_id) tuples so that
+    finding every invoice due before a given moment is a binary search plus a
+    slice, instead of reading every invoice from storage. Due dates are
+    parsed as naive local times (see parse_timestamp), so a due date stored
+    with a UTC offset sorts among the others.
+    """
+
+    def __init__(self):
+        self._entries: List[Tuple[datetime, str]] = []
+        self._due_dates: Dict[str, datetime] = {}
+        self._lock = threading.Lock()
+
+    def build(self, invoices: Iterable[Dict]) -> None:
+        """Replace the index contents with the pending invoices given"""
+        due_dates = {
+            invoice["invoice_id"]: parse_timestamp(invoice["due_date"])
+            for invoice in invoices
+            if invoice["status"] == "pending"
+        }
+        entries = sorted((due_date, invoice_id) for invoice_id, due_date in due_dates.items())
+        with self._lock:
+            self._due_dates = due_dates
+            self._entries = entries
+
+    def update(self, invoice: Dict) -> None:
+        """Add, move or remove an invoice according to its current status"""
+        invoice_id = invoice["invoice_id"]
+        with self._lock:
+            self._remove(invoice_id)
+            if invoice["status"] == "pending":
+                due_date = parse_timestamp(invoice["due_date"])
+                bisect.insort(self._entries, (due_date, invoice_id))
+                self._due_dates[invoice_id] = due_date
+
+    def _remove(self, invoice_id: str) -> None:
+        due_date = self._due_dates.pop(invoice_id, None)
+        if due_date is not None:
+            position = bisect.bisect_left(self._entries, (due_date, invoice_id))
+            del self._entries[position]
+
+    def due_before(self, when: datetime) -> List[str]:
+        """Return the IDs of pending invoices due before the given moment, oldest first"""
+        with self._lock:
+            position = bisect.bisect_left(self._entries, (when, ""))
+            return [invoice_id for _, invoice_id in self._entries[:position]]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _insort_unique(ids: List[str], invoice_id: str) -> None:
+    position = bisect.bisect_left(ids, invoice_id)
+    if position == len(ids) or ids[position] != invoice_id:
+        ids.insert(position, invoice_id)
+
+
+def _remove_sorted(ids: List[str], invoice_id: str) -> None:
+    position = bisect.bisect_left(ids, invoice_id)
+    if position < len(ids) and ids[position] == invoice_id:
+        del ids[position]
+
+
+class InvoiceIndex:
+    """In-memory index of invoice attributes for filtered, paginated listing
+
+    Every invoice ID is kept in a sorted list, plus one sorted posting list
+    per status, client and service. A query walks the shortest posting list
+    that applies, starting from the position after the cursor (found by
+    binary search), and checks the remaining filters against the attributes
+    held in memory. Later pages therefore cost the same as the first one.
+    Invoice IDs sort by creation time, so pages come out oldest first.
+    """
+
+    def __init__(self):
+        # invoice_id -> (status, client_name, due_date, created_at, services)
+        self._invoices: Dict[str, Tuple[str, str, datetime, datetime, Tuple[str, ...]]] = {}
+        self._ids: List[str] = []
+        self._by_status: Dict[str, List[str]] = {}
+        self._by_client: Dict[str, List[str]] = {}
+        self._by_service: Dict[str, List[str]] = {}
+        self._lock = threading.Lock()
+
+    def build(self, invoices: Iterable[Dict]) -> None:
+        """Replace the index contents with the invoices given"""
+        with self._lock:
+            self._invoices = {}
+            self._by_status, self._by_client, self._by_service = {}, {}, {}
+            for invoice in invoices:
+                self._invoices[invoice["invoice_id"]] = self._entry(invoice)
+            self._ids = sorted(self._invoices)
+            # Posting lists are filled in sorted order, so they start out sorted
+            for invoice_id in self._ids:
+                self._post(invoice_id, self._invoices[invoice_id], append=True)
+
+    @staticmethod
+    def _entry(invoice: Dict) -> Tuple[str, str, datetime, datetime, Tuple[str, ...]]:
+        return (
+            invoice["status"],
+            invoice["client_name"],
+            parse_timestamp(invoice["due_date"]),
+            parse_timestamp(invoice["created_at"]),
+            tuple(invoice["services"])
+        )
+
+    def _post(self, invoice_id: str, entry: tuple, append: bool = False) -> None:
+        status, client_name, _, _, services = entry
+        postings = [self._by_status.setdefault(status, []), self._by_client.setdefault(client_name, [])]
+        postings.extend(self._by_service.setdefault(service, []) for service in set(services))
+        for ids in postings:
+            if append:
+                ids.append(invoice_id)
+            else:
+                _insort_unique(ids, invoice_id)
+
+    def _unpost(self, invoice_id: str, entry: tuple) -> None:
+        status, client_name, _, _, services = entry
+        _remove_sorted(self._by_status[status], invoice_id)
+        _remove_sorted(self._by_client[client_name], invoice_id)
+        for service in set(services):
+            _remove_sorted(self._by_service[service], invoice_id)
+
+    def update(self, invoice: Dict) -> None:
+        """Add an invoice or refresh its attributes after a write"""
+        invoice_id = invoice["invoice_id"]
+        entry = self._entry(invoice)
+        with self._lock:
+            previous = self._invoices.get(invoice_id)
+            if previous == entry:
+                return
+            if previous:
+                self._unpost(invoice_id, previous)
+            else:
+                _insort_unique(self._ids, invoice_id)
+            self._invoices[invoice_id] = entry
+            self._post(invoice_id, entry)
+
+    def query(self, status: str = None, client_name: str = None, service: str = None,
+              due_start: datetime = None, due_end: datetime = None,
+              created_start: datetime = None, created_end: datetime = None,
+              after: str = None, limit: int = 50) -> Tuple[List[str], Optional[str]]:
+        """Find invoice IDs matching every given filter, one page at a time
+
+        Args:
+            status: Exact invoice status
+            client_name: Exact client name
+            service: Service that must appear on the invoice
+            due_start: Earliest due date (inclusive)
+            due_end: Latest due date (inclusive)
+            created_start: Earliest creation date (inclusive)
+            created_end: Latest creation date (inclusive)
+            after: Cursor returned with the previous page
+            limit: Maximum number of IDs to return
+
+        Returns:
+            The matching IDs in ascending order and the cursor for the next
+            page, or None when this is the last page
+        """
+        with self._lock:
+            candidates = [self._ids]
+            for postings, value in ((self._by_status, status), (self._by_client, client_name),
+                                    (self._by_service, service)):
+                if value is not None:
+                    candidates.append(postings.get(value, []))
+            ids = min(candidates, key=len)
+
+            position = bisect.bisect_right(ids, after) if after else 0
+            page = []
+            for index in range(position, len(ids)):
+                invoice_id = ids[index]
+                entry_status, entry_client, due_date, created_at, services = self._invoices[invoice_id]
+                if status is not None and entry_status != status:
+                    continue
+                if client_name is not None and entry_client != client_name:
+                    continue
+                if service is not None and service not in services:
+                    continue
+                if (due_start and due_date < due_start) or (due_end and due_date > due_end):
+                    continue
+                if (created_start and created_at < created_start) or (created_end and created_at > created_end):
+                    continue
+                if len(page) == limit:
+                    return page, page[-1]
+                page.append(invoice_id)
+            return page, None
+
+    def records(self) -> List[Dict]:
+        """Return the indexed fields of every invoice, as build() accepts them"""
+        with self._lock:
+            items = list(self._invoices.items())
+        return [
+            {
+                "invoice_id": invoice_id,
+                "status": status,
+                "client_name": client_name,
+                "due_date": due_date.isoformat(),
+                "created_at": created_at.isoformat(),
+                "services": list(services)
+            }
+            for invoice_id, (status, client_name, due_date, created_at, services) in items
+        ]
+
+    def __len__(self) -> int:
+        return len(self._invoices)
@@ -0,0 +1,366 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+import os
+import re
+import threading
+try:
+    import fcntl
+except ImportError:
+    # No advisory file locks (Windows); nothing stops a second process
+    fcntl = None
+from serializers import JsonSerializer
+from storage import ID_FIELDS, COLLECTIONS, RecordExistsError, StorageBackend
+
+_json = JsonSerializer()
+
+# Segment files are named by sequence number: 000001.jsonl, 000002.jsonl, ...
+SEGMENT_PATTERN = re.compile(r"^(\d{6})\.jsonl$")
+
+
+class JournalInUseError(Exception):
+    """Raised when another process already has the journal open"""
+
+    def __init__(self, directory: str):
+        super().__init__(f"Journal {directory} is in use by another process; "
+                         "the journal backend supports a single worker process")
+        self.directory = directory
+
+
+class _Collection:
+    """Segments and offset index for one record collection"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        # Record ID -> (segment number, offset, length) of its latest version
+        self.index: Dict[str, Tuple[int, int, int]] = {}
+        self.readers: Dict[int, int] = {}
+        self.retired: List[int] = []
+        self.active = 0
+        self.active_fd = None
+        self.active_size = 0
+        self.total_bytes = 0
+        self.live_bytes = 0
+        self.scans = 0
+        # Set by compact() while a scan was running
+        self.compact_pending = False
+        self.lock = threading.Lock()
+
+    def path(self, segment: int) -> str:
+        return os.path.join(self.directory, f"{segment:06d}.jsonl")
+
+    def segments(self) -> List[int]:
+        return sorted(
+            int(match.group(1))
+            for match in map(SEGMENT_PATTERN.match, os.listdir(self.directory))
+            if match
+        )
+
+
+class JournalStorage(StorageBackend):
+    """Stores records in append-only, segmented JSONL journals
+
+    Each collection is a directory of segment files under
+    data_dir/journal/<collection>/. Every write appends one line holding the
+    record ID and its compact JSON, so updating a record adds a new version
+    rather than rewriting a file. An in-memory offset index maps each ID to
+    its latest version: get() is a single positioned read, and scan() is a
+    sequential read of a few large files that skips superseded versions.
+
+    The active segment is sealed once it reaches segment_size bytes. When
+    superseded versions make up more than compact_ratio of the journal, the
+    live records are rewritten into fresh segments and the old ones removed.
+
+    The index is built by reading the journal when the storage is opened and
+    is private to the process, so only one process may use a journal at a
+    time: opening it takes an exclusive flock() on data_dir/journal, and a
+    second process (another gunicorn or uvicorn worker, or `manage.py
+    compact` while the server runs) gets JournalInUseError instead of
+    appending to the same segments.
+    """
+
+    def __init__(self, data_dir: str = "data", segment_size: int = 64 * 1024 * 1024,
+                 compact_ratio: float = 0.5):
+        """Initialize the journal
+
+        Args:
+            data_dir: Base data directory; segments live in data_dir/journal
+            segment_size: Bytes after which the active segment is sealed
+            compact_ratio: Fraction of superseded bytes that triggers compaction
+        """
+        self.data_dir = data_dir
+        self.segment_size = segment_size
+        self.compact_ratio = compact_ratio
+        self._collections = {}
+        root = os.path.join(data_dir, "journal")
+        os.makedirs(root, exist_ok=True)
+        # Held until close(); taken before loading, which may truncate torn writes
+        self._lock_fd = os.open(root, os.O_RDONLY)
+        if fcntl is not None:
+            try:
+                fcntl.flock(self._lock_fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(self._lock_fd)
+                raise JournalInUseError(root)
+        for collection in COLLECTIONS:
+            directory = os.path.join(root, collection)
+            os.makedirs(directory, exist_ok=True)
+            self._collections[collection] = self._load(directory)
+
+    @staticmethod
+    def _encode(record_id: str, record: Dict) -> bytes:
+        return record_id.encode() + b"\t" + _json.dumps(record) + b"\n"
+
+    @staticmethod
+    def _decode(line: bytes) -> Dict:
+        return _json.loads(line[line.index(b"\t") + 1:])
+
+    def _load(self, directory: str) -> _Collection:
+        """Open a collection's segments and rebuild its offset index"""
+        state = _Collection(directory)
+        segments = state.segments() or [1]
+        for segment in segments:
+            path = state.path(segment)
+            offset = 0
+            with open(path, "ab+") as f:
+                f.seek(0)
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # A torn write from a crash; drop the partial line
+                        f.truncate(offset)
+                        break
+                    record_id = line[:line.index(b"\t")].decode()
+                    previous = state.index.get(record_id)
+                    if previous:
+                        state.live_bytes -= previous[2]
+                    state.index[record_id] = (segment, offset, len(line))
+                    state.live_bytes += len(line)
+                    offset += len(line)
+            state.total_bytes += offset
+            state.readers[segment] = os.open(path, os.O_RDONLY)
+
+        state.active = segments[-1]
+        state.active_size = os.path.getsize(state.path(state.active))
+        state.active_fd = os.open(state.path(state.active), os.O_WRONLY | os.O_APPEND)
+        return state
+
+    def _append(self, state: _Collection, lines: List[Tuple[str, bytes]]) -> None:
+        """Append encoded records to the active segment; caller holds the lock"""
+        buffer = b"".join(line for _, line in lines)
+        os.write(state.active_fd, buffer)
+
+        offset = state.active_size
+        for record_id, line in lines:
+            previous = state.index.get(record_id)
+            if previous:
+                state.live_bytes -= previous[2]
+            state.index[record_id] = (state.active, offset, len(line))
+            state.live_bytes += len(line)
+            offset += len(line)
+        state.active_size = offset
+        state.total_bytes += len(buffer)
+
+        if state.active_size >= self.segment_size:
+            self._rotate(state)
+            self._maybe_compact(state)
+
+    def _maybe_compact(self, state: _Collection) -> None:
+        """Compact once superseded versions pass compact_ratio; caller holds the lock"""
+        # Compaction moves records, so it waits until no scan is reading
+        if state.scans or not state.total_bytes:
+            return
+        if state.compact_pending or (1 - state.live_bytes / state.total_bytes > self.compact_ratio
+                                     and len(state.readers) > 1):
+            self._compact(state)
+
+    def _rotate(self, state: _Collection) -> None:
+        """Seal the active segment and start a new one; caller holds the lock"""
+        os.close(state.active_fd)
+        state.active += 1
+        path = state.path(state.active)
+        state.active_fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        state.readers[state.active] = os.open(path, os.O_RDONLY)
+        state.active_size = 0
+
+    def _compact(self, state: _Collection) -> None:
+        """Rewrite live records into fresh segments; caller holds the lock"""
+        state.compact_pending = False
+        # Descriptors retired by the previous compaction are no longer in use
+        for fd in state.retired:
+            os.close(fd)
+        state.retired = []
+
+        old_segments = sorted(state.readers)
+        old_index = state.index
+        state.index = {}
+        state.live_bytes = state.total_bytes = 0
+        self._rotate(state)
+
+        # Copy live versions in journal order so scans keep their ordering
+        pending = []
+        pending_size = 0
+        for record_id, (segment, offset, length) in sorted(old_index.items(), key=lambda item: item[1]):
+            pending.append((record_id, os.pread(state.readers[segment], length, offset)))
+            pending_size += length
+            if pending_size >= 1024 * 1024:
+                self._append(state, pending)
+                pending, pending_size = [], 0
+        if pending:
+            self._append(state, pending)
+
+        # Readers may still hold offsets into the old segments, so their
+        # descriptors stay open (the files remain readable once unlinked)
+        for segment in old_segments:
+            os.remove(state.path(segment))
+            state.retired.append(state.readers.pop(segment))
+
+    def compact(self) -> Dict[str, int]:
+        """Compact every collection now, or once the scans reading it finish
+
+        Returns:
+            Dict mapping collection name to its journal size in bytes
+            afterwards (for a collection still being scanned, its current size)
+        """
+        sizes = {}
+        for collection, state in self._collections.items():
+            with state.lock:
+                if state.scans:
+                    # Compaction moves records, so the last scan runs it
+                    state.compact_pending = True
+                else:
+                    self._compact(state)
+                sizes[collection] = state.total_bytes
+        return sizes
+
+    versioned = True
+
+    def version(self, collection: str, record_id: str) -> Optional[tuple]:
+        # Every write appends a new version, so its location identifies it
+        state = self._collections[collection]
+        with state.lock:
+            return state.index.get(record_id)
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict]:
+        state = self._collections[collection]
+        with state.lock:
+            location = state.index.get(record_id)
+            if location is None:
+                return None
+            segment, offset, length = location
+            fd = state.readers[segment]
+        return self._decode(os.pread(fd, length, offset))
+
+    def put(self, collection: str, record_id: str, record: Dict) -> None:
+        state = self._collections[collection]
+        line = self._encode(record_id, record)
+        with state.lock:
+            self._append(state, [(record_id, line)])
+
+    def put_many(self, collection: str, records: Iterable[Dict]) -> int:
+        state = self._collections[collection]
+        id_field = ID_FIELDS[collection]
+        lines = [(record[id_field], self._encode(record[id_field], record)) for record in records]
+        with state.lock:
+            self._append(state, lines)
+        return len(lines)
+
+    def insert(self, collection: str, record_id: str, record: Dict) -> None:
+        self.insert_many(collection, [record])
+
+    def insert_many(self, collection: str, records: Iterable[Dict]) -> int:
+        # Every ID is checked before anything is appended
+        state = self._collections[collection]
+        id_field = ID_FIELDS[collection]
+        lines = [(record[id_field], self._encode(record[id_field], record)) for record in records]
+        with state.lock:
+            seen = set()
+            for record_id, _ in lines:
+                if record_id in state.index or record_id in seen:
+                    raise RecordExistsError(collection, record_id)
+                seen.add(record_id)
+            self._append(state, lines)
+        return len(lines)
+
+    def scan(self, collection: str) -> Iterator[Dict]:
+        """Iterate over every record as of the start of the scan
+
+        Records are yielded in journal order. A record updated while the scan
+        runs is yielded once, in the version it had when the scan started.
+        """
+        state = self._collections[collection]
+        with state.lock:
+            # Each scan reads through its own file objects, opened while the
+            # segment files are known to exist
+            segments = [(segment, open(state.path(segment), "rb", buffering=1024 * 1024))
+                        for segment in sorted(state.readers)]
+            snapshot_end = (state.active, state.active_size)
+            state.scans += 1
+
+        # Versions written before the scan started, for records updated since
+        updated = {}
+        try:
+            for segment, f in segments:
+                end = snapshot_end[1] if segment == snapshot_end[0] else os.fstat(f.fileno()).st_size
+                offset = 0
+                with f:
+                    while offset < end:
+                        line = f.readline()
+                        if not line:
+                            break
+                        record_id = line[:line.index(b"\t")].decode()
+                        location = state.index.get(record_id)
+                        if location[:2] == (segment, offset):
+                            yield self._decode(line)
+                        elif location[:2] >= snapshot_end:
+                            updated[record_id] = line
+                        offset += len(line)
+            for line in updated.values():
+                yield self._decode(line)
+        finally:
+            for _, f in segments:
+                f.close()
+            with state.lock:
+                state.scans -= 1
+                self._maybe_compact(state)
+
+    def changed_since(self, collection: str, since: float) -> Iterator[Dict]:
+        """Iterate over records whose latest version is in a segment written after since
+
+        Segments are only ever appended to, so one last modified before
+        since holds no newer versions and is skipped. Compaction rewrites
+        every record into new segments, after which every record is yielded.
+        """
+        state = self._collections[collection]
+        with state.lock:
+            recent = {segment: fd for segment, fd in state.readers.items() if os.fstat(fd).st_mtime >= since}
+            locations = sorted(
+                (segment, offset, length) for segment, offset, length in state.index.values() if segment in recent
+            )
+        for segment, offset, length in locations:
+            yield self._decode(os.pread(recent[segment], length, offset))
+
+    def count(self, collection: str) -> int:
+        return len(self._collections[collection].index)
+
+    def stats(self) -> Dict[str, Dict]:
+        """Return record, segment and byte counts per collection"""
+        stats = {}
+        for collection, state in self._collections.items():
+            with state.lock:
+                stats[collection] = {
+                    "records": len(state.index),
+                    "segments": len(state.readers),
+                    "bytes": state.total_bytes,
+                    "live_bytes": state.live_bytes
+                }
+        return stats
+
+    def close(self) -> None:
+        for state in self._collections.values():
+            with state.lock:
+                os.close(state.active_fd)
+                for fd in list(state.readers.values()) + state.retired:
+                    os.close(fd)
+                state.readers = {}
+                state.retired = []
+        if self._lock_fd is not None:
+            os.close(self._lock_fd)
+            self._lock_fd = None
@@ -0,0 +1,94 @@
+from typing import Callable, Dict, Iterator, List
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+
+
+class ParallelLoader:
+    """Reads record files on a thread pool
+
+    File reads are handed to worker threads in batches, so that on a cold
+    page cache many reads wait on the disk at once instead of one after
+    another. At most prefetch files are read ahead of the consumer, which
+    bounds memory however many files there are. Records are yielded in the
+    order of the paths as a generator, so report accumulators consume them
+    while later files are still being read.
+
+    Scans of at least log_min_files files print their read rate.
+    """
+
+    def __init__(self, workers: int = 8, prefetch: int = 512, batch_size: int = 32,
+                 log_min_files: int = 1000):
+        """Initialize the loader
+
+        Args:
+            workers: Reader threads; 1 or less reads files on the calling thread
+            prefetch: Maximum number of files read ahead of the consumer
+            batch_size: Files read per task handed to a worker
+            log_min_files: Smallest scan whose read rate is logged; 0 disables logging
+        """
+        self.workers = workers
+        self.prefetch = max(prefetch, batch_size)
+        self.batch_size = batch_size
+        self.log_min_files = log_min_files
+        self._reset()
+        # A forked gunicorn worker cannot use the parent's threads
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="loader")
+            return self._executor
+
+    def load_paths(self, paths: List[str], label: str, parse: Callable[[str], Dict]) -> Iterator[Dict]:
+        """Yield the parsed contents of the given files, in order
+
+        Args:
+            paths: Files to read
+            label: Name for the files in the log line
+            parse: Reads and parses one file given its path
+        """
+        start = time.perf_counter()
+        if self.workers <= 1 or len(paths) <= self.batch_size:
+            for path in paths:
+                yield parse(path)
+        else:
+            yield from self._load_parallel(paths, parse)
+        self._log(label, len(paths), time.perf_counter() - start)
+
+    def _load_parallel(self, paths: List[str], parse: Callable[[str], Dict]) -> Iterator[Dict]:
+        pool = self._pool()
+        batches = (paths[i:i + self.batch_size] for i in range(0, len(paths), self.batch_size))
+        in_flight = deque()
+        max_in_flight = self.prefetch // self.batch_size
+        try:
+            for batch in batches:
+                in_flight.append(pool.submit(lambda batch=batch: [parse(path) for path in batch]))
+                if len(in_flight) >= max_in_flight:
+                    yield from in_flight.popleft().result()
+            while in_flight:
+                yield from in_flight.popleft().result()
+        finally:
+            # The consumer stopped early; drop reads that have not started
+            for future in in_flight:
+                future.cancel()
+
+    def _log(self, label: str, files: int, elapsed: float) -> None:
+        if self.log_min_files and files >= self.log_min_files:
+            rate = files / elapsed if elapsed else float("inf")
+            print(f"Loaded {files} files from {label} in {elapsed:.2f}s "
+                  f"({rate:.0f} files/s, {self.workers} workers)")
+
+    def close(self) -> None:
+        """Stop the reader threads"""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False)
+                self._executor = None
@@ -0,0 +1,134 @@
+import argparse
+import json
+import os
+import time
+from serializers import get_serializer
+from storage import JsonFileStorage, SqliteStorage, migrate
+
+
+def migrate_command(args):
+    """Import the JSON file tree into the SQLite or journal backend"""
+    source = JsonFileStorage(args.data_dir)
+    if args.to == "journal":
+        from journal import JournalStorage
+        target = JournalStorage(args.data_dir)
+        location = os.path.join(args.data_dir, "journal")
+    else:
+        target = SqliteStorage(args.db or os.path.join(args.data_dir, "billing.db"))
+        location = target.db_path
+
+    start = time.time()
+    copied = migrate(source, target, batch_size=args.batch_size)
+    elapsed = time.time() - start
+
+    for collection, count in copied.items():
+        print(f"Imported {count} {collection}")
+    target.close()
+    print(f"Migration finished in {elapsed:.2f}s -> {location}")
+    print(f"Set STORAGE_BACKEND={args.to} to serve from the migrated data")
+
+
+def compact_command(args):
+    """Rewrite the journal without superseded record versions"""
+    from journal import JournalStorage
+
+    storage = JournalStorage(args.data_dir)
+    before = storage.stats()
+    start = time.time()
+    after = storage.compact()
+    storage.close()
+
+    for collection, size in after.items():
+        print(f"{collection}: {before[collection]['bytes']} -> {size} bytes "
+              f"({before[collection]['records']} records)")
+    print(f"Compaction finished in {time.time() - start:.2f}s")
+
+
+def reshard_command(args):
+    """Move JSON record files into the flat or sharded directory layout"""
+    storage = JsonFileStorage(args.data_dir, layout=args.layout, serializer=get_serializer(args.format))
+    start = time.time()
+    for collection in ("invoices", "payments"):
+        moved = storage.relocate(collection)
+        print(f"Moved {moved} {collection} into the {args.layout} layout")
+    print(f"Resharding finished in {time.time() - start:.2f}s")
+    print(f"Set JSON_LAYOUT={args.layout} if the server is not already using it")
+
+
+def convert_command(args):
+    """Rewrite record files in another format"""
+    storage = JsonFileStorage(args.data_dir, layout=args.layout, serializer=get_serializer(args.to))
+    start = time.time()
+    for collection in ("invoices", "payments"):
+        moved = storage.relocate(collection)
+        print(f"Converted {moved} {collection} to {args.to}")
+    print(f"Conversion finished in {time.time() - start:.2f}s")
+    print(f"Set RECORD_FORMAT={args.to} if the server is not already using it")
+
+
+def import_payments_command(args):
+    """Import a CSV or NDJSON payment export"""
+    from database import BillingDatabase
+    from payment_import import read_rows, import_payments
+
+    fmt = args.format or ("csv" if args.file.lower().endswith(".csv") else "ndjson")
+    # Confirmation emails are spooled for the server to send: delivery threads
+    # in this short-lived process would die holding their claimed messages
+    db = BillingDatabase(args.data_dir, deliver_email=False)
+    with open(args.file, "r", newline="", encoding="utf-8") as f:
+        summary = import_payments(db, read_rows(f, fmt), chunk_size=args.chunk_size)
+
+    print(f"Imported {summary['imported']} of {summary['rows']} payments "
+          f"in {summary['seconds']:.2f}s ({summary['rows_per_second']:.0f} rows/s)")
+    print(f"Marked {summary['invoices_paid']} invoices as paid")
+    if summary["rejected_count"]:
+        print(f"Rejected {summary['rejected_count']} rows:")
+        for rejection in summary["rejected"]:
+            print(f"  line {rejection['line']}: {'; '.join(rejection['errors'])}")
+    if args.json:
+        print(json.dumps(summary, indent=2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ChromaInvoice maintenance commands")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = subparsers.add_parser("migrate", help="Import data/invoices and data/payments into SQLite or the journal")
+    migrate_parser.add_argument("--data-dir", default="data", help="Data directory holding the JSON records")
+    migrate_parser.add_argument("--to", choices=["sqlite", "journal"], default="sqlite", help="Target backend")
+    migrate_parser.add_argument("--db", help="SQLite database path (default: <data-dir>/billing.db)")
+    migrate_parser.add_argument("--batch-size", type=int, default=500, help="Records written per transaction")
+    migrate_parser.set_defaults(func=migrate_command)
+
+    compact_parser = subparsers.add_parser("compact", help="Compact the journal storage (stop the server first)")
+    compact_parser.add_argument("--data-dir", default="data", help="Data directory holding the journal")
+    compact_parser.set_defaults(func=compact_command)
+
+    reshard_parser = subparsers.add_parser("reshard", help="Move JSON records between the flat and sharded layouts (safe while serving)")
+    reshard_parser.add_argument("--data-dir", default="data", help="Data directory holding the JSON records")
+    reshard_parser.add_argument("--layout", choices=["flat", "sharded"], default="sharded", help="Target layout")
+    reshard_parser.add_argument("--format", choices=["json", "msgpack"], default=os.getenv("RECORD_FORMAT", "json"),
+                                help="Record format to keep (default: RECORD_FORMAT)")
+    reshard_parser.set_defaults(func=reshard_command)
+
+    convert_parser = subparsers.add_parser("convert", help="Convert record files between JSON and MessagePack (safe while serving)")
+    convert_parser.add_argument("--data-dir", default="data", help="Data directory holding the records")
+    convert_parser.add_argument("--to", choices=["json", "msgpack"], required=True, help="Target record format")
+    convert_parser.add_argument("--layout", choices=["flat", "sharded"], default=os.getenv("JSON_LAYOUT", "flat"),
+                                help="Directory layout to keep (default: JSON_LAYOUT)")
+    convert_parser.set_defaults(func=convert_command)
+
+    import_parser = subparsers.add_parser("import-payments", help="Import a CSV or NDJSON payment export")
+    import_parser.add_argument("file", help="Export file (.csv with a header row, or .ndjson)")
+    import_parser.add_argument("--format", choices=["csv", "ndjson"], help="File format (default: from the extension)")
+    import_parser.add_argument("--data-dir", default="data", help="Data directory")
+    import_parser.add_argument("--chunk-size", type=int, default=500, help="Payments written per batch")
+    import_parser.add_argument("--json", action="store_true", help="Also print the summary as JSON")
+    import_parser.set_defaults(func=import_payments_command)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
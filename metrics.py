@@ -0,0 +1,391 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from bisect import bisect_left
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond cache hits to slow reports
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The Flask application's logger (app.logger), also used under the ASGI server
+logger = logging.getLogger("app")
+
+_HEADER = struct.Struct("<Q")
+_LENGTH = struct.Struct("<I")
+_VALUE = struct.Struct("<d")
+
+
+class ValueFile:
+    """This process's metric values, in a memory-mapped file shared with the scraper
+
+    Each gunicorn worker writes its own file, <directory>/<pid>.db: a used
+    length followed by (key length, key, value) entries, values aligned to 8
+    bytes. Updating a value is a write into the mapping, with no system call,
+    and whichever worker answers a scrape reads every worker's file. A
+    process opening its file takes over the values of processes that have
+    exited, so totals keep growing when gunicorn replaces a worker.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, directory: str):
+        """Initialize the file; it is created on the first update
+
+        Args:
+            directory: Directory shared by the processes of one deployment; may
+                be set until the first update
+        """
+        self.directory = directory
+        self._reset()
+        # A forked gunicorn worker writes a file of its own
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self) -> None:
+        self._mmap = None
+        self._file = None
+        self._offsets: Dict[str, int] = {}
+        self._used = _HEADER.size
+        self._lock = threading.Lock()
+
+    def _open(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        self._file = open(os.path.join(self.directory, f"{os.getpid()}.db"), "w+b")
+        self._file.truncate(self.INITIAL_SIZE)
+        self._mmap = mmap.mmap(self._file.fileno(), self.INITIAL_SIZE)
+        _HEADER.pack_into(self._mmap, 0, self._used)
+        for filename in os.listdir(self.directory):
+            pid = filename[:-len(".db")]
+            if not (filename.endswith(".db") and pid.isdigit()) or _alive(int(pid)):
+                continue
+            # Only the process that manages to rename the file merges it
+            path = os.path.join(self.directory, filename)
+            claimed = f"{path}.{os.getpid()}"
+            try:
+                os.rename(path, claimed)
+            except FileNotFoundError:
+                continue
+            with open(claimed, "rb") as f:
+                data = f.read()
+            for key, value in _entries(data):
+                offset = self._offset(key)
+                _VALUE.pack_into(self._mmap, offset, _VALUE.unpack_from(self._mmap, offset)[0] + value)
+            os.remove(claimed)
+
+    def _offset(self, key: str) -> int:
+        """Offset of the value for key, adding an entry if needed; caller holds the lock"""
+        offset = self._offsets.get(key)
+        if offset is not None:
+            return offset
+        if self._mmap is None:
+            self._open()
+        encoded = key.encode()
+        padded = len(encoded) + (-(_LENGTH.size + len(encoded)) % 8)
+        size = _LENGTH.size + padded + _VALUE.size
+        if self._used + size > len(self._mmap):
+            capacity = max(len(self._mmap) * 2, self._used + size)
+            self._file.truncate(capacity)
+            self._mmap.close()
+            self._mmap = mmap.mmap(self._file.fileno(), capacity)
+        start = self._used
+        _LENGTH.pack_into(self._mmap, start, len(encoded))
+        self._mmap[start + _LENGTH.size:start + _LENGTH.size + len(encoded)] = encoded
+        offset = start + _LENGTH.size + padded
+        _VALUE.pack_into(self._mmap, offset, 0.0)
+        self._used += size
+        # Readers only look at entries below the used length
+        _HEADER.pack_into(self._mmap, 0, self._used)
+        self._offsets[key] = offset
+        return offset
+
+    def add(self, increments: Sequence[Tuple[str, float]]) -> None:
+        """Add amounts to several values at once"""
+        with self._lock:
+            for key, amount in increments:
+                offset = self._offset(key)
+                _VALUE.pack_into(self._mmap, offset, _VALUE.unpack_from(self._mmap, offset)[0] + amount)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _entries(data: bytes) -> Iterator[Tuple[str, float]]:
+    """(key, value) pairs of a value file's contents"""
+    if len(data) < _HEADER.size:
+        return
+    used = min(_HEADER.unpack_from(data, 0)[0], len(data))
+    position = _HEADER.size
+    while position + _LENGTH.size <= used:
+        length = _LENGTH.unpack_from(data, position)[0]
+        key = data[position + _LENGTH.size:position + _LENGTH.size + length].decode()
+        position += _LENGTH.size + length + (-(_LENGTH.size + length) % 8)
+        yield key, _VALUE.unpack_from(data, position)[0]
+        position += _VALUE.size
+
+
+def read_values(directory: str) -> Dict[str, float]:
+    """Sum the values of every process's file in directory, by key"""
+    totals: Dict[str, float] = {}
+    try:
+        filenames = [f for f in os.listdir(directory) if f.endswith(".db")]
+    except FileNotFoundError:
+        return totals
+    for filename in filenames:
+        try:
+            with open(os.path.join(directory, filename), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        for key, value in _entries(data):
+            totals[key] = totals.get(key, 0.0) + value
+    return totals
+
+
+def _key(sample: str, labels: Sequence[Tuple[str, str]]) -> str:
+    return json.dumps([sample, [list(pair) for pair in labels]], separators=(",", ":"))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Sequence[Tuple[str, str]]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class Metric:
+    """A named metric family with fixed label names"""
+
+    kind = None
+
+    def __init__(self, registry: "Registry", name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values) -> object:
+        """The child for one combination of label values"""
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child(tuple(zip(self.labelnames, map(str, values)))))
+        return child
+
+    def _child(self, labels: Tuple[Tuple[str, str], ...]) -> object:
+        raise NotImplementedError("Metrics must implement _child()")
+
+    def samples(self, values: Dict[str, List[Tuple[list, float]]]) -> List[str]:
+        """Exposition lines for this metric
+
+        Args:
+            values: (labels, summed value) pairs by sample name
+        """
+        raise NotImplementedError("Metrics must implement samples()")
+
+
+class _CounterChild:
+    def __init__(self, registry: "Registry", key: str):
+        self._registry = registry
+        self._key = key
+
+    def inc(self, amount: float = 1.0) -> None:
+        if self._registry.enabled:
+            self._registry.values.add(((self._key, amount),))
+
+
+class Counter(Metric):
+    """A monotonically increasing count, summed over processes"""
+
+    kind = "counter"
+
+    def _child(self, labels):
+        return _CounterChild(self.registry, _key(self.name, labels))
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def samples(self, values):
+        return [f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+                for labels, value in values.get(self.name, ())]
+
+
+class _HistogramChild:
+    def __init__(self, registry: "Registry", buckets: Tuple[float, ...], bucket_keys: List[str],
+                 sum_key: str, count_key: str):
+        self._registry = registry
+        self._buckets = buckets
+        self._bucket_keys = bucket_keys
+        self._sum_key = sum_key
+        self._count_key = count_key
+
+    def observe(self, value: float) -> None:
+        if self._registry.enabled:
+            # Buckets are stored per bucket and made cumulative when scraped
+            bucket = self._bucket_keys[bisect_left(self._buckets, value)]
+            self._registry.values.add(((bucket, 1.0), (self._sum_key, value), (self._count_key, 1.0)))
+
+    def time(self) -> "_Timer":
+        """Context manager observing the seconds its block takes"""
+        return _Timer(self.observe)
+
+
+class _Timer:
+    def __init__(self, observe: Callable[[float], None]):
+        self._observe = observe
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._observe(time.perf_counter() - self._start)
+
+
+class Histogram(Metric):
+    """Observations counted into latency buckets, summed over processes"""
+
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def _child(self, labels):
+        bucket_keys = [_key(f"{self.name}_bucket", labels + (("le", _format_value(le)),)) for le in self.buckets]
+        return _HistogramChild(self.registry, self.buckets, bucket_keys,
+                               _key(f"{self.name}_sum", labels), _key(f"{self.name}_count", labels))
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def samples(self, values):
+        series: Dict[str, Dict] = {}
+        for suffix in ("_bucket", "_sum", "_count"):
+            for labels, value in values.get(self.name + suffix, ()):
+                base = [pair for pair in labels if pair[0] != "le"]
+                entry = series.setdefault(json.dumps(base), {"labels": base, "buckets": {}, "sum": 0.0, "count": 0.0})
+                if suffix == "_bucket":
+                    entry["buckets"][float(dict(labels)["le"])] = value
+                else:
+                    entry[suffix[1:]] = value
+        lines = []
+        for entry in series.values():
+            cumulative = 0.0
+            for le in self.buckets:
+                cumulative += entry["buckets"].get(le, 0.0)
+                labels = entry["labels"] + [["le", _format_value(le)]]
+                lines.append(f"{self.name}_bucket{_format_labels(labels)} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(entry['labels'])} {_format_value(entry['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(entry['labels'])} {_format_value(entry['count'])}")
+        return lines
+
+
+class Gauge(Metric):
+    """A current value, read from a callback when scraped
+
+    The callback runs in the process answering the scrape and returns
+    (label values, value) pairs, so gauges suit state every worker can see,
+    such as the shared email outbox.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, registry, name, documentation, labelnames=(),
+                 collect: Callable[[], Iterable[Tuple[tuple, float]]] = None):
+        super().__init__(registry, name, documentation, labelnames)
+        self.collect = collect
+
+    def samples(self, values):
+        lines = []
+        for label_values, value in self.collect() or ():
+            labels = list(zip(self.labelnames, map(str, label_values)))
+            lines.append(f"{self.name}{_format_labels(labels)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """The metrics of the application and their exposition
+
+    Disabled by METRICS=false, which makes every update return immediately.
+    Values live in METRICS_DIR (default data/metrics), which every worker of
+    a deployment must share.
+    """
+
+    def __init__(self):
+        self._enabled = None
+        self.values = ValueFile(None)
+        self._metrics: List[Metric] = []
+
+    @property
+    def enabled(self) -> bool:
+        # Read on first use, after the application has loaded its .env file
+        if self._enabled is None:
+            self.values.directory = os.getenv("METRICS_DIR", os.path.join("data", "metrics"))
+            self._enabled = os.getenv("METRICS", "true").lower() == "true"
+        return self._enabled
+
+    def _register(self, metric: Metric) -> Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+              collect: Callable[[], Iterable[Tuple[tuple, float]]] = None) -> Gauge:
+        return self._register(Gauge(self, name, documentation, labelnames, collect))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        if not self.enabled:
+            return ""
+        values: Dict[str, List[Tuple[list, float]]] = {}
+        for key, value in read_values(self.values.directory).items():
+            sample, labels = json.loads(key)
+            values.setdefault(sample, []).append((labels, value))
+        lines = []
+        for metric in self._metrics:
+            try:
+                samples = metric.samples(values)
+            except Exception:
+                logger.exception("Error collecting metric %s", metric.name)
+                continue
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+        return "\n".join(lines) + "\n"
+
+
+# Registry shared by the whole process
+REGISTRY = Registry()
+
+# Content type of the text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
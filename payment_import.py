@@ -0,0 +1,123 @@
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+import csv
+import json
+import time
+
+# Payment fields taken from each imported row; other columns are ignored
+IMPORT_FIELDS = ["invoice_id", "amount", "payment_method", "recorded_at"]
+
+# Rejected rows listed in the import summary; the rest are only counted
+MAX_REPORTED_REJECTIONS = 1000
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Optional[Dict], Optional[str]]]:
+    """Read a CSV or NDJSON payment export one row at a time
+
+    Args:
+        stream: Text stream positioned at the start of the export
+        fmt: "csv" (with a header row) or "ndjson"
+
+    Yields:
+        (line number, row dict or None, parse error or None)
+    """
+    if fmt == "csv":
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row, None
+    elif fmt == "ndjson":
+        for line_number, line in enumerate(stream, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line), None
+            except ValueError as e:
+                yield line_number, None, f"Invalid JSON: {str(e)}"
+    else:
+        raise ValueError(f"Unsupported import format: {fmt}")
+
+
+def _parse_amount(value) -> float:
+    """Parse an amount that may arrive as text from a bank export"""
+    if isinstance(value, str):
+        value = value.strip().replace(",", "").lstrip("$")
+        return float(value) if "." in value else int(value)
+    return value
+
+
+def parse_rows(rows: Iterable[Tuple[int, Optional[Dict], Optional[str]]], db) -> Iterator[Tuple[int, Optional[Dict], List[str]]]:
+    """Turn raw rows into payment dicts, validating each one
+
+    Yields:
+        (line number, payment dict or None, list of errors)
+    """
+    for line_number, row, error in rows:
+        if error:
+            yield line_number, None, [error]
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, ["Row must be an object"]
+            continue
+
+        payment = {field: row[field] for field in IMPORT_FIELDS if row.get(field) not in (None, "")}
+        if "amount" in payment:
+            try:
+                payment["amount"] = _parse_amount(payment["amount"])
+            except ValueError:
+                yield line_number, None, [f"Invalid amount: {row['amount']}"]
+                continue
+
+        errors = db.validate_payment(payment)
+        yield line_number, (None if errors else payment), errors
+
+
+def import_payments(db, rows: Iterable[Tuple[int, Optional[Dict], Optional[str]]], chunk_size: int = 500) -> Dict:
+    """Stream payment rows into the database in bounded chunks
+
+    Invoices are loaded once into a compact lookup map, so rows are matched
+    without reading an invoice per row, and memory stays bounded by the chunk
+    size rather than the size of the export. Rows that fail validation or
+    reference an unknown invoice are rejected without stopping the import.
+
+    Args:
+        db: BillingDatabase to import into
+        rows: Rows from read_rows()
+        chunk_size: Payments written per bulk storage operation
+
+    Returns:
+        Dict with row counts, rejected rows, invoices marked paid and throughput
+    """
+    start = time.perf_counter()
+    invoices = db.invoice_summaries()
+    summary = {
+        "rows": 0,
+        "imported": 0,
+        "rejected_count": 0,
+        "rejected": [],
+        "invoices_paid": 0
+    }
+
+    chunk = []
+    for line_number, payment, errors in parse_rows(rows, db):
+        summary["rows"] += 1
+        if not errors and payment["invoice_id"] not in invoices:
+            errors = [f"Unknown invoice: {payment['invoice_id']}"]
+        if errors:
+            summary["rejected_count"] += 1
+            if len(summary["rejected"]) < MAX_REPORTED_REJECTIONS:
+                summary["rejected"].append({"line": line_number, "errors": errors})
+            continue
+
+        chunk.append(payment)
+        if len(chunk) >= chunk_size:
+            summary["invoices_paid"] += db.record_payments(chunk, invoices)
+            summary["imported"] += len(chunk)
+            chunk = []
+
+    if chunk:
+        summary["invoices_paid"] += db.record_payments(chunk, invoices)
+        summary["imported"] += len(chunk)
+
+    elapsed = time.perf_counter() - start
+    summary["seconds"] = round(elapsed, 3)
+    summary["rows_per_second"] = round(summary["rows"] / elapsed, 1) if elapsed > 0 else 0
+    return summary
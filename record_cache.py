@@ -0,0 +1,103 @@
+from typing import Dict, NamedTuple, Optional
+from collections import OrderedDict
+from datetime import datetime, timezone
+import hashlib
+import json
+import threading
+from metrics import REGISTRY
+from storage import StorageBackend
+
+RECORD_CACHE_REQUESTS = REGISTRY.counter(
+    "billing_record_cache_requests_total", "Records served from the record cache or read from storage",
+    ["collection", "result"])
+
+
+class CachedRecord(NamedTuple):
+    """A parsed record with the validators served alongside it"""
+    record: Dict
+    version: tuple
+    etag: str
+    last_modified: Optional[datetime]
+
+
+def record_etag(record: Dict) -> str:
+    """Entity tag derived from a record's content"""
+    return hashlib.sha1(json.dumps(record, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def record_last_modified(record: Dict) -> Optional[datetime]:
+    """Time of a record's last change, from its updated_at or created_at field"""
+    value = record.get("updated_at") or record.get("created_at")
+    try:
+        # Stored times are local; HTTP dates are UTC
+        return datetime.fromisoformat(value).astimezone(timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+class RecordCache:
+    """Bounded least-recently-used cache of parsed records from one collection
+
+    Every lookup asks the storage backend for the record's current version
+    (for JSON files, the file's mtime, size and inode) and only serves the
+    cached copy when it still matches, so records rewritten by another process
+    are reloaded. Writes made through this process should also call
+    invalidate() so the next lookup does not depend on mtime resolution.
+
+    Cached records are shared between callers and must not be modified.
+    """
+
+    def __init__(self, storage: StorageBackend, collection: str, max_entries: int = 10000):
+        """Initialize the cache
+
+        Args:
+            storage: Backend the records are read from; must support version()
+            collection: Collection the cached records belong to
+            max_entries: Maximum number of cached records
+        """
+        self.storage = storage
+        self.collection = collection
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedRecord]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = RECORD_CACHE_REQUESTS.labels(collection, "hit")
+        self._misses = RECORD_CACHE_REQUESTS.labels(collection, "miss")
+
+    def get(self, record_id: str) -> Optional[CachedRecord]:
+        """Return the current record and its validators, or None if it does not exist"""
+        version = self.storage.version(self.collection, record_id)
+        if version is None:
+            self.invalidate(record_id)
+            return None
+
+        with self._lock:
+            entry = self._entries.get(record_id)
+            if entry is not None and entry.version == version:
+                self._entries.move_to_end(record_id)
+                self._hits.inc()
+                return entry
+        self._misses.inc()
+
+        # The version is taken before reading, so a write racing with this
+        # read leaves an entry that fails validation on the next lookup
+        record = self.storage.get(self.collection, record_id)
+        if record is None:
+            self.invalidate(record_id)
+            return None
+        entry = CachedRecord(record, version, record_etag(record), record_last_modified(record))
+        with self._lock:
+            self._entries[record_id] = entry
+            self._entries.move_to_end(record_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, record_id: str) -> None:
+        """Forget a record after it was written"""
+        with self._lock:
+            self._entries.pop(record_id, None)
+
+    def clear(self) -> None:
+        """Forget every record"""
+        with self._lock:
+            self._entries.clear()
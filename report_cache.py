@@ -0,0 +1,104 @@
+from typing import Any, Dict, Hashable, Optional
+from collections import OrderedDict
+import itertools
+import threading
+
+# Items of a list or dict measured by estimate_size; larger ones are
+# extrapolated from these
+SIZE_SAMPLE = 16
+
+
+def estimate_size(value: Any) -> int:
+    """Estimate the length of value encoded as JSON, without encoding it
+
+    Strings and numbers are measured directly. Lists, sets and dicts with
+    more than SIZE_SAMPLE items are measured from their first SIZE_SAMPLE
+    items, scaled by their length, so the cost does not grow with the
+    number of rows in a report.
+    """
+    if isinstance(value, str):
+        return len(value) + 2
+    if isinstance(value, dict):
+        count = len(value)
+        sample = itertools.islice(value.items(), SIZE_SAMPLE)
+        measured = sum(len(str(key)) + 4 + estimate_size(item) for key, item in sample)
+    elif isinstance(value, (list, tuple, set, frozenset)):
+        count = len(value)
+        measured = sum(estimate_size(item) + 1 for item in itertools.islice(value, SIZE_SAMPLE))
+    else:
+        # Numbers, booleans and None
+        return 8
+    return 2 + (measured * count // min(count, SIZE_SAMPLE) if count else 0)
+
+
+class ReportCache:
+    """Least-recently-used cache of generated reports
+
+    Each entry remembers the data generation it was built from. Writes to
+    invoices or payments advance the generation, so a lookup only returns an
+    entry built from the current data; older entries are dropped as they are
+    found. Entries are evicted least recently used first once the cache holds
+    more than max_entries reports or more than max_bytes of report JSON, as
+    estimated by estimate_size.
+    """
+
+    def __init__(self, max_entries: int = 64, max_bytes: int = 64 * 1024 * 1024):
+        """Initialize the cache
+
+        Args:
+            max_entries: Maximum number of cached reports
+            max_bytes: Maximum total size of the cached reports, estimated as JSON
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, generation: int) -> Optional[Dict]:
+        """Return the cached report for key if it was built at this generation"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != generation:
+                if entry is not None:
+                    self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, generation: int, report: Dict) -> None:
+        """Cache a report built from the given data generation"""
+        size = estimate_size(report)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._discard(key)
+            self._entries[key] = (generation, report, size)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._discard(next(iter(self._entries)))
+
+    def _discard(self, key: Hashable) -> None:
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self) -> None:
+        """Drop every cached report"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict:
+        """Return entry count, size and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
@@ -0,0 +1,534 @@
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime
+from collections import defaultdict
+from storage import COLLECTIONS, StorageBackend
+
+# Report types in the order they are listed by the API
+REPORT_TYPES = ["revenue", "outstanding", "client_analysis", "service_metrics", "payment_trends"]
+
+
+class ReportAccumulator:
+    """Builds one report incrementally from a stream of records
+
+    Records are fed one at a time through add(), which routes invoices and
+    payments to add_invoice() and add_payment(). Each accumulator applies its
+    own period filter, so several accumulators can share a single pass over
+    storage. finish() returns the report data.
+
+    With stream_rows set, the per-record detail rows of a report (row_fields)
+    are collected in self.rows for the caller to drain as they are produced,
+    and finish() returns only the summary totals.
+
+    Payment reports that need invoice attributes list them in join_fields and
+    look invoices up with lookup_invoice(), which reads from the InvoiceJoin
+    table built during the invoice pass instead of loading each invoice.
+    """
+
+    report_type = None
+    collections = ()
+    row_fields = ()
+    join_fields = ()
+    # Set by reports computed relative to the current time, which the report
+    # cache and entity tags then only reuse on the day they were built
+    depends_on_now = False
+
+    def __init__(self, start_date: datetime, end_date: datetime,
+                 get_invoice: Callable[[str], Optional[Dict]] = None, stream_rows: bool = False):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.get_invoice = get_invoice
+        self.stream_rows = stream_rows
+        self.rows: List[Dict] = []
+        self.join: Optional[InvoiceJoin] = None
+
+    def query(self, collection: str) -> Dict:
+        """Storage filters that narrow the records this accumulator needs"""
+        return {}
+
+    def add(self, record: Dict) -> None:
+        """Feed an invoice or payment record"""
+        if "payment_id" in record:
+            self.add_payment(record)
+        else:
+            self.add_invoice(record)
+
+    def add_invoice(self, invoice: Dict) -> None:
+        pass
+
+    def add_payment(self, payment: Dict) -> None:
+        pass
+
+    def finish(self) -> Dict:
+        """Return the completed report data"""
+        raise NotImplementedError("Report accumulators must implement finish()")
+
+    def lookup_invoice(self, invoice_id: str) -> Optional[Dict]:
+        """Return the joined invoice attributes (join_fields) for a payment's invoice"""
+        if self.join is not None:
+            return self.join.get(invoice_id)
+        return self.get_invoice(invoice_id) if self.get_invoice else None
+
+    def _in_period(self, value: datetime) -> bool:
+        return self.start_date <= value <= self.end_date
+
+
+class InvoiceJoin:
+    """Invoice attributes needed by payment reports, loaded in one pass
+
+    Fed every invoice during the invoice pass, it keeps only the requested
+    fields as a tuple per invoice ID, so joining payments to their invoices
+    is a dict lookup rather than a storage read per payment. Invoices missing
+    from the table (created after the pass) fall back to get_invoice.
+    """
+
+    collections = ("invoices",)
+
+    def __init__(self, fields: Iterable[str], get_invoice: Callable[[str], Optional[Dict]] = None):
+        self.fields = tuple(fields)
+        self.get_invoice = get_invoice
+        self.table: Dict[str, tuple] = {}
+
+    def query(self, collection: str) -> Dict:
+        # Payments in the period can belong to invoices from any period
+        return {}
+
+    def add(self, invoice: Dict) -> None:
+        self.table[invoice["invoice_id"]] = tuple(invoice.get(field) for field in self.fields)
+
+    def get(self, invoice_id: str) -> Optional[Dict]:
+        values = self.table.get(invoice_id)
+        if values is None:
+            return self.get_invoice(invoice_id) if self.get_invoice else None
+        return dict(zip(self.fields, values))
+
+
+class RevenueAccumulator(ReportAccumulator):
+    """Detailed revenue report"""
+
+    report_type = "revenue"
+    collections = ("payments",)
+    row_fields = ("payment_id", "invoice_id", "amount", "payment_method", "recorded_at")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.total_revenue = 0
+        self.paid_invoices_count = 0
+        self.paid_invoices = []
+        self.monthly_revenue = defaultdict(float)
+        self.payment_methods = defaultdict(float)
+
+    def query(self, collection: str) -> Dict:
+        return {"start": self.start_date, "end": self.end_date}
+
+    def add_payment(self, payment: Dict) -> None:
+        payment_date = datetime.fromisoformat(payment["recorded_at"])
+        if not self._in_period(payment_date):
+            return
+        amount = payment["amount"]
+        self.total_revenue += amount
+        self.paid_invoices_count += 1
+        if self.stream_rows:
+            self.rows.append({
+                "payment_id": payment["payment_id"],
+                "invoice_id": payment["invoice_id"],
+                "amount": amount,
+                "payment_method": payment.get("payment_method") or "unknown",
+                "recorded_at": payment["recorded_at"]
+            })
+        else:
+            self.paid_invoices.append(payment["invoice_id"])
+
+        # Track monthly revenue
+        month_key = payment_date.strftime("%Y-%m")
+        self.monthly_revenue[month_key] += amount
+
+        # Track payment methods
+        self.payment_methods[payment.get("payment_method") or "unknown"] += amount
+
+    def finish(self) -> Dict:
+        report = {
+            "total_revenue": self.total_revenue,
+            "paid_invoices_count": self.paid_invoices_count,
+            "paid_invoices": self.paid_invoices,
+            "monthly_breakdown": dict(self.monthly_revenue),
+            "payment_methods": dict(self.payment_methods),
+            "average_monthly_revenue": self.total_revenue / len(self.monthly_revenue) if self.monthly_revenue else 0
+        }
+        if self.stream_rows:
+            del report["paid_invoices"]
+        return report
+
+
+class OutstandingAccumulator(ReportAccumulator):
+    """Report on outstanding invoices"""
+
+    report_type = "outstanding"
+    collections = ("invoices",)
+    row_fields = ("invoice_id", "client_name", "amount", "days_overdue")
+    depends_on_now = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.now = datetime.now()
+        self.outstanding_count = 0
+        self.outstanding_invoices = []
+        self.total_outstanding = 0
+        self.aging_buckets = {
+            "30_days": 0,
+            "60_days": 0,
+            "90_days": 0,
+            "90_plus_days": 0
+        }
+
+    def query(self, collection: str) -> Dict:
+        return {"status": "pending", "due_start": self.start_date, "due_end": self.end_date}
+
+    def add_invoice(self, invoice: Dict) -> None:
+        if invoice["status"] != "pending":
+            return
+        due_date = datetime.fromisoformat(invoice["due_date"])
+        if not self._in_period(due_date):
+            return
+        days_overdue = (self.now - due_date).days
+        amount = invoice["amount"]
+
+        self.outstanding_count += 1
+        (self.rows if self.stream_rows else self.outstanding_invoices).append({
+            "invoice_id": invoice["invoice_id"],
+            "client_name": invoice["client_name"],
+            "amount": amount,
+            "days_overdue": days_overdue
+        })
+
+        self.total_outstanding += amount
+
+        # Categorize by aging
+        if days_overdue <= 30:
+            self.aging_buckets["30_days"] += amount
+        elif days_overdue <= 60:
+            self.aging_buckets["60_days"] += amount
+        elif days_overdue <= 90:
+            self.aging_buckets["90_days"] += amount
+        else:
+            self.aging_buckets["90_plus_days"] += amount
+
+    def finish(self) -> Dict:
+        report = {
+            "total_outstanding": self.total_outstanding,
+            "outstanding_count": self.outstanding_count,
+            "aging_analysis": self.aging_buckets,
+            "outstanding_invoices": self.outstanding_invoices
+        }
+        if self.stream_rows:
+            del report["outstanding_invoices"]
+        return report
+
+
+class ClientAnalysisAccumulator(ReportAccumulator):
+    """Client-focused analysis"""
+
+    report_type = "client_analysis"
+    collections = ("invoices", "payments")
+    row_fields = ("client_name", "date", "amount", "method")
+    join_fields = ("client_name",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.client_metrics = defaultdict(lambda: {
+            "total_spent": 0,
+            "invoices_count": 0,
+            "services_used": set(),
+            "payment_history": []
+        })
+
+    def query(self, collection: str) -> Dict:
+        if collection == "invoices":
+            return {"created_start": self.start_date, "created_end": self.end_date}
+        return {"start": self.start_date, "end": self.end_date}
+
+    def add_invoice(self, invoice: Dict) -> None:
+        if not self._in_period(datetime.fromisoformat(invoice["created_at"])):
+            return
+        client_name = invoice["client_name"]
+        self.client_metrics[client_name]["invoices_count"] += 1
+        self.client_metrics[client_name]["services_used"].update(invoice["services"])
+
+    def add_payment(self, payment: Dict) -> None:
+        if not self._in_period(datetime.fromisoformat(payment["recorded_at"])):
+            return
+        invoice = self.lookup_invoice(payment["invoice_id"])
+        if invoice:
+            client_name = invoice["client_name"]
+            self.client_metrics[client_name]["total_spent"] += payment["amount"]
+            entry = {
+                "date": payment["recorded_at"],
+                "amount": payment["amount"],
+                "method": payment.get("payment_method") or "unknown"
+            }
+            if self.stream_rows:
+                self.rows.append(dict(client_name=client_name, **entry))
+            else:
+                self.client_metrics[client_name]["payment_history"].append(entry)
+
+    def finish(self) -> Dict:
+        # Convert sets to lists for JSON serialization
+        for client_data in self.client_metrics.values():
+            client_data["services_used"] = list(client_data["services_used"])
+            if self.stream_rows:
+                del client_data["payment_history"]
+
+        return {
+            "client_metrics": dict(self.client_metrics),
+            "total_active_clients": len(self.client_metrics),
+            "average_client_spend": sum(c["total_spent"] for c in self.client_metrics.values()) / len(self.client_metrics) if self.client_metrics else 0
+        }
+
+
+class ServiceMetricsAccumulator(ReportAccumulator):
+    """Metrics about services offered"""
+
+    report_type = "service_metrics"
+    collections = ("invoices",)
+    row_fields = ("service", "total_revenue", "usage_count", "client_count", "average_revenue")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.service_metrics = defaultdict(lambda: {
+            "total_revenue": 0,
+            "usage_count": 0,
+            "clients": set()
+        })
+
+    def query(self, collection: str) -> Dict:
+        return {"created_start": self.start_date, "created_end": self.end_date}
+
+    def add_invoice(self, invoice: Dict) -> None:
+        if not self._in_period(datetime.fromisoformat(invoice["created_at"])):
+            return
+        # Assuming equal distribution of invoice amount across services
+        amount_per_service = invoice["amount"] / len(invoice["services"])
+        for service in invoice["services"]:
+            self.service_metrics[service]["total_revenue"] += amount_per_service
+            self.service_metrics[service]["usage_count"] += 1
+            self.service_metrics[service]["clients"].add(invoice["client_name"])
+
+    def finish(self) -> Dict:
+        # Convert sets to lists for JSON serialization
+        for service_data in self.service_metrics.values():
+            service_data["clients"] = list(service_data["clients"])
+            service_data["average_revenue"] = service_data["total_revenue"] / service_data["usage_count"]
+
+        if self.stream_rows:
+            # One row per service; the summary keeps only the top services
+            for service, service_data in self.service_metrics.items():
+                self.rows.append({
+                    "service": service,
+                    "total_revenue": service_data["total_revenue"],
+                    "usage_count": service_data["usage_count"],
+                    "client_count": len(service_data["clients"]),
+                    "average_revenue": service_data["average_revenue"]
+                })
+            return {
+                "services_count": len(self.service_metrics),
+                "top_services": sorted(
+                    ((service, data["total_revenue"]) for service, data in self.service_metrics.items()),
+                    key=lambda x: x[1],
+                    reverse=True
+                )[:5]
+            }
+
+        return {
+            "service_metrics": dict(self.service_metrics),
+            "top_services": sorted(
+                self.service_metrics.items(),
+                key=lambda x: x[1]["total_revenue"],
+                reverse=True
+            )[:5]
+        }
+
+
+class PaymentTrendsAccumulator(ReportAccumulator):
+    """Analysis of payment trends"""
+
+    report_type = "payment_trends"
+    collections = ("payments",)
+    row_fields = ("date", "amount")
+    join_fields = ("created_at",)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.daily_volumes = defaultdict(float)
+        self.payment_methods = defaultdict(float)
+        self.payment_timing = defaultdict(int)  # Days from invoice to payment
+        self.total_payments = 0
+        self.total_amount = 0
+
+    def query(self, collection: str) -> Dict:
+        return {"start": self.start_date, "end": self.end_date}
+
+    def add_payment(self, payment: Dict) -> None:
+        payment_date = datetime.fromisoformat(payment["recorded_at"])
+        if not self._in_period(payment_date):
+            return
+        amount = payment["amount"]
+        self.total_payments += 1
+        self.total_amount += amount
+
+        # Daily volume
+        date_key = payment_date.strftime("%Y-%m-%d")
+        self.daily_volumes[date_key] += amount
+
+        # Payment methods
+        method = payment.get("payment_method") or "unknown"
+        self.payment_methods[method] += amount
+
+        # Payment timing
+        invoice = self.lookup_invoice(payment["invoice_id"])
+        if invoice:
+            invoice_date = datetime.fromisoformat(invoice["created_at"])
+            days_to_payment = (payment_date - invoice_date).days
+            self.payment_timing[days_to_payment] += 1
+
+    def finish(self) -> Dict:
+        if self.stream_rows:
+            # One row per day; the summary keeps the remaining totals
+            for date_key in sorted(self.daily_volumes):
+                self.rows.append({"date": date_key, "amount": self.daily_volumes[date_key]})
+            return {
+                "total_payments": self.total_payments,
+                "total_amount": self.total_amount,
+                "payment_methods": dict(self.payment_methods),
+                "average_payment_size": self.total_amount / self.total_payments if self.total_payments > 0 else 0,
+                "payment_timing": dict(self.payment_timing)
+            }
+
+        return {
+            "daily_volumes": dict(self.daily_volumes),
+            "payment_methods": dict(self.payment_methods),
+            "average_payment_size": self.total_amount / self.total_payments if self.total_payments > 0 else 0,
+            "payment_timing": dict(self.payment_timing)
+        }
+
+
+ACCUMULATORS = {
+    accumulator.report_type: accumulator
+    for accumulator in (
+        RevenueAccumulator,
+        OutstandingAccumulator,
+        ClientAnalysisAccumulator,
+        ServiceMetricsAccumulator,
+        PaymentTrendsAccumulator
+    )
+}
+
+
+def _stream(storage: StorageBackend, collection: str, accumulators: List[ReportAccumulator]) -> Iterator[Dict]:
+    """Read a collection once for a group of accumulators
+
+    When every accumulator asks for the same storage filter it is pushed down
+    to the backend; otherwise the whole collection is streamed and each
+    accumulator filters for itself.
+    """
+    filters = [accumulator.query(collection) for accumulator in accumulators]
+    shared = filters[0] if all(f == filters[0] for f in filters) else {}
+    if collection == "invoices":
+        return storage.query_invoices(**shared)
+    return storage.query_payments(**shared)
+
+
+def _attach_join(accumulators: List[ReportAccumulator],
+                 get_invoice: Callable[[str], Optional[Dict]] = None) -> Optional[InvoiceJoin]:
+    """Create one invoice join table for every accumulator that needs one"""
+    fields = [field for accumulator in accumulators for field in accumulator.join_fields]
+    if not fields:
+        return None
+    join = InvoiceJoin(dict.fromkeys(fields), get_invoice)
+    for accumulator in accumulators:
+        if accumulator.join_fields:
+            accumulator.join = join
+    return join
+
+
+def _consumers(collection: str, accumulators: List[ReportAccumulator], join: Optional[InvoiceJoin]) -> list:
+    """Accumulators, and the join table, that read a collection"""
+    consumers = [a for a in accumulators if collection in a.collections]
+    if join is not None and collection in join.collections:
+        consumers.append(join)
+    return consumers
+
+
+def run_reports(storage: StorageBackend, report_types: Iterable[str], start_date: datetime, end_date: datetime,
+                get_invoice: Callable[[str], Optional[Dict]] = None) -> Dict[str, Dict]:
+    """Build several reports in a single pass over storage
+
+    Every invoice and payment is read at most once and fed to each requested
+    accumulator. Invoices are streamed before payments, so reports that join
+    payments to invoices do so against a table built from the invoice pass.
+
+    Args:
+        storage: Backend to read records from
+        report_types: Report types to build (see REPORT_TYPES)
+        start_date: Start date for the report period
+        end_date: End date for the report period
+        get_invoice: Invoice lookup for payments whose invoice was not in the invoice pass
+
+    Returns:
+        Dict mapping each report type to its report data
+    """
+    accumulators = [
+        ACCUMULATORS[report_type](start_date, end_date, get_invoice=get_invoice)
+        for report_type in report_types
+    ]
+
+    join = _attach_join(accumulators, get_invoice)
+
+    for collection in COLLECTIONS:
+        consumers = _consumers(collection, accumulators, join)
+        if not consumers:
+            continue
+        for record in _stream(storage, collection, consumers):
+            for accumulator in consumers:
+                accumulator.add(record)
+
+    return {accumulator.report_type: accumulator.finish() for accumulator in accumulators}
+
+
+def stream_report(storage: StorageBackend, report_type: str, start_date: datetime, end_date: datetime,
+                  get_invoice: Callable[[str], Optional[Dict]] = None) -> Iterator[Tuple[str, Dict]]:
+    """Build one report as a stream of detail rows followed by its summary
+
+    Rows are yielded as soon as the scan produces them and are not kept, so
+    memory stays flat however many records fall in the period. Reports whose
+    rows are aggregates (service_metrics, payment_trends) yield them once the
+    scan is complete.
+
+    Args:
+        storage: Backend to read records from
+        report_type: Report type to build (see REPORT_TYPES)
+        start_date: Start date for the report period
+        end_date: End date for the report period
+        get_invoice: Invoice lookup for payments whose invoice was not in the invoice pass
+
+    Yields:
+        ("row", row) for each detail row (fields in the accumulator's
+        row_fields), then ("summary", totals)
+    """
+    accumulator = ACCUMULATORS[report_type](start_date, end_date, get_invoice=get_invoice, stream_rows=True)
+    join = _attach_join([accumulator], get_invoice)
+    for collection in COLLECTIONS:
+        consumers = _consumers(collection, [accumulator], join)
+        if not consumers:
+            continue
+        for record in _stream(storage, collection, consumers):
+            for consumer in consumers:
+                consumer.add(record)
+            if accumulator.rows:
+                for row in accumulator.rows:
+                    yield "row", row
+                accumulator.rows = []
+
+    summary = accumulator.finish()
+    for row in accumulator.rows:
+        yield "row", row
+    accumulator.rows = []
+    yield "summary", summary
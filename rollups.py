@@ -0,0 +1,402 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from contextlib import contextmanager
+from datetime import date, datetime, time, timedelta
+from collections import defaultdict
+import sqlite3
+from storage import SqliteConnections, StorageBackend
+from timestamps import parse_timestamp
+
+# Seconds before the last fold from which a catch-up rereads payments, for
+# payments another worker stored but had not folded in yet
+CATCH_UP_MARGIN = 300
+
+
+def _split_days(start: datetime, end: datetime) -> Tuple[Optional[Tuple[date, date]], List[Tuple[datetime, datetime, bool]]]:
+    """Split an inclusive period into whole days and partial-day edges
+
+    Returns:
+        The (first, last) whole days covered by the period, or None, and a list
+        of (start, end, end_inclusive) spans for the partial days at its edges
+    """
+    first_day = start.date() if start.time() == time.min else start.date() + timedelta(days=1)
+    last_day = end.date() if end.time() == time.max else end.date() - timedelta(days=1)
+    if first_day > last_day:
+        return None, [(start, end, True)]
+
+    edges = []
+    first_midnight = datetime.combine(first_day, time.min)
+    if start < first_midnight:
+        edges.append((start, first_midnight, False))
+    after_last = datetime.combine(last_day + timedelta(days=1), time.min)
+    if after_last <= end:
+        edges.append((after_last, end, True))
+    return (first_day, last_day), edges
+
+
+def _split_months(first_day: date, last_day: date) -> Tuple[Optional[Tuple[str, str]], List[Tuple[date, date]]]:
+    """Split an inclusive range of days into whole months and leftover days
+
+    Returns:
+        The ("YYYY-MM", "YYYY-MM") whole months covered, or None, and a list of
+        (first, last) day ranges outside those months
+    """
+    month_start = first_day if first_day.day == 1 else (first_day.replace(day=1) + timedelta(days=32)).replace(day=1)
+    month_end = (last_day + timedelta(days=1)).replace(day=1)
+    if month_start >= month_end:
+        return None, [(first_day, last_day)]
+
+    day_ranges = []
+    if first_day < month_start:
+        day_ranges.append((first_day, month_start - timedelta(days=1)))
+    if month_end <= last_day:
+        day_ranges.append((month_end, last_day))
+    last_month = month_end - timedelta(days=1)
+    return (month_start.strftime("%Y-%m"), last_month.strftime("%Y-%m")), day_ranges
+
+
+class RollupStore:
+    """Pre-aggregated payment totals kept current on every write
+
+    Payments are summed into daily and monthly revenue buckets per payment
+    method and into a daily histogram of days-to-payment, so revenue and
+    payment trend reports cost one lookup per bucket instead of one read per
+    payment. A slim payment log indexed by recorded_at answers the partial
+    days at the edges of a report period and the list of paid invoices.
+    That list names the invoice of every payment in the period, so it (and
+    only it) still costs one row per payment.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS payment_log (
+            payment_id TEXT PRIMARY KEY,
+            invoice_id TEXT,
+            recorded_at TEXT NOT NULL,
+            amount NUMERIC NOT NULL,
+            payment_method TEXT NOT NULL,
+            days_to_payment INTEGER
+        );
+        CREATE INDEX IF NOT EXISTS idx_payment_log_recorded_at ON payment_log(recorded_at);
+        CREATE TABLE IF NOT EXISTS revenue_daily (
+            day TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            amount NUMERIC NOT NULL,
+            payments INTEGER NOT NULL,
+            PRIMARY KEY (day, payment_method)
+        );
+        CREATE TABLE IF NOT EXISTS revenue_monthly (
+            month TEXT NOT NULL,
+            payment_method TEXT NOT NULL,
+            amount NUMERIC NOT NULL,
+            payments INTEGER NOT NULL,
+            PRIMARY KEY (month, payment_method)
+        );
+        CREATE TABLE IF NOT EXISTS payment_timing_daily (
+            day TEXT NOT NULL,
+            days_to_payment INTEGER NOT NULL,
+            payments INTEGER NOT NULL,
+            PRIMARY KEY (day, days_to_payment)
+        );
+        CREATE TABLE IF NOT EXISTS skipped_payments (
+            payment_id TEXT PRIMARY KEY,
+            error TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            key TEXT PRIMARY KEY,
+            value REAL NOT NULL
+        );
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._connections = SqliteConnections(db_path, self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def add_payment(self, payment: Dict, invoice: Optional[Dict] = None) -> None:
+        """Fold a newly recorded payment into the rollups
+
+        Args:
+            payment: Payment record
+            invoice: Invoice the payment belongs to, used for days-to-payment
+        """
+        self.add_payments([(payment, invoice)])
+
+    def add_payments(self, payments: Iterable[Tuple[Dict, Optional[Dict]]]) -> None:
+        """Fold several (payment, invoice) pairs into the rollups in one transaction
+
+        Payments already present in the log are skipped, so replaying a
+        payment never counts it twice.
+        """
+        with self.adding(payments):
+            pass
+
+    @contextmanager
+    def adding(self, payments: Iterable[Tuple[Dict, Optional[Dict]]]) -> Iterator[None]:
+        """Fold (payment, invoice) pairs into the rollups around a block
+
+        The rows are written before the block runs and committed after it
+        returns, or rolled back if it raises, so storing the payments in the
+        block keeps the rollups and storage in step. A payment the rollups
+        cannot fold raises before the block runs.
+        """
+        conn = self._conn()
+        with conn:
+            for payment, invoice in payments:
+                self._apply(conn, payment, invoice)
+            self._set_state(conn, "folded_at", datetime.now().timestamp())
+            yield
+
+    def _apply(self, conn: sqlite3.Connection, payment: Dict, invoice: Optional[Dict]) -> bool:
+        """Fold one payment in, returning False if it was already in the log"""
+        # Parsed like validate_payment, so stored offsets compare with naive times
+        payment_date = parse_timestamp(payment["recorded_at"])
+        method = payment.get("payment_method") or "unknown"
+        amount = payment["amount"]
+        days_to_payment = None
+        if invoice:
+            days_to_payment = (payment_date - parse_timestamp(invoice["created_at"])).days
+
+        inserted = conn.execute(
+            "INSERT OR IGNORE INTO payment_log "
+            "(payment_id, invoice_id, recorded_at, amount, payment_method, days_to_payment) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (payment["payment_id"], payment["invoice_id"], payment_date.isoformat(), amount, method, days_to_payment)
+        ).rowcount
+        if not inserted:
+            return False
+
+        day = payment_date.strftime("%Y-%m-%d")
+        conn.execute(
+            "INSERT INTO revenue_daily (day, payment_method, amount, payments) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(day, payment_method) DO UPDATE SET "
+            "amount = amount + excluded.amount, payments = payments + 1",
+            (day, method, amount)
+        )
+        conn.execute(
+            "INSERT INTO revenue_monthly (month, payment_method, amount, payments) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(month, payment_method) DO UPDATE SET "
+            "amount = amount + excluded.amount, payments = payments + 1",
+            (day[:7], method, amount)
+        )
+        if days_to_payment is not None:
+            conn.execute(
+                "INSERT INTO payment_timing_daily (day, days_to_payment, payments) VALUES (?, ?, 1) "
+                "ON CONFLICT(day, days_to_payment) DO UPDATE SET payments = payments + 1",
+                (day, days_to_payment)
+            )
+        return True
+
+    def payment_count(self) -> int:
+        """Number of payments folded into the rollups"""
+        return self._conn().execute("SELECT COUNT(*) FROM payment_log").fetchone()[0]
+
+    def _known_count(self, conn: sqlite3.Connection) -> int:
+        """Payments folded in or skipped"""
+        return conn.execute(
+            "SELECT (SELECT COUNT(*) FROM payment_log) + (SELECT COUNT(*) FROM skipped_payments)"
+        ).fetchone()[0]
+
+    def _set_state(self, conn: sqlite3.Connection, key: str, value: float) -> None:
+        conn.execute("INSERT OR REPLACE INTO rollup_state (key, value) VALUES (?, ?)", (key, value))
+
+    def _fold_stored(self, conn: sqlite3.Connection, payments: Iterable[Dict], invoice_created) -> int:
+        """Fold stored payments in, skipping (and logging) those that cannot be
+
+        Args:
+            conn: Connection holding the transaction
+            payments: Stored payment records
+            invoice_created: Callable mapping an invoice ID to its created_at, or None
+
+        Returns:
+            int: Number of payments newly folded in
+        """
+        count = 0
+        for payment in payments:
+            try:
+                created_at = invoice_created(payment["invoice_id"])
+                folded = self._apply(conn, payment, {"created_at": created_at} if created_at else None)
+            except (KeyError, TypeError, ValueError) as e:
+                payment_id = payment.get("payment_id")
+                print(f"Skipping payment {payment_id} in the rollups: {str(e)}")
+                if payment_id is not None:
+                    conn.execute("INSERT OR REPLACE INTO skipped_payments (payment_id, error) VALUES (?, ?)",
+                                 (payment_id, str(e)))
+                continue
+            count += folded
+        return count
+
+    def sync(self, storage: StorageBackend) -> Optional[int]:
+        """Bring the rollups in step with the payments in storage
+
+        When payments are missing (stored by a worker that stopped before
+        folding them in), only payments written since shortly before the
+        last fold are read, with their invoices read one by one. If that
+        does not account for every stored payment, or storage holds fewer
+        payments than the rollups, everything is rebuilt.
+
+        Returns:
+            Number of payments folded in, or None if the rollups were in step
+        """
+        conn = self._conn()
+        stored = storage.count("payments")
+        known = self._known_count(conn)
+        if known == stored:
+            return None
+
+        row = conn.execute("SELECT value FROM rollup_state WHERE key = 'folded_at'").fetchone()
+        if row and known < stored:
+            created = {}
+
+            def invoice_created(invoice_id: str) -> Optional[str]:
+                if invoice_id not in created:
+                    invoice = storage.get("invoices", invoice_id)
+                    created[invoice_id] = invoice["created_at"] if invoice else None
+                return created[invoice_id]
+
+            with conn:
+                count = self._fold_stored(conn, storage.changed_since("payments", row[0] - CATCH_UP_MARGIN),
+                                          invoice_created)
+                self._set_state(conn, "folded_at", datetime.now().timestamp())
+            if self._known_count(conn) == stored:
+                return count
+        return self.rebuild(storage)
+
+    def rebuild(self, storage: StorageBackend) -> int:
+        """Recompute every rollup from the payments in storage
+
+        Returns:
+            int: Number of payments folded in; skipped payments are not counted
+        """
+        # Only creation dates are needed to compute days-to-payment
+        invoices = {
+            invoice["invoice_id"]: invoice["created_at"]
+            for invoice in storage.scan("invoices")
+        }
+        conn = self._conn()
+        with conn:
+            for table in ("payment_log", "revenue_daily", "revenue_monthly", "payment_timing_daily",
+                          "skipped_payments"):
+                conn.execute(f"DELETE FROM {table}")
+            count = self._fold_stored(conn, storage.scan("payments"), invoices.get)
+            self._set_state(conn, "folded_at", datetime.now().timestamp())
+        return count
+
+    def _revenue_rows(self, start_date: datetime, end_date: datetime, granularity: str) -> List[tuple]:
+        """Sum revenue per (period, payment method) over a report period
+
+        Args:
+            start_date: Start of the period (inclusive)
+            end_date: End of the period (inclusive)
+            granularity: "day" or "month"
+
+        Returns:
+            List of (period key, payment method, amount, payment count) rows
+        """
+        conn = self._conn()
+        key_length = 7 if granularity == "month" else 10
+        rows = []
+
+        days, edges = _split_days(start_date, end_date)
+        if days:
+            day_ranges = [days]
+            if granularity == "month":
+                months, day_ranges = _split_months(*days)
+                if months:
+                    rows += conn.execute(
+                        "SELECT month, payment_method, SUM(amount), SUM(payments) FROM revenue_monthly "
+                        "WHERE month BETWEEN ? AND ? GROUP BY month, payment_method",
+                        months
+                    ).fetchall()
+            for first_day, last_day in day_ranges:
+                rows += conn.execute(
+                    f"SELECT substr(day, 1, {key_length}), payment_method, SUM(amount), SUM(payments) "
+                    "FROM revenue_daily WHERE day BETWEEN ? AND ? GROUP BY 1, 2",
+                    (first_day.isoformat(), last_day.isoformat())
+                ).fetchall()
+
+        for edge_start, edge_end, end_inclusive in edges:
+            rows += conn.execute(
+                f"SELECT substr(recorded_at, 1, {key_length}), payment_method, SUM(amount), COUNT(*) "
+                f"FROM payment_log WHERE recorded_at >= ? AND recorded_at {'<=' if end_inclusive else '<'} ? "
+                "GROUP BY 1, 2",
+                (edge_start.isoformat(), edge_end.isoformat())
+            ).fetchall()
+        return rows
+
+    def _timing_rows(self, start_date: datetime, end_date: datetime) -> List[tuple]:
+        """Sum the days-to-payment histogram over a report period"""
+        conn = self._conn()
+        rows = []
+
+        days, edges = _split_days(start_date, end_date)
+        if days:
+            rows += conn.execute(
+                "SELECT days_to_payment, SUM(payments) FROM payment_timing_daily "
+                "WHERE day BETWEEN ? AND ? GROUP BY 1",
+                (days[0].isoformat(), days[1].isoformat())
+            ).fetchall()
+
+        for edge_start, edge_end, end_inclusive in edges:
+            rows += conn.execute(
+                "SELECT days_to_payment, COUNT(*) FROM payment_log "
+                f"WHERE recorded_at >= ? AND recorded_at {'<=' if end_inclusive else '<'} ? "
+                "AND days_to_payment IS NOT NULL GROUP BY 1",
+                (edge_start.isoformat(), edge_end.isoformat())
+            ).fetchall()
+        return rows
+
+    def revenue_report(self, start_date: datetime, end_date: datetime) -> Dict:
+        """Build the revenue report from the monthly and daily buckets"""
+        total_revenue = 0
+        monthly_revenue = defaultdict(float)
+        payment_methods = defaultdict(float)
+
+        for month, method, amount, _ in self._revenue_rows(start_date, end_date, "month"):
+            total_revenue += amount
+            monthly_revenue[month] += amount
+            payment_methods[method] += amount
+
+        paid_invoices = [
+            invoice_id for (invoice_id,) in self._conn().execute(
+                "SELECT invoice_id FROM payment_log WHERE recorded_at >= ? AND recorded_at <= ? "
+                "ORDER BY recorded_at",
+                (start_date.isoformat(), end_date.isoformat())
+            )
+        ]
+
+        return {
+            "total_revenue": total_revenue,
+            "paid_invoices_count": len(paid_invoices),
+            "paid_invoices": paid_invoices,
+            "monthly_breakdown": dict(monthly_revenue),
+            "payment_methods": dict(payment_methods),
+            "average_monthly_revenue": total_revenue / len(monthly_revenue) if monthly_revenue else 0
+        }
+
+    def payment_trends_report(self, start_date: datetime, end_date: datetime) -> Dict:
+        """Build the payment trends report from the daily buckets"""
+        daily_volumes = defaultdict(float)
+        payment_methods = defaultdict(float)
+        payment_timing = defaultdict(int)
+        total_payments = 0
+        total_amount = 0
+
+        for day, method, amount, payments in self._revenue_rows(start_date, end_date, "day"):
+            daily_volumes[day] += amount
+            payment_methods[method] += amount
+            total_payments += payments
+            total_amount += amount
+
+        for days_to_payment, payments in self._timing_rows(start_date, end_date):
+            payment_timing[days_to_payment] += payments
+
+        return {
+            "daily_volumes": dict(daily_volumes),
+            "payment_methods": dict(payment_methods),
+            "average_payment_size": total_amount / total_payments if total_payments > 0 else 0,
+            "payment_timing": dict(payment_timing)
+        }
+
+    def close(self) -> None:
+        self._connections.close()
@@ -0,0 +1,92 @@
+from typing import Any, Callable, Dict
+import json
+try:
+    import orjson
+except ImportError:
+    # orjson is optional; the standard library encoder is used instead
+    orjson = None
+try:
+    import msgpack
+except ImportError:
+    # msgpack is optional; only needed for the msgpack record format
+    msgpack = None
+
+
+class Serializer:
+    """Encodes records to bytes and back for one on-disk format"""
+
+    name = None
+    extension = None
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = None, sort_keys: bool = False) -> bytes:
+        """Encode an object; default converts values the format cannot represent"""
+        raise NotImplementedError("Serializers must implement dumps()")
+
+    def loads(self, data: bytes) -> Any:
+        """Decode bytes produced by dumps()"""
+        raise NotImplementedError("Serializers must implement loads()")
+
+
+class JsonSerializer(Serializer):
+    """Compact JSON without indentation, encoded with orjson when it is installed"""
+
+    name = "json"
+    extension = ".json"
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = None, sort_keys: bool = False) -> bytes:
+        if orjson is not None:
+            option = orjson.OPT_NON_STR_KEYS
+            if default is not None:
+                # Let the caller decide how dates are written, as json does
+                option |= orjson.OPT_PASSTHROUGH_DATETIME
+            if sort_keys:
+                option |= orjson.OPT_SORT_KEYS
+            return orjson.dumps(obj, default=default, option=option)
+        return json.dumps(obj, default=default, sort_keys=sort_keys, separators=(",", ":")).encode()
+
+    def loads(self, data: bytes) -> Any:
+        if orjson is not None:
+            return orjson.loads(data)
+        return json.loads(data)
+
+
+class MsgpackSerializer(Serializer):
+    """MessagePack, a compact binary encoding of the same data as JSON"""
+
+    name = "msgpack"
+    extension = ".msgpack"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("The msgpack record format requires the msgpack package")
+
+    def dumps(self, obj: Any, default: Callable[[Any], Any] = None, sort_keys: bool = False) -> bytes:
+        if sort_keys and isinstance(obj, dict):
+            obj = dict(sorted(obj.items()))
+        return msgpack.packb(obj, default=default, use_bin_type=True)
+
+    def loads(self, data: bytes) -> Any:
+        return msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+# Record formats by name
+SERIALIZERS = {serializer.name: serializer for serializer in (JsonSerializer, MsgpackSerializer)}
+
+
+def get_serializer(name: str) -> Serializer:
+    """Create the serializer for a record format ("json" or "msgpack")"""
+    if name not in SERIALIZERS:
+        raise ValueError(f"Unknown record format: {name}")
+    return SERIALIZERS[name]()
+
+
+def available_serializers() -> Dict[str, Serializer]:
+    """Serializers for every record format whose dependencies are installed, by file extension"""
+    available = {}
+    for cls in SERIALIZERS.values():
+        try:
+            serializer = cls()
+        except ImportError:
+            continue
+        available[serializer.extension] = serializer
+    return available
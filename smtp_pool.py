@@ -0,0 +1,132 @@
+from typing import Dict, List
+from contextlib import contextmanager
+from email.message import Message
+import smtplib
+import threading
+import time
+
+
+class PooledConnection:
+    """An authenticated SMTP connection checked out of a pool"""
+
+    def __init__(self, pool: "SMTPConnectionPool"):
+        self.pool = pool
+        self.server = None
+        self.sent = 0
+        self.last_used = time.time()
+        self.connect()
+
+    def connect(self) -> None:
+        """Open the connection, negotiate TLS and log in"""
+        config = self.pool.config
+        self.server = smtplib.SMTP(config['host'], config['port'], timeout=self.pool.timeout)
+        if config['use_tls']:
+            self.server.starttls()
+        if config['username'] and config['password']:
+            self.server.login(config['username'], config['password'])
+        self.sent = 0
+
+    def send_message(self, msg: Message) -> None:
+        """Send a message, reconnecting once if the server dropped the connection"""
+        if self.sent >= self.pool.max_messages:
+            # Start a fresh session rather than exceed the per-connection limit
+            self.close()
+            self.connect()
+        try:
+            self.server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            self.connect()
+            self.server.send_message(msg)
+        self.sent += 1
+        self.last_used = time.time()
+
+    def close(self) -> None:
+        try:
+            self.server.quit()
+        except Exception:
+            try:
+                self.server.close()
+            except Exception:
+                pass
+
+
+class SMTPConnectionPool:
+    """Keeps authenticated SMTP connections alive between messages
+
+    Connecting, negotiating TLS and logging in usually costs far more than
+    sending a message, so connections are returned to the pool after use and
+    reused by the next sender. Connections idle for longer than idle_timeout
+    are closed instead of reused, and a connection is retired after
+    max_messages so that long-lived sessions do not hit server limits.
+    """
+
+    def __init__(self, config: Dict, max_size: int = 4, idle_timeout: float = 30,
+                 max_messages: int = 100, timeout: float = 30):
+        """Initialize the pool
+
+        Args:
+            config: SMTP configuration (host, port, username, password, use_tls)
+            max_size: Maximum number of open connections
+            idle_timeout: Seconds a connection may sit unused before it is closed
+            max_messages: Messages sent over one connection before it is replaced
+            timeout: Socket timeout in seconds
+        """
+        self.config = config
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.max_messages = max_messages
+        self.timeout = timeout
+        self._idle: List[PooledConnection] = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_size)
+
+    def _checkout(self) -> PooledConnection:
+        now = time.time()
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if now - conn.last_used <= self.idle_timeout:
+                    return conn
+                conn.close()
+        return PooledConnection(self)
+
+    def _checkin(self, conn: PooledConnection) -> None:
+        if conn.sent >= self.max_messages:
+            conn.close()
+            return
+        with self._lock:
+            self._idle.append(conn)
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with block
+
+        The connection is returned to the pool afterwards, or discarded if the
+        block raised.
+        """
+        self._slots.acquire()
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        except Exception:
+            if conn:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            if conn:
+                self._checkin(conn)
+            self._slots.release()
+
+    def send_message(self, msg: Message) -> None:
+        """Send one message over a pooled connection"""
+        with self.connection() as conn:
+            conn.send_message(msg)
+
+    def close(self) -> None:
+        """Close every idle connection"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
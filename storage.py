@@ -0,0 +1,840 @@
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime
+import errno
+import hashlib
+import itertools
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from durable import Durability
+from loader import ParallelLoader
+from metrics import REGISTRY
+from serializers import JsonSerializer, Serializer, available_serializers, get_serializer
+
+# Record collections handled by the storage layer and their ID fields
+ID_FIELDS = {"invoices": "invoice_id", "payments": "payment_id"}
+COLLECTIONS = tuple(ID_FIELDS)
+
+# The Flask application's logger (app.logger), also used under the ASGI server
+logger = logging.getLogger("app")
+
+
+def _parse_date(value: str) -> datetime:
+    """Parse an ISO date string stored on a record"""
+    return datetime.fromisoformat(value)
+
+
+def _in_range(value: datetime, start: Optional[datetime], end: Optional[datetime]) -> bool:
+    """Check whether a date falls within an inclusive, optionally open range"""
+    if start is not None and value < start:
+        return False
+    if end is not None and value > end:
+        return False
+    return True
+
+
+# link() errors meaning the file system has no hard links, rather than a taken ID
+LINK_UNSUPPORTED = {errno.EPERM, errno.ENOTSUP, errno.EOPNOTSUPP, errno.EXDEV}
+
+
+class RecordExistsError(Exception):
+    """Raised when inserting a record whose ID is already taken"""
+
+    def __init__(self, collection: str, record_id: str):
+        super().__init__(f"{collection} record {record_id} already exists")
+        self.collection = collection
+        self.record_id = record_id
+
+
+class StorageBackend:
+    """Interface for billing record storage
+
+    Records are plain dicts stored by ID within a collection ("invoices" or
+    "payments"). Backends must implement get, put, insert and scan; the query
+    methods fall back to filtering a full scan and should be overridden by
+    backends that can answer them from an index.
+
+    Backends that can cheaply tell when a record was rewritten set versioned
+    and implement version(), which lets callers cache parsed records.
+    """
+
+    versioned = False
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict]:
+        """Retrieve a record by ID, or None if it does not exist"""
+        raise NotImplementedError("Storage backends must implement get()")
+
+    def version(self, collection: str, record_id: str) -> Optional[tuple]:
+        """Return a token that changes whenever the record is rewritten, or None if it does not exist"""
+        raise NotImplementedError("Versioned storage backends must implement version()")
+
+    def put(self, collection: str, record_id: str, record: Dict) -> None:
+        """Insert or replace a record"""
+        raise NotImplementedError("Storage backends must implement put()")
+
+    def insert(self, collection: str, record_id: str, record: Dict) -> None:
+        """Write a new record, raising RecordExistsError if the ID is taken"""
+        raise NotImplementedError("Storage backends must implement insert()")
+
+    def scan(self, collection: str) -> Iterator[Dict]:
+        """Iterate over every record in a collection"""
+        raise NotImplementedError("Storage backends must implement scan()")
+
+    def changed_since(self, collection: str, since: float) -> Iterator[Dict]:
+        """Iterate over records that may have been written after a Unix time
+
+        May yield records that did not change. This default yields every
+        record; backends that know when records were written override it.
+        """
+        return self.scan(collection)
+
+    def put_many(self, collection: str, records: Iterable[Dict]) -> int:
+        """Insert or replace several records, returning how many were written"""
+        id_field = ID_FIELDS[collection]
+        count = 0
+        for record in records:
+            self.put(collection, record[id_field], record)
+            count += 1
+        return count
+
+    def insert_many(self, collection: str, records: Iterable[Dict]) -> int:
+        """Write several new records, raising RecordExistsError on the first taken ID
+
+        Records before the conflicting one may already have been written.
+        """
+        id_field = ID_FIELDS[collection]
+        count = 0
+        for record in records:
+            self.insert(collection, record[id_field], record)
+            count += 1
+        return count
+
+    def count(self, collection: str) -> int:
+        """Count the records in a collection"""
+        return sum(1 for _ in self.scan(collection))
+
+    def query_invoices(self, status: str = None, client_name: str = None,
+                       due_start: datetime = None, due_end: datetime = None,
+                       created_start: datetime = None, created_end: datetime = None) -> Iterator[Dict]:
+        """Iterate over invoices matching all of the given filters
+
+        Args:
+            status: Exact invoice status
+            client_name: Exact client name
+            due_start: Earliest due date (inclusive)
+            due_end: Latest due date (inclusive)
+            created_start: Earliest creation date (inclusive)
+            created_end: Latest creation date (inclusive)
+        """
+        for invoice in self.scan("invoices"):
+            if status is not None and invoice["status"] != status:
+                continue
+            if client_name is not None and invoice["client_name"] != client_name:
+                continue
+            if (due_start or due_end) and not _in_range(_parse_date(invoice["due_date"]), due_start, due_end):
+                continue
+            if (created_start or created_end) and not _in_range(_parse_date(invoice["created_at"]), created_start, created_end):
+                continue
+            yield invoice
+
+    def query_payments(self, start: datetime = None, end: datetime = None,
+                       invoice_id: str = None) -> Iterator[Dict]:
+        """Iterate over payments recorded within a date range
+
+        Args:
+            start: Earliest recorded_at date (inclusive)
+            end: Latest recorded_at date (inclusive)
+            invoice_id: Only return payments for this invoice
+        """
+        for payment in self.scan("payments"):
+            if invoice_id is not None and payment["invoice_id"] != invoice_id:
+                continue
+            if (start or end) and not _in_range(_parse_date(payment["recorded_at"]), start, end):
+                continue
+            yield payment
+
+    def close(self) -> None:
+        """Release any resources held by the backend"""
+
+
+# Directory layouts understood by JsonFileStorage
+LAYOUTS = ("flat", "sharded")
+
+
+def shard_dirs(record_id: str) -> Tuple[str, str]:
+    """Shard subdirectories for a record ID
+
+    IDs carry their creation date (INV-20250130-...), which places them in
+    <year>/<month>. IDs without one go to one of 256 hash buckets.
+    """
+    parts = record_id.split("-")
+    if len(parts) > 1 and len(parts[1]) == 8 and parts[1].isdigit():
+        return parts[1][:4], parts[1][4:6]
+    return "misc", hashlib.sha1(record_id.encode()).hexdigest()[:2]
+
+
+class JsonFileStorage(StorageBackend):
+    """Stores each record as a file under data_dir/<collection>/
+
+    In the "flat" layout a record lives at <collection>/<id>.json. The
+    "sharded" layout spreads records over <collection>/<year>/<month>/<id>.json
+    (see shard_dirs), which keeps directories small at hundreds of thousands
+    of records. Records are encoded by a Serializer: compact JSON by default,
+    or MessagePack (<id>.msgpack). Reads find a record under any layout and
+    format, so a tree can be converted while it is served: writes use the
+    configured layout and format and remove the record's other copies, and
+    manage.py reshard / convert move the rest.
+
+    Every write goes to a temporary file that is renamed into place, so a
+    crash never leaves a partial record behind (leftover *.tmp files are
+    ignored). How writes are fsynced is up to the Durability mode; in
+    "group" mode concurrent writers share their fsyncs.
+
+    Scans read the files through a ParallelLoader.
+    """
+
+    versioned = True
+
+    def __init__(self, data_dir: str = "data", loader: ParallelLoader = None, layout: str = "flat",
+                 serializer: Serializer = None, durability: Durability = None):
+        if layout not in LAYOUTS:
+            raise ValueError(f"Unknown JSON storage layout: {layout}")
+        self.data_dir = data_dir
+        self.loader = loader or ParallelLoader()
+        self.durability = durability or Durability("none")
+        self._hard_links = True
+        self.layout = layout
+        self.serializer = serializer or JsonSerializer()
+        self._serializers = available_serializers()
+        self._serializers[self.serializer.extension] = self.serializer
+        # Places a record may be found, the configured layout and format first
+        other_layout = "flat" if layout == "sharded" else "sharded"
+        other_extensions = [ext for ext in self._serializers if ext != self.serializer.extension]
+        self._locations = [(layout, self.serializer.extension), (other_layout, self.serializer.extension)]
+        self._locations += [(l, ext) for ext in other_extensions for l in (layout, other_layout)]
+        self._shards_made = set()
+        for collection in COLLECTIONS:
+            os.makedirs(os.path.join(self.data_dir, collection), exist_ok=True)
+
+    def _layout_path(self, layout: str, extension: str, collection: str, record_id: str) -> str:
+        if layout == "sharded":
+            return os.path.join(self.data_dir, collection, *shard_dirs(record_id), f"{record_id}{extension}")
+        return os.path.join(self.data_dir, collection, f"{record_id}{extension}")
+
+    def _path(self, collection: str, record_id: str) -> str:
+        """Where the record is written under the configured layout and format"""
+        return self._layout_path(self.layout, self.serializer.extension, collection, record_id)
+
+    def _paths(self, collection: str, record_id: str) -> Iterator[str]:
+        """Every place the record may be found, the configured one first"""
+        for layout, extension in self._locations:
+            yield self._layout_path(layout, extension, collection, record_id)
+
+    def _write_path(self, collection: str, record_id: str) -> str:
+        path = self._path(collection, record_id)
+        directory = os.path.dirname(path)
+        if self.layout == "sharded" and directory not in self._shards_made:
+            os.makedirs(directory, exist_ok=True)
+            self._shards_made.add(directory)
+        return path
+
+    def _moved(self, collection: str, record_id: str) -> None:
+        """Remove the record's copies in other layouts and formats once it is written"""
+        for path in itertools.islice(self._paths(collection, record_id), 1, None):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _read(self, path: str) -> Dict:
+        with open(path, "rb") as f:
+            data = f.read()
+        return self._serializers[os.path.splitext(path)[1]].loads(data)
+
+    def version(self, collection: str, record_id: str) -> Optional[tuple]:
+        for path in self._paths(collection, record_id):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+        return None
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict]:
+        for path in self._paths(collection, record_id):
+            try:
+                return self._read(path)
+            except FileNotFoundError:
+                continue
+        return None
+
+    def _link(self, staged_path: str, path: str) -> None:
+        """Give a staged record its final path, raising FileExistsError if it is taken
+
+        A hard link fails instead of replacing a file that already exists.
+        File systems without hard links (some network and FUSE mounts) get
+        an exclusive create instead, which writes the record in place and
+        so syncs it before returning.
+        """
+        if self._hard_links:
+            try:
+                os.link(staged_path, path)
+                return
+            except OSError as e:
+                if e.errno not in LINK_UNSUPPORTED:
+                    raise
+                self._hard_links = False
+
+        with open(staged_path, "rb") as f:
+            data = f.read()
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except BaseException:
+            os.remove(path)
+            raise
+        self.durability.sync([path])
+
+    def _commit(self, collection: str, records: List[Tuple[str, Dict]], exclusive: bool) -> int:
+        """Write records through temporary files, then rename or link them into place
+
+        Record contents are made durable before any rename, and the renames
+        before returning, so a batch shares two rounds of fsyncs. With
+        exclusive set, a record whose ID is taken raises RecordExistsError;
+        the records before it stay written.
+        """
+        suffix = f".{os.getpid()}-{threading.get_ident()}.tmp"
+        staged = []
+        directories = set()
+        written = 0
+        try:
+            for record_id, record in records:
+                if exclusive and any(os.path.exists(path) for path in
+                                     itertools.islice(self._paths(collection, record_id), 1, None)):
+                    raise RecordExistsError(collection, record_id)
+                path = self._write_path(collection, record_id)
+                with open(path + suffix, "wb") as f:
+                    f.write(self.serializer.dumps(record))
+                staged.append((record_id, path))
+            self.durability.sync(path + suffix for _, path in staged)
+
+            for record_id, path in staged:
+                if exclusive:
+                    try:
+                        self._link(path + suffix, path)
+                    except FileExistsError:
+                        raise RecordExistsError(collection, record_id)
+                    os.remove(path + suffix)
+                else:
+                    os.replace(path + suffix, path)
+                    self._moved(collection, record_id)
+                directories.add(os.path.dirname(path))
+                written += 1
+        except BaseException:
+            # The records renamed into place stay written; sync them without
+            # replacing the error that stopped the batch
+            if directories:
+                try:
+                    self.durability.sync(directories)
+                except OSError:
+                    logger.exception("Error syncing %s directories after a failed write", collection)
+            raise
+        finally:
+            for _, path in staged[written:]:
+                try:
+                    os.remove(path + suffix)
+                except FileNotFoundError:
+                    pass
+        if directories:
+            self.durability.sync(directories)
+        return written
+
+    def put(self, collection: str, record_id: str, record: Dict) -> None:
+        self._commit(collection, [(record_id, record)], exclusive=False)
+
+    def put_many(self, collection: str, records: Iterable[Dict]) -> int:
+        id_field = ID_FIELDS[collection]
+        return self._commit(collection, [(record[id_field], record) for record in records], exclusive=False)
+
+    def insert(self, collection: str, record_id: str, record: Dict) -> None:
+        self._commit(collection, [(record_id, record)], exclusive=True)
+
+    def insert_many(self, collection: str, records: Iterable[Dict]) -> int:
+        id_field = ID_FIELDS[collection]
+        return self._commit(collection, [(record[id_field], record) for record in records], exclusive=True)
+
+    def _entries(self, collection: str, since: float = None) -> Iterator[os.DirEntry]:
+        """Every record file in a collection, in any layout and format
+
+        A record briefly present in two places (a write interrupted before
+        the old copy was removed) is listed once, from the configured layout
+        and format. With since set, directories not modified after it are
+        skipped without looking at their files: every write renames or
+        links a file into its directory, which updates the directory's
+        modification time.
+        """
+        def walk(directory: str, depth: int) -> Iterator[os.DirEntry]:
+            with os.scandir(directory) as entries:
+                entries = list(entries)
+            # Read after listing, so it covers every file listed
+            if since is None or os.stat(directory).st_mtime >= since:
+                yield from (entry for entry in entries if os.path.splitext(entry.name)[1] in self._serializers)
+            if depth:
+                for entry in entries:
+                    if os.path.splitext(entry.name)[1] not in self._serializers and entry.is_dir():
+                        yield from walk(entry.path, depth - 1)
+
+        for entry in walk(os.path.join(self.data_dir, collection), 2):
+            primary = self._path(collection, os.path.splitext(entry.name)[0])
+            if entry.path != primary and os.path.exists(primary):
+                continue
+            yield entry
+
+    def _read_listed(self, collection: str, path: str) -> Optional[Dict]:
+        """Read a record file found by a listing, following the record if it was moved since"""
+        try:
+            return self._read(path)
+        except FileNotFoundError:
+            # relocate() or a write in another layout or format removed this copy
+            return self.get(collection, os.path.splitext(os.path.basename(path))[0])
+
+    def scan(self, collection: str) -> Iterator[Dict]:
+        paths = [entry.path for entry in self._entries(collection)]
+        records = self.loader.load_paths(paths, os.path.join(self.data_dir, collection),
+                                         lambda path: self._read_listed(collection, path))
+        return (record for record in records if record is not None)
+
+    def changed_since(self, collection: str, since: float) -> Iterator[Dict]:
+        # Only the modification times are read for records that did not
+        # change, and only in directories written to since
+        paths = [entry.path for entry in self._entries(collection, since) if entry.stat().st_mtime >= since]
+        for path in paths:
+            try:
+                yield self._read(path)
+            except FileNotFoundError:
+                continue
+
+    def count(self, collection: str) -> int:
+        return sum(1 for _ in self._entries(collection))
+
+    def relocate(self, collection: str) -> int:
+        """Move every record of a collection into the configured layout and format
+
+        Safe to run while the tree is being served with the same layout and
+        format: a record is linked (or, when its format changes, rewritten)
+        into place without replacing a newer copy written there meanwhile,
+        and only then removed from its old location.
+
+        Returns:
+            int: Number of records moved
+        """
+        moved = 0
+        top = os.path.join(self.data_dir, collection)
+        misplaced = [
+            (entry.path, os.path.splitext(entry.name)[0]) for entry in self._entries(collection)
+            if entry.path != self._path(collection, os.path.splitext(entry.name)[0])
+        ]
+        for path, record_id in misplaced:
+            target = self._write_path(collection, record_id)
+            try:
+                if path.endswith(self.serializer.extension):
+                    os.link(path, target)
+                else:
+                    data = self.serializer.dumps(self._read(path))
+                    with open(target, "xb") as f:
+                        f.write(data)
+            except FileExistsError:
+                pass
+            except FileNotFoundError:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            moved += 1
+        # Shard directories emptied by a move back to the flat layout
+        if self.layout == "flat":
+            for directory, _, _ in sorted(os.walk(top), reverse=True):
+                if directory != top:
+                    try:
+                        os.rmdir(directory)
+                    except OSError:
+                        pass
+        return moved
+
+    def close(self) -> None:
+        self.loader.close()
+
+
+class SqliteConnections:
+    """Per-thread connections to one SQLite database file
+
+    sqlite3 connections cannot be shared between gunicorn threads, so each
+    thread lazily opens its own connection in WAL mode.
+    """
+
+    def __init__(self, db_path: str, schema: str = None):
+        self.db_path = db_path
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._local = threading.local()
+        if schema:
+            self.get().executescript(schema)
+
+    def get(self) -> sqlite3.Connection:
+        """Return the calling thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self) -> None:
+        """Close the calling thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class SqliteStorage(StorageBackend):
+    """Stores records in an embedded SQLite database
+
+    The full record is kept as a JSON document alongside indexed columns for
+    the fields that reports and lookups filter on. Dates are normalized to
+    ISO strings so that range filters can be answered by the indexes. Every
+    row also records when it was last written (updated_at), which answers
+    changed_since() from an index.
+    """
+
+    # Per collection: primary key column and indexed columns
+    TABLES = {
+        "invoices": (ID_FIELDS["invoices"], ("status", "due_date", "created_at", "client_name")),
+        "payments": (ID_FIELDS["payments"], ("invoice_id", "recorded_at"))
+    }
+    DATE_COLUMNS = ("due_date", "created_at", "recorded_at")
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS invoices (
+            invoice_id TEXT PRIMARY KEY,
+            status TEXT,
+            due_date TEXT,
+            created_at TEXT,
+            client_name TEXT,
+            data TEXT NOT NULL,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_invoices_status_due ON invoices(status, due_date);
+        CREATE INDEX IF NOT EXISTS idx_invoices_due_date ON invoices(due_date);
+        CREATE INDEX IF NOT EXISTS idx_invoices_created_at ON invoices(created_at);
+        CREATE INDEX IF NOT EXISTS idx_invoices_client_name ON invoices(client_name);
+        CREATE TABLE IF NOT EXISTS payments (
+            payment_id TEXT PRIMARY KEY,
+            invoice_id TEXT,
+            recorded_at TEXT,
+            data TEXT NOT NULL,
+            updated_at REAL
+        );
+        CREATE INDEX IF NOT EXISTS idx_payments_recorded_at ON payments(recorded_at);
+        CREATE INDEX IF NOT EXISTS idx_payments_invoice_id ON payments(invoice_id);
+    """
+
+    def __init__(self, db_path: str = os.path.join("data", "billing.db")):
+        self.db_path = db_path
+        self._connections = SqliteConnections(db_path, self.SCHEMA)
+        self._add_updated_at()
+
+    def _conn(self) -> sqlite3.Connection:
+        return self._connections.get()
+
+    def _add_updated_at(self) -> None:
+        """Add and index updated_at in databases created before it existed
+
+        Rows written before then have no updated_at and count as changed.
+        """
+        conn = self._conn()
+        with conn:
+            for collection in self.TABLES:
+                columns = [row[1] for row in conn.execute(f"PRAGMA table_info({collection})")]
+                if "updated_at" not in columns:
+                    conn.execute(f"ALTER TABLE {collection} ADD COLUMN updated_at REAL")
+                conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{collection}_updated_at ON {collection}(updated_at)")
+
+    def _row(self, collection: str, record: Dict) -> tuple:
+        """Build the column values for a record"""
+        key, columns = self.TABLES[collection]
+        values = [record[key]]
+        for column in columns:
+            value = record.get(column)
+            if value is not None and column in self.DATE_COLUMNS:
+                value = _parse_date(value).isoformat()
+            values.append(value)
+        values.append(json.dumps(record))
+        values.append(time.time())
+        return tuple(values)
+
+    def _insert_sql(self, collection: str, replace: bool = True) -> str:
+        key, columns = self.TABLES[collection]
+        names = (key,) + columns + ("data", "updated_at")
+        placeholders = ", ".join("?" for _ in names)
+        verb = "INSERT OR REPLACE" if replace else "INSERT"
+        return f"{verb} INTO {collection} ({', '.join(names)}) VALUES ({placeholders})"
+
+    def _select(self, sql: str, params: tuple = ()) -> Iterator[Dict]:
+        for (data,) in self._conn().execute(sql, params):
+            yield json.loads(data)
+
+    def get(self, collection: str, record_id: str) -> Optional[Dict]:
+        key, _ = self.TABLES[collection]
+        row = self._conn().execute(
+            f"SELECT data FROM {collection} WHERE {key} = ?", (record_id,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, collection: str, record_id: str, record: Dict) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute(self._insert_sql(collection), self._row(collection, record))
+
+    def put_many(self, collection: str, records: Iterable[Dict]) -> int:
+        conn = self._conn()
+        rows = [self._row(collection, record) for record in records]
+        with conn:
+            conn.executemany(self._insert_sql(collection), rows)
+        return len(rows)
+
+    def insert(self, collection: str, record_id: str, record: Dict) -> None:
+        self.insert_many(collection, [record])
+
+    def insert_many(self, collection: str, records: Iterable[Dict]) -> int:
+        # The batch is one transaction, so a conflict leaves nothing written
+        conn = self._conn()
+        rows = [self._row(collection, record) for record in records]
+        try:
+            with conn:
+                conn.executemany(self._insert_sql(collection, replace=False), rows)
+        except sqlite3.IntegrityError:
+            existing = self._existing_id(collection, [row[0] for row in rows])
+            raise RecordExistsError(collection, existing)
+        return len(rows)
+
+    def _existing_id(self, collection: str, record_ids: list) -> Optional[str]:
+        """Return the first of the given IDs that is already stored or repeated"""
+        key, _ = self.TABLES[collection]
+        seen = set()
+        for record_id in record_ids:
+            if record_id in seen or self._conn().execute(
+                f"SELECT 1 FROM {collection} WHERE {key} = ?", (record_id,)
+            ).fetchone():
+                return record_id
+            seen.add(record_id)
+        return None
+
+    def scan(self, collection: str) -> Iterator[Dict]:
+        return self._select(f"SELECT data FROM {collection}")
+
+    def changed_since(self, collection: str, since: float) -> Iterator[Dict]:
+        return self._select(
+            f"SELECT data FROM {collection} WHERE updated_at >= ? OR updated_at IS NULL", (since,)
+        )
+
+    def count(self, collection: str) -> int:
+        return self._conn().execute(f"SELECT COUNT(*) FROM {collection}").fetchone()[0]
+
+    def query_invoices(self, status: str = None, client_name: str = None,
+                       due_start: datetime = None, due_end: datetime = None,
+                       created_start: datetime = None, created_end: datetime = None) -> Iterator[Dict]:
+        clauses, params = [], []
+        for column, op, value in (
+            ("status", "=", status),
+            ("client_name", "=", client_name),
+            ("due_date", ">=", due_start),
+            ("due_date", "<=", due_end),
+            ("created_at", ">=", created_start),
+            ("created_at", "<=", created_end)
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value.isoformat() if isinstance(value, datetime) else value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._select(f"SELECT data FROM invoices{where}", tuple(params))
+
+    def query_payments(self, start: datetime = None, end: datetime = None,
+                       invoice_id: str = None) -> Iterator[Dict]:
+        clauses, params = [], []
+        for column, op, value in (
+            ("invoice_id", "=", invoice_id),
+            ("recorded_at", ">=", start),
+            ("recorded_at", "<=", end)
+        ):
+            if value is not None:
+                clauses.append(f"{column} {op} ?")
+                params.append(value.isoformat() if isinstance(value, datetime) else value)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return self._select(f"SELECT data FROM payments{where}", tuple(params))
+
+    def close(self) -> None:
+        self._connections.close()
+
+
+STORAGE_SECONDS = REGISTRY.histogram(
+    "billing_storage_operation_seconds", "Time spent in storage operations", ["backend", "operation"])
+STORAGE_RECORDS = REGISTRY.counter(
+    "billing_storage_records_total", "Records read or written by storage operations", ["backend", "operation"])
+
+
+class TimedStorage(StorageBackend):
+    """Records the latency and record counts of another backend's operations
+
+    Reads and writes are timed per call. Operations on several records also
+    count them; scans are timed from the first record requested until the
+    last is delivered, so the records per second of a scan is
+    rate(records_total) / rate(seconds_sum). Everything else is passed
+    through to the wrapped backend.
+    """
+
+    def __init__(self, storage: StorageBackend, name: str):
+        """Wrap a backend
+
+        Args:
+            storage: Backend whose operations are recorded
+            name: Backend label on the recorded metrics
+        """
+        self.storage = storage
+        self.versioned = storage.versioned
+        self._seconds = {}
+        self._records = {}
+        for operation in ("get", "put", "insert", "put_many", "insert_many", "scan",
+                          "changed_since", "count", "query_invoices", "query_payments"):
+            self._seconds[operation] = STORAGE_SECONDS.labels(name, operation)
+        for operation in ("put_many", "insert_many", "scan", "changed_since", "query_invoices", "query_payments"):
+            self._records[operation] = STORAGE_RECORDS.labels(name, operation)
+
+    def __getattr__(self, name: str):
+        return getattr(self.storage, name)
+
+    def _timed(self, operation: str, call, *args):
+        start = time.perf_counter()
+        try:
+            return call(*args)
+        finally:
+            self._seconds[operation].observe(time.perf_counter() - start)
+
+    def _timed_iter(self, operation: str, records: Iterator[Dict]) -> Iterator[Dict]:
+        count = 0
+        start = time.perf_counter()
+        try:
+            for record in records:
+                count += 1
+                yield record
+        finally:
+            self._seconds[operation].observe(time.perf_counter() - start)
+            self._records[operation].inc(count)
+
+    def _timed_many(self, operation: str, call, collection: str, records: Iterable[Dict]) -> int:
+        records = list(records)
+        try:
+            return self._timed(operation, call, collection, records)
+        finally:
+            self._records[operation].inc(len(records))
+
+    def get(self, collection, record_id):
+        return self._timed("get", self.storage.get, collection, record_id)
+
+    def version(self, collection, record_id):
+        # Checked on every cached read; not timed to keep cache hits cheap
+        return self.storage.version(collection, record_id)
+
+    def put(self, collection, record_id, record):
+        self._timed("put", self.storage.put, collection, record_id, record)
+
+    def insert(self, collection, record_id, record):
+        self._timed("insert", self.storage.insert, collection, record_id, record)
+
+    def put_many(self, collection, records):
+        return self._timed_many("put_many", self.storage.put_many, collection, records)
+
+    def insert_many(self, collection, records):
+        return self._timed_many("insert_many", self.storage.insert_many, collection, records)
+
+    def scan(self, collection):
+        return self._timed_iter("scan", self.storage.scan(collection))
+
+    def changed_since(self, collection, since):
+        return self._timed_iter("changed_since", self.storage.changed_since(collection, since))
+
+    def count(self, collection):
+        return self._timed("count", self.storage.count, collection)
+
+    def query_invoices(self, **filters):
+        return self._timed_iter("query_invoices", self.storage.query_invoices(**filters))
+
+    def query_payments(self, **filters):
+        return self._timed_iter("query_payments", self.storage.query_payments(**filters))
+
+    def close(self):
+        self.storage.close()
+
+
+def create_storage(backend: str = None, data_dir: str = "data") -> StorageBackend:
+    """Create a storage backend by name
+
+    Args:
+        backend: "json" (default; one file per record), "sqlite" or "journal"; read from
+            STORAGE_BACKEND when omitted
+        data_dir: Base data directory
+
+    Returns:
+        StorageBackend: The configured backend
+    """
+    backend = (backend or os.getenv("STORAGE_BACKEND", "json")).lower()
+    if backend == "json":
+        return JsonFileStorage(data_dir, loader=ParallelLoader(
+            workers=int(os.getenv("SCAN_WORKERS", "8")),
+            prefetch=int(os.getenv("SCAN_PREFETCH", "512"))
+        ), layout=os.getenv("JSON_LAYOUT", "flat").lower(),
+            serializer=get_serializer(os.getenv("RECORD_FORMAT", "json").lower()),
+            durability=Durability(os.getenv("RECORD_SYNC", "group").lower(),
+                                  window=float(os.getenv("GROUP_COMMIT_MS", "0")) / 1000))
+    if backend == "sqlite":
+        return SqliteStorage(os.getenv("SQLITE_PATH", os.path.join(data_dir, "billing.db")))
+    if backend == "journal":
+        from journal import JournalStorage
+        return JournalStorage(
+            data_dir,
+            segment_size=int(os.getenv("JOURNAL_SEGMENT_MB", "64")) * 1024 * 1024,
+            compact_ratio=float(os.getenv("JOURNAL_COMPACT_RATIO", "0.5"))
+        )
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def migrate(source: StorageBackend, target: StorageBackend, batch_size: int = 500) -> Dict[str, int]:
+    """Copy every invoice and payment from one backend into another
+
+    Args:
+        source: Backend to read records from
+        target: Backend to write records to
+        batch_size: Number of records written per batch
+
+    Returns:
+        Dict mapping collection name to the number of records copied
+    """
+    copied = {}
+    for collection in COLLECTIONS:
+        copied[collection] = 0
+        batch = []
+        for record in source.scan(collection):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                copied[collection] += target.put_many(collection, batch)
+                batch = []
+        if batch:
+            copied[collection] += target.put_many(collection, batch)
+    return copied
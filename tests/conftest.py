@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+import json
+import os
+import random
+import sys
+import pytest
+
+# The modules live at the top level of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loader import ParallelLoader  # noqa: E402
+from metrics import REGISTRY, ValueFile, read_values  # noqa: E402
+from storage import JsonFileStorage  # noqa: E402
+
+SERVICES = ["Web Design", "Hosting", "SEO Setup", "Maintenance"]
+CLIENTS = ["Acme", "Globex", "Initech", "Umbrella", "Hooli"]
+METHODS = ["Bank Transfer", "Credit Card", "PayPal"]
+
+
+def sample_records(invoices: int = 60, seed: int = 7):
+    """Invoices and payments over 2025 with a mix of int and float amounts
+
+    Returns:
+        Tuple of (invoices, payments)
+    """
+    rng = random.Random(seed)
+    start = datetime(2025, 1, 1, 9, 30)
+    invoice_records, payment_records = [], []
+    for n in range(invoices):
+        created = start + timedelta(days=rng.randint(0, 330), seconds=rng.randint(0, 30000))
+        amount = rng.randint(1, 40) * 50 if n % 2 else round(rng.uniform(10, 2000), 2)
+        invoice = {
+            "invoice_id": f"INV-{created:%Y%m%d}-{n:09d}",
+            "client_name": rng.choice(CLIENTS),
+            "services": rng.sample(SERVICES, rng.randint(1, 3)),
+            "amount": amount,
+            "status": "pending",
+            "due_date": (created + timedelta(days=30)).isoformat(),
+            "created_at": created.isoformat()
+        }
+        if n % 3:
+            invoice["status"] = "paid"
+            payment = {
+                "payment_id": f"PAY-{created:%Y%m%d}-{n:09d}",
+                "invoice_id": invoice["invoice_id"],
+                "amount": amount,
+                "recorded_at": (created + timedelta(days=rng.randint(0, 50), hours=3)).isoformat()
+            }
+            # Some payment exports carry no method, or a null one
+            if n % 7:
+                payment["payment_method"] = rng.choice(METHODS) if n % 11 else None
+            payment_records.append(payment)
+        invoice_records.append(invoice)
+    return invoice_records, payment_records
+
+
+def new_invoice(client_name: str = "Acme", amount: int = 100) -> dict:
+    """Invoice data as a client would post it"""
+    return {"client_name": client_name, "services": ["Hosting"], "amount": amount,
+            "due_date": "2099-12-01T00:00:00"}
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    """Data directory for BillingDatabase instances without background work"""
+    for name, value in [("EMAIL_OUTBOX", "false"), ("METRICS", "false"),
+                        ("INDEX_SNAPSHOT", "false"), ("REPORT_COLUMNAR", "false")]:
+        monkeypatch.setenv(name, value)
+    return str(tmp_path / "data")
+
+
+@pytest.fixture
+def metrics_dir(tmp_path, monkeypatch):
+    """Record metrics into a fresh directory, even where METRICS=false"""
+    directory = str(tmp_path / "metrics")
+    monkeypatch.setattr(REGISTRY, "values", ValueFile(directory))
+    monkeypatch.setattr(REGISTRY, "_enabled", True)
+    return directory
+
+
+def metric_value(directory: str, sample: str, labels: list = ()) -> float:
+    """Value of one sample summed over the processes recording into directory"""
+    key = json.dumps([sample, [list(pair) for pair in labels]], separators=(",", ":"))
+    return read_values(directory).get(key, 0.0)
+
+
+@pytest.fixture
+def sample_storage(tmp_path):
+    """JSON storage holding sample_records()"""
+    storage = JsonFileStorage(str(tmp_path / "data"), loader=ParallelLoader(workers=2, log_min_files=0))
+    invoices, payments = sample_records()
+    storage.put_many("invoices", invoices)
+    storage.put_many("payments", payments)
+    yield storage
+    storage.close()
+
+
+def _assert_same(actual, expected, path="report"):
+    """Compare report data: same keys and value types, amounts equal to the cent"""
+    if isinstance(expected, dict):
+        assert isinstance(actual, dict) and sorted(actual, key=str) == sorted(expected, key=str), path
+        for key in expected:
+            _assert_same(actual[key], expected[key], f"{path}.{key}")
+    elif isinstance(expected, (list, tuple)):
+        assert len(actual) == len(expected), path
+        if all(isinstance(value, str) for value in expected):
+            # Sets in the accumulators come out in no particular order
+            actual, expected = sorted(actual), sorted(expected)
+        for index, (a, e) in enumerate(zip(actual, expected)):
+            _assert_same(a, e, f"{path}[{index}]")
+    elif isinstance(expected, float):
+        assert type(actual) is float and actual == pytest.approx(expected, abs=0.005), path
+    else:
+        assert type(actual) is type(expected) and actual == expected, path
+
+
+@pytest.fixture
+def assert_same_report():
+    """Asserts that report data matches the streaming accumulators' data"""
+    return _assert_same
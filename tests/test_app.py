@@ -0,0 +1,158 @@
+from datetime import datetime
+import csv
+import io
+import json
+import pytest
+import app as app_module
+from conftest import new_invoice, sample_records
+from database import BillingDatabase
+from reports import ACCUMULATORS
+
+REPORT = {"start_date": "2025-01-01", "end_date": "2026-12-31"}
+PERIOD = (datetime(2025, 1, 1), datetime(2026, 12, 31))
+
+
+@pytest.fixture
+def db(data_dir):
+    return BillingDatabase(data_dir)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "DATABASE", db)
+    monkeypatch.setattr(app_module, "db", None)
+    return app_module.app.test_client()
+
+
+def _pages(client, query: str) -> list:
+    """Follow next_cursor from the first page to the last"""
+    pages = []
+    cursor = None
+    while True:
+        response = client.get(f"/api/invoices?{query}" + (f"&cursor={cursor}" if cursor else ""))
+        assert response.status_code == 200
+        page = response.get_json()
+        assert page["count"] == len(page["invoices"])
+        pages.append([invoice["invoice_id"] for invoice in page["invoices"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_cursor_pagination_visits_every_invoice_once(client, db):
+    results = db.create_invoices([new_invoice(("Acme", "Globex")[n % 2], 100 + n) for n in range(25)])
+    ids = [result["invoice_id"] for result in results]
+
+    pages = _pages(client, "limit=10")
+    assert [len(page) for page in pages] == [10, 10, 5]
+    assert [invoice_id for page in pages for invoice_id in page] == sorted(ids)
+
+    globex = [invoice_id for page in _pages(client, "client=Globex&limit=4") for invoice_id in page]
+    assert globex == sorted(ids[1::2])
+
+
+def test_invoices_created_while_paging_land_on_later_pages(client, db):
+    first_ids = [result["invoice_id"] for result in db.create_invoices([new_invoice() for _ in range(6)])]
+    first = client.get("/api/invoices?limit=4").get_json()
+    new_id = db.create_invoice(new_invoice())
+
+    rest = client.get(f"/api/invoices?limit=4&cursor={first['next_cursor']}").get_json()
+    assert [invoice["invoice_id"] for invoice in first["invoices"] + rest["invoices"]] == sorted(first_ids) + [new_id]
+    assert rest["next_cursor"] is None
+
+
+@pytest.mark.parametrize("query", ["limit=0", "limit=501", "limit=ten", "due_from=someday"])
+def test_invalid_listing_parameters(client, query):
+    response = client.get(f"/api/invoices?{query}")
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+def test_invoice_conditional_get(client, db):
+    invoice_id = db.create_invoice(new_invoice())
+    response = client.get(f"/api/invoices/{invoice_id}")
+    etag, last_modified = response.headers["ETag"], response.headers["Last-Modified"]
+
+    assert client.get(f"/api/invoices/{invoice_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/api/invoices/{invoice_id}", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.put(f"/api/invoices/{invoice_id}/status", json={"status": "paid"}).status_code == 200
+    response = client.get(f"/api/invoices/{invoice_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["ETag"] != etag
+    assert response.get_json()["status"] == "paid"
+
+
+def test_invoice_rewritten_by_another_worker_gets_a_new_etag(client, db):
+    invoice_id = db.create_invoice(new_invoice())
+    etag = client.get(f"/api/invoices/{invoice_id}").headers["ETag"]
+
+    # Written behind this worker's back; the cache notices the new version
+    db.storage.put("invoices", invoice_id, dict(db.get_invoice(invoice_id), amount=12345))
+    response = client.get(f"/api/invoices/{invoice_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.get_json()["amount"] == 12345
+    assert client.get(f"/api/invoices/{invoice_id}", headers={"If-None-Match": response.headers["ETag"]}).status_code == 304
+
+
+@pytest.fixture
+def sample_db(data_dir):
+    invoices, payments = sample_records()
+    # A client name that needs quoting in CSV
+    invoices[1]["client_name"] = 'Wayne, "Enterprises"'
+    db = BillingDatabase(data_dir)
+    db.storage.put_many("invoices", invoices)
+    db.storage.put_many("payments", payments)
+    return BillingDatabase(data_dir)
+
+
+@pytest.fixture
+def sample_client(sample_db, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "DATABASE", sample_db)
+    monkeypatch.setattr(app_module, "db", None)
+    return app_module.app.test_client()
+
+
+def test_ndjson_stream_matches_generated_report(sample_client, sample_db, assert_same_report):
+    response = sample_client.post("/api/reports", json=dict(REPORT, report_type="revenue"),
+                                  headers={"Accept": "application/x-ndjson"})
+    assert response.status_code == 200 and response.mimetype == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert lines[0]["type"] == "header" and lines[0]["report_type"] == "revenue"
+    assert [line["type"] for line in lines[1:-1]] == ["row"] * (len(lines) - 2)
+    # The summary trailer comes last
+    assert lines[-1]["type"] == "summary"
+    report = sample_db.generate_report("revenue", *PERIOD)
+    expected = dict(report["data"])
+    paid_invoices = expected.pop("paid_invoices")
+    assert sorted(line["data"]["invoice_id"] for line in lines[1:-1]) == sorted(paid_invoices)
+    assert_same_report(lines[-1]["data"], expected)
+
+
+def test_csv_stream_has_header_and_escaped_rows(sample_client, sample_db, assert_same_report):
+    response = sample_client.post("/api/reports", json=dict(REPORT, report_type="client_analysis", stream="csv"))
+    assert response.status_code == 200 and response.mimetype == "text/csv"
+    assert "client_analysis_report.csv" in response.headers["Content-Disposition"]
+    rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+    fields = list(ACCUMULATORS["client_analysis"].row_fields)
+    assert rows[0] == fields
+    # Detail rows, a blank line, then the summary trailer
+    assert rows[-2] == [] and rows[-1][0] == "summary"
+    detail = [dict(zip(fields, row)) for row in rows[1:-2]]
+    report = sample_db.generate_report("client_analysis", *PERIOD)
+    expected = sorted((client, entry["date"], str(entry["amount"]), entry["method"])
+                      for client, metrics in report["data"]["client_metrics"].items()
+                      for entry in metrics["payment_history"])
+    assert sorted(tuple(row.values()) for row in detail) == expected
+    assert 'Wayne, "Enterprises"' in {row["client_name"] for row in detail}
+
+    summary = json.loads(rows[-1][1])
+    for metrics in report["data"]["client_metrics"].values():
+        del metrics["payment_history"]
+    assert_same_report(summary, report["data"])
+
+
+def test_stream_rejects_unknown_formats_and_several_types(client):
+    response = client.post("/api/reports", json=dict(REPORT, report_type="revenue", stream="xml"))
+    assert response.status_code == 400
+    response = client.post("/api/reports", json=dict(REPORT, report_type=["revenue", "outstanding"], stream="csv"))
+    assert response.status_code == 400
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+from datetime import datetime
+from email.message import EmailMessage
+import pytest
+from starlette.testclient import TestClient
+import app as app_module
+import asgi
+from async_smtp import AsyncSMTPConnectionPool
+from benchmarks.smtp_throughput import start_sink
+from conftest import metric_value, new_invoice
+from database import BillingDatabase
+from email_service import EmailService
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORT = {"report_type": "revenue", "start_date": "2025-01-01", "end_date": "2026-12-31"}
+
+
+@pytest.fixture
+def db(data_dir):
+    return BillingDatabase(data_dir)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "DATABASE", db)
+    monkeypatch.setattr(app_module, "db", None)
+    # Entering the client runs the lifespan, as uvicorn would
+    with TestClient(asgi.app) as client:
+        yield client
+
+
+def _smtp_config(port: int) -> dict:
+    return {"host": "127.0.0.1", "port": port, "username": "", "password": "", "use_tls": False,
+            "from_email": "billing@chromapages.com", "from_name": "Chromapages Billing"}
+
+
+def _message(n: int) -> EmailMessage:
+    msg = EmailMessage()
+    msg["From"], msg["To"], msg["Subject"] = "billing@chromapages.com", f"client{n}@example.com", f"Invoice {n}"
+    msg.set_content("Your invoice is attached.")
+    return msg
+
+
+def test_invoice_routes(client):
+    response = client.post("/api/invoices", json=new_invoice())
+    assert response.status_code == 200
+    invoice_id = response.json()["invoice_id"]
+
+    listed = client.get("/api/invoices").json()
+    assert [invoice["invoice_id"] for invoice in listed["invoices"]] == [invoice_id]
+    response = client.get(f"/api/invoices/{invoice_id}")
+    assert response.json()["client_name"] == "Acme"
+    etag = response.headers["etag"]
+
+    assert client.get(f"/api/invoices/{invoice_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.put(f"/api/invoices/{invoice_id}/status", json={"status": "paid"}).status_code == 200
+    response = client.get(f"/api/invoices/{invoice_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert response.json()["status"] == "paid"
+    assert client.get("/api/invoices/INV-MISSING").status_code == 404
+
+
+def test_report_etag_answers_not_modified(client, db):
+    db.create_invoice(new_invoice())
+    response = client.post("/api/reports", json=REPORT)
+    assert response.status_code == 200 and response.headers["x-cache"] == "MISS"
+    etag = response.headers["etag"]
+
+    assert client.post("/api/reports", json=REPORT, headers={"If-None-Match": etag}).status_code == 304
+    db.create_invoice(new_invoice())
+    assert client.post("/api/reports", json=REPORT, headers={"If-None-Match": etag}).status_code == 200
+
+
+@pytest.mark.parametrize("fmt", ["ndjson", "csv"])
+def test_streamed_report_matches_app(client, db, fmt):
+    for n in range(3):
+        invoice_id = db.create_invoice(new_invoice(amount=100 + n))
+        db.record_payment({"invoice_id": invoice_id, "amount": 100 + n, "payment_method": "PayPal"})
+    request = dict(REPORT, report_type="client_analysis", end_date=f"{datetime.now().year + 1}-12-31")
+    accept = {"ndjson": "application/x-ndjson", "csv": "text/csv"}[fmt]
+
+    response = client.post("/api/reports", json=request, headers={"Accept": accept})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith(accept)
+    expected = app_module.app.test_client().post("/api/reports", json=request, headers={"Accept": accept})
+    if fmt == "csv":
+        assert response.text == expected.get_data(as_text=True)
+        return
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["header"] + ["row"] * 3 + ["summary"]
+    # Only the header's generation time differs
+    assert lines[1:] == [json.loads(line) for line in expected.get_data(as_text=True).splitlines()[1:]]
+
+
+def test_stream_requires_a_single_report_type(client):
+    response = client.post("/api/reports", json=dict(REPORT, report_type=["revenue"], stream="ndjson"))
+    assert response.status_code == 400
+    assert client.post("/api/reports", json=dict(REPORT, stream="xml")).status_code == 400
+
+
+def test_metrics_route_is_off_when_disabled(client):
+    assert client.get("/metrics").status_code == 404
+
+
+def test_async_deliveries_share_the_sync_pool_metrics(metrics_dir):
+    port, stop, received = start_sink()
+    try:
+        service = EmailService(_smtp_config(port))
+        assert service._deliver_many([_message(0)]) == [None]
+        service.pool.close()
+
+        async def deliver():
+            pool = AsyncSMTPConnectionPool(_smtp_config(port))
+            try:
+                return await pool.send_many([_message(1), _message(2)])
+            finally:
+                await pool.close()
+
+        assert asyncio.run(deliver()) == [None, None]
+    finally:
+        stop()
+    assert metric_value(metrics_dir, "billing_smtp_send_seconds_count") == 3
+
+
+def test_async_connection_errors_share_the_sync_pool_metrics(metrics_dir):
+    port, stop, received = start_sink()
+    stop()
+    # Nothing listens on the port any more
+    service = EmailService(_smtp_config(port))
+    assert all(service._deliver_many([_message(0)]))
+    assert all(asyncio.run(AsyncSMTPConnectionPool(_smtp_config(port), timeout=5).send_many([_message(1), _message(2)])))
+    assert metric_value(metrics_dir, "billing_smtp_failures_total", [("reason", "error")]) == 3
+    assert metric_value(metrics_dir, "billing_smtp_send_seconds_count") == 0
+
+
+def test_server_load_comparison_runs():
+    result = subprocess.run(
+        [sys.executable, "-m", "benchmarks.server_load", "--invoices", "50", "--slow", "0", "5",
+         "--fast-clients", "2", "--duration", "1", "--json"],
+        cwd=ROOT, capture_output=True, text=True, timeout=300, check=True)
+    results = json.loads(result.stdout[result.stdout.index("["):])
+    assert sorted({row["server"] for row in results}) == ["gunicorn", "uvicorn"]
+    for row in results:
+        assert row["fast_requests"] > 0 and row["fast_failures"] == 0, row
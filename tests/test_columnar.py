@@ -0,0 +1,37 @@
+from datetime import datetime
+import time
+import pytest
+from columnar import COLUMNAR_REPORTS, ColumnarSnapshot
+from reports import run_reports
+
+PERIODS = [(datetime(2025, 1, 1), datetime(2025, 12, 31)), (datetime(2025, 3, 1), datetime(2025, 6, 30, 23, 59))]
+
+
+@pytest.mark.parametrize("start,end", PERIODS)
+def test_snapshot_matches_accumulators(sample_storage, tmp_path, assert_same_report, start, end):
+    snapshot = ColumnarSnapshot(str(tmp_path / "columnar"))
+    snapshot.build(sample_storage)
+    expected = run_reports(sample_storage, COLUMNAR_REPORTS, start, end)
+    for report_type in COLUMNAR_REPORTS:
+        assert_same_report(snapshot.report(report_type, start, end), expected[report_type], report_type)
+
+
+def test_stale_snapshot_is_rebuilt_in_the_background(sample_storage, tmp_path):
+    snapshot = ColumnarSnapshot(str(tmp_path / "columnar"))
+    assert snapshot.ensure_fresh(sample_storage) is False
+    deadline = time.time() + 10
+    while not snapshot.ensure_fresh(sample_storage):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    assert snapshot.view is not None and not snapshot.stale
+
+    # A write leaves reports to the accumulators until the rebuild lands
+    payment = dict(next(sample_storage.scan("payments")), payment_id="PAY-20250601-999999999", amount=75)
+    sample_storage.put("payments", payment["payment_id"], payment)
+    snapshot.mark_stale()
+    assert snapshot.ensure_fresh(sample_storage) is False
+    while not snapshot.ensure_fresh(sample_storage):
+        assert time.time() < deadline
+        time.sleep(0.01)
+    revenue = snapshot.report("revenue", datetime(2024, 1, 1), datetime(2026, 12, 31))
+    assert revenue["paid_invoices_count"] == sample_storage.count("payments")
@@ -0,0 +1,96 @@
+from datetime import date, datetime, timedelta
+import os
+import subprocess
+import sys
+import textwrap
+import database
+from conftest import new_invoice
+from database import BillingDatabase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PERIOD = (datetime(2025, 1, 1), datetime(2026, 12, 31, 23, 59, 59))
+
+
+def run_worker(data_dir: str, code: str) -> str:
+    """Run code against a BillingDatabase `db` in another process, as a second worker would
+
+    Returns:
+        The last line the code printed
+    """
+    script = textwrap.dedent(f"""
+        from datetime import datetime
+        from database import BillingDatabase
+        db = BillingDatabase({data_dir!r})
+    """) + textwrap.dedent(code)
+    result = subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True)
+    return result.stdout.strip().splitlines()[-1]
+
+
+def test_sync_changes_picks_up_another_workers_writes(data_dir):
+    db = BillingDatabase(data_dir)
+    db.create_invoice(new_invoice("Acme"))
+
+    invoice_id = run_worker(data_dir, """
+        print(db.create_invoice({"client_name": "Globex", "services": ["SEO Setup"], "amount": 250,
+                                 "due_date": "2099-12-01T00:00:00"}))
+    """)
+
+    listed = db.list_invoices(client_name="Globex")["invoices"]
+    assert [record["invoice_id"] for record in listed] == [invoice_id]
+    assert db.generate_report("revenue", *PERIOD)["data"]["total_revenue"] == 0
+    db.record_payment({"invoice_id": invoice_id, "amount": 250, "payment_method": "PayPal"})
+
+    status = run_worker(data_dir, f"""
+        print(db.get_invoice({invoice_id!r})["status"])
+    """)
+    assert status == "paid"
+
+
+def test_report_etag_is_shared_between_workers(data_dir):
+    db = BillingDatabase(data_dir)
+    db.create_invoice(new_invoice())
+    etag = db.report_etag("revenue", *PERIOD)
+
+    start, end = (moment.isoformat() for moment in PERIOD)
+    other_etag = run_worker(data_dir, f"""
+        print(db.report_etag("revenue", datetime.fromisoformat({start!r}), datetime.fromisoformat({end!r})))
+    """)
+    assert other_etag == etag
+    # A restarted worker serves the same tag too
+    assert BillingDatabase(data_dir).report_etag("revenue", *PERIOD) == etag
+
+
+def test_report_etag_changes_after_another_workers_write(data_dir):
+    db = BillingDatabase(data_dir)
+    db.create_invoice(new_invoice())
+    etag = db.report_etag("revenue", *PERIOD)
+
+    run_worker(data_dir, """
+        print(db.create_invoice({"client_name": "Initech", "services": ["Hosting"], "amount": 75,
+                                 "due_date": "2099-12-01T00:00:00"}))
+    """)
+    assert db.report_etag("revenue", *PERIOD) != etag
+    assert db.generate_report("revenue", *PERIOD)["cache"]["etag"] == db.report_etag("revenue", *PERIOD)
+
+
+def test_outstanding_report_is_rebuilt_on_a_new_day(data_dir, monkeypatch):
+    db = BillingDatabase(data_dir)
+    db.create_invoice(dict(new_invoice(), due_date="2025-06-01T00:00:00"))
+    outstanding = db.generate_report("outstanding", *PERIOD)
+    revenue = db.generate_report("revenue", *PERIOD)
+    assert db.generate_report("outstanding", *PERIOD)["cache"]["hit"]
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    # No writes, but days overdue have moved on
+    monkeypatch.setattr(database, "date", Tomorrow)
+    rebuilt = db.generate_report("outstanding", *PERIOD)
+    assert not rebuilt["cache"]["hit"]
+    assert rebuilt["cache"]["etag"] != outstanding["cache"]["etag"]
+    assert db.report_etag("outstanding", *PERIOD) == rebuilt["cache"]["etag"]
+    # Reports that do not depend on the current time keep their tag
+    assert db.report_etag("revenue", *PERIOD) == revenue["cache"]["etag"]
+    assert db.generate_report("revenue", *PERIOD)["cache"]["hit"]
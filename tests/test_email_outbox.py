@@ -0,0 +1,84 @@
+import os
+import time
+import pytest
+from email_outbox import EmailOutbox
+from email_service import EmailService
+
+
+def _wait_for(condition, timeout: float = 10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def outboxes():
+    started = []
+    yield started
+    for outbox in started:
+        outbox.stop()
+
+
+def _outbox(started, spool_dir, deliver, **options) -> EmailOutbox:
+    options = dict(dict(workers=1, poll_interval=0.01, base_delay=0), **options)
+    outbox = EmailOutbox(str(spool_dir), deliver, **options)
+    started.append(outbox)
+    return outbox
+
+
+def test_failed_delivery_is_retried(outboxes, tmp_path):
+    attempts = []
+
+    def deliver(message):
+        attempts.append(message["to"])
+        if len(attempts) == 1:
+            raise ConnectionError("server went away")
+
+    outbox = _outbox(outboxes, tmp_path, deliver)
+    outbox.enqueue({"to": "client@example.com"})
+    _wait_for(lambda: outbox.stats()["depth"] == 0)
+    assert attempts == ["client@example.com", "client@example.com"]
+
+
+def test_message_is_parked_after_max_attempts(outboxes, tmp_path):
+    def deliver(message):
+        raise ConnectionError("refused")
+
+    outbox = _outbox(outboxes, tmp_path, deliver, max_attempts=3)
+    outbox.enqueue({"to": "client@example.com"})
+    _wait_for(lambda: outbox.stats()["failed"] == 1)
+    assert outbox.stats()["depth"] == 0
+
+
+def test_worker_survives_a_stray_pending_file(outboxes, tmp_path):
+    delivered = []
+    outbox = _outbox(outboxes, tmp_path, lambda message: delivered.append(message["to"]))
+    with open(os.path.join(str(tmp_path), "pending", "notes.txt"), "w") as f:
+        f.write("not a message")
+    outbox.enqueue({"to": "first@example.com"})
+    _wait_for(lambda: delivered == ["first@example.com"])
+    outbox.enqueue({"to": "second@example.com"})
+    _wait_for(lambda: delivered == ["first@example.com", "second@example.com"])
+
+
+def test_abandoned_claims_are_requeued_while_running(outboxes, tmp_path):
+    delivered = []
+    outbox = _outbox(outboxes, tmp_path, lambda message: delivered.append(message["to"]), claim_timeout=0.2)
+    outbox.start()
+    # A message claimed by a worker that exited without finishing it
+    abandoned = {"id": "0000000000001-abandoned", "to": "late@example.com", "created_at": time.time(),
+                 "next_attempt_at": time.time(), "attempts": 0}
+    outbox._write("inflight", abandoned)
+    _wait_for(lambda: delivered == ["late@example.com"])
+    assert outbox.stats()["depth"] == 0
+
+
+def test_enqueue_only_service_starts_no_delivery_threads(tmp_path):
+    config = {"host": "localhost", "port": 2525, "username": "", "password": "", "use_tls": False,
+              "from_email": "billing@example.com", "from_name": "Billing"}
+    service = EmailService(config, outbox_dir=str(tmp_path), deliver=False)
+    assert service.send_many([{"to_email": "client@example.com", "subject": "Receipt", "body": "Paid"}]) == [True]
+    assert service.outbox._threads == []
+    stats = service.outbox.stats()
+    assert (stats["depth"], stats["in_flight"]) == (1, 0)
@@ -0,0 +1,28 @@
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import pytest
+from ids import allocator
+
+
+def _allocate(count: int) -> list:
+    with ThreadPoolExecutor(4) as pool:
+        ids = list(pool.map(lambda _: allocator.next_id("INV"), range(count)))
+    return ids + allocator.next_ids("INV", count)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="needs fork()")
+def test_ids_are_unique_across_forked_workers():
+    # Forked like gunicorn workers, after the parent has already allocated
+    parent_ids = _allocate(500)
+    with multiprocessing.get_context("fork").Pool(4) as pool:
+        worker_ids = pool.map(_allocate, [2000] * 4)
+
+    ids = parent_ids + [record_id for batch in worker_ids for record_id in batch]
+    assert len(set(ids)) == len(ids)
+    # Each process allocates under its own worker suffix
+    assert len({record_id.rsplit("-", 1)[1] for record_id in ids}) == 5
+
+
+def test_ids_sort_in_allocation_order():
+    ids = allocator.next_ids("PAY", 3000) + [allocator.next_id("PAY") for _ in range(100)]
+    assert sorted(ids) == ids
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+import pytest
+from conftest import new_invoice
+from database import BillingDatabase
+from indexes import DueDateIndex
+from metrics import REGISTRY
+
+
+def _invoice(invoice_id: str, due_date: str, status: str = "pending") -> dict:
+    return {"invoice_id": invoice_id, "due_date": due_date, "status": status}
+
+
+def test_due_index_orders_pending_invoices_by_due_date():
+    index = DueDateIndex()
+    index.build([_invoice("INV-3", "2025-03-01"), _invoice("INV-1", "2025-01-01"),
+                 _invoice("INV-PAID", "2024-12-01", "paid")])
+    index.update(_invoice("INV-2", "2025-02-01T12:00:00"))
+
+    assert index.due_before(datetime(2025, 2, 15)) == ["INV-1", "INV-2"]
+    assert index.due_before(datetime(2026, 1, 1)) == ["INV-1", "INV-2", "INV-3"]
+    assert len(index) == 3
+
+
+def test_due_index_follows_status_changes():
+    index = DueDateIndex()
+    index.build([_invoice("INV-1", "2025-01-01"), _invoice("INV-2", "2025-02-01")])
+
+    index.update(_invoice("INV-1", "2025-01-01", "paid"))
+    assert index.due_before(datetime(2026, 1, 1)) == ["INV-2"]
+    # A new due date moves the invoice rather than adding it twice
+    index.update(_invoice("INV-2", "2024-06-01"))
+    assert index.due_before(datetime(2025, 1, 1)) == ["INV-2"]
+    index.update(_invoice("INV-1", "2025-01-01", "pending"))
+    assert index.due_before(datetime(2026, 1, 1)) == ["INV-2", "INV-1"]
+    assert len(index) == 2
+
+
+def test_due_index_mixes_offset_and_naive_due_dates():
+    aware = datetime(2025, 1, 1, 12, tzinfo=timezone.utc)
+    local = aware.astimezone().replace(tzinfo=None)
+    index = DueDateIndex()
+    index.build([_invoice("INV-Z", "2025-01-01T12:00:00Z")])
+    index.update(_invoice("INV-NAIVE", (local + timedelta(hours=1)).isoformat()))
+    index.update(_invoice("INV-OFFSET", aware.isoformat()))
+
+    assert index.due_before(local + timedelta(minutes=1)) == ["INV-OFFSET", "INV-Z"]
+    assert index.due_before(local + timedelta(hours=2)) == ["INV-OFFSET", "INV-Z", "INV-NAIVE"]
+
+
+@pytest.mark.parametrize("due_date", ["2020-01-01T09:00:00Z", "2020-01-01T09:00:00+02:00"])
+def test_offset_due_dates_are_stored_naive(data_dir, due_date):
+    db = BillingDatabase(data_dir)
+    batch = db.create_invoices([dict(new_invoice(), due_date=due_date)])
+    single = db.create_invoice(dict(new_invoice(), due_date=due_date))
+    # Creating a naive invoice after the offset ones used to fail in the index
+    naive = db.create_invoice(dict(new_invoice(), due_date="2020-01-02T00:00:00"))
+
+    ids = [batch[0]["invoice_id"], single]
+    for invoice_id in ids:
+        assert datetime.fromisoformat(db.get_invoice(invoice_id)["due_date"]).tzinfo is None
+    assert {invoice["invoice_id"] for invoice in db.get_overdue_invoices()} == set(ids + [naive])
+
+
+def test_startup_indexes_offset_due_dates_stored_earlier(data_dir):
+    db = BillingDatabase(data_dir)
+    naive = db.create_invoice(new_invoice())
+    # Written before validation converted offsets
+    db.storage.put("invoices", "INV-OLD", dict(new_invoice(), invoice_id="INV-OLD", status="pending",
+                                                due_date="2020-01-01T09:00:00+00:00",
+                                                created_at="2019-12-01T09:00:00Z"))
+
+    restarted = BillingDatabase(data_dir)
+    assert [invoice["invoice_id"] for invoice in restarted.get_overdue_invoices()] == ["INV-OLD"]
+    assert len(restarted.due_index) == 2
+    assert naive in [invoice["invoice_id"] for invoice in restarted.list_invoices()["invoices"]]
+
+
+def test_index_load_time_is_published(data_dir, metrics_dir, monkeypatch):
+    monkeypatch.setenv("INDEX_SNAPSHOT", "true")
+    monkeypatch.setenv("INDEX_SNAPSHOT_INTERVAL", "0")
+    db = BillingDatabase(data_dir)
+    assert 'billing_index_load_seconds{source="scan"}' in REGISTRY.render()
+    db.create_invoice(new_invoice())
+    db.save_index_snapshot()
+
+    restarted = BillingDatabase(data_dir)
+    assert restarted.startup["source"] == "snapshot" and restarted.startup["invoices"] == 1
+    gauge = [line for line in REGISTRY.render().splitlines() if line.startswith("billing_index_load_seconds")]
+    assert gauge == [f'billing_index_load_seconds{{source="snapshot"}} {restarted.startup["seconds"]!r}']
@@ -0,0 +1,90 @@
+import json
+import pytest
+import app as app_module
+import database
+from conftest import new_invoice
+from database import BillingDatabase
+
+
+@pytest.fixture
+def db(data_dir):
+    return BillingDatabase(data_dir)
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "DATABASE", db)
+    monkeypatch.setattr(app_module, "db", None)
+    return app_module.app.test_client()
+
+
+def test_invalid_invoices_do_not_stop_the_batch(db):
+    results = db.create_invoices([
+        new_invoice("Acme"),
+        {"client_name": "Globex", "services": [], "amount": -5},
+        "not an invoice",
+        dict(new_invoice("Initech"), due_date="next week"),
+        new_invoice("Hooli")
+    ])
+
+    assert [result["index"] for result in results] == [0, 1, 2, 3, 4]
+    assert [result["status"] for result in results] == ["created", "error", "error", "error", "created"]
+    assert results[1]["errors"] == ["services must be a non-empty list", "amount must be a non-negative number"]
+    assert results[2]["errors"] == ["Invoice must be a JSON object"]
+    assert results[3]["errors"] == ["due_date must be an ISO date"]
+    stored = {invoice["invoice_id"]: invoice["client_name"] for invoice in db.list_invoices()["invoices"]}
+    assert stored == {results[0]["invoice_id"]: "Acme", results[4]["invoice_id"]: "Hooli"}
+
+
+def test_client_supplied_ids_are_replaced(db):
+    results = db.create_invoices([dict(new_invoice(), invoice_id="INV-1"), dict(new_invoice(), invoice_id="INV-1")])
+
+    ids = [result["invoice_id"] for result in results]
+    assert len(set(ids)) == 2 and "INV-1" not in ids
+    assert sorted(invoice["invoice_id"] for invoice in db.list_invoices()["invoices"]) == sorted(ids)
+
+
+def test_batch_colliding_with_a_stored_id_creates_nothing(db, monkeypatch):
+    existing = db.create_invoice(new_invoice())
+    monkeypatch.setattr(database.allocator, "next_id", lambda prefix: existing)
+
+    results = db.create_invoices([new_invoice("Globex"), {"client_name": "Initech"}])
+    assert results[0]["status"] == "error" and "invoice_id" not in results[0]
+    assert results[1]["errors"] == ["Missing required fields: services, amount"]
+    assert [invoice["client_name"] for invoice in db.list_invoices()["invoices"]] == ["Acme"]
+
+
+def test_batch_route_reports_each_item(client):
+    undated = {"client_name": "Acme", "services": ["Hosting"], "amount": 100}
+    response = client.post("/api/invoices/batch", json={"invoices": [undated, {"client_name": "Globex"}]})
+    body = response.get_json()
+    assert response.status_code == 200
+    assert (body["created"], body["failed"]) == (1, 1)
+    assert [result["status"] for result in body["results"]] == ["created", "error"]
+    # A missing due date gets the default
+    invoice = client.get(f"/api/invoices/{body['results'][0]['invoice_id']}").get_json()
+    assert invoice["due_date"] > invoice["created_at"]
+
+
+def test_ndjson_batch_reports_bad_lines_by_position(client):
+    lines = [json.dumps(new_invoice()), "{not json", "", json.dumps(new_invoice("Globex"))]
+    response = client.post("/api/invoices/batch", data="\n".join(lines), content_type="application/x-ndjson")
+    body = response.get_json()
+    assert (body["created"], body["failed"]) == (2, 1)
+    assert [result["index"] for result in body["results"]] == [0, 1, 2]
+    assert body["results"][1]["errors"][0].startswith("Invalid JSON")
+
+
+@pytest.mark.parametrize("size, status", [(3, 200), (4, 400)])
+def test_batch_size_limit(client, monkeypatch, size, status):
+    monkeypatch.setattr(app_module, "INVOICE_BATCH_LIMIT", 3)
+    response = client.post("/api/invoices/batch", json=[new_invoice() for _ in range(size)])
+    assert response.status_code == status
+    if status == 400:
+        assert response.get_json()["error"] == "Batch too large: 4 invoices (limit 3)"
+        assert client.get("/api/invoices").get_json()["count"] == 0
+
+
+@pytest.mark.parametrize("body", [[], {"invoices": []}, {"invoice": [new_invoice()]}])
+def test_batch_route_rejects_empty_or_misshapen_bodies(client, body):
+    assert client.post("/api/invoices/batch", json=body).status_code == 400
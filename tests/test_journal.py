@@ -0,0 +1,151 @@
+import os
+import time
+import pytest
+import journal as journal_module
+from journal import JournalInUseError, JournalStorage
+from storage import RecordExistsError
+
+
+def _invoice(n: int, status: str = "pending") -> dict:
+    return {"invoice_id": f"INV-{n:04d}", "client_name": "Acme", "amount": n, "status": status}
+
+
+@pytest.fixture
+def journals(tmp_path):
+    """Opens journals on one data directory and closes them afterwards"""
+    opened = []
+
+    def open_journal(**options):
+        journal = JournalStorage(str(tmp_path / "data"), **options)
+        opened.append(journal)
+        return journal
+
+    yield open_journal
+    for journal in opened:
+        if journal._lock_fd is not None:
+            journal.close()
+
+
+def _segment_path(journal: JournalStorage, segment: int) -> str:
+    return journal._collections["invoices"].path(segment)
+
+
+def test_torn_line_is_truncated_on_load(journals):
+    journal = journals()
+    journal.put_many("invoices", [_invoice(n) for n in range(3)])
+    journal.close()
+    path = _segment_path(journal, 1)
+    size = os.path.getsize(path)
+    with open(path, "ab") as f:
+        f.write(b'INV-0003\t{"invoice_id": "INV-0')
+
+    reopened = journals()
+    assert os.path.getsize(path) == size
+    assert reopened.count("invoices") == 3 and reopened.get("invoices", "INV-0003") is None
+    # Appends continue after the last complete line
+    reopened.put("invoices", "INV-0003", _invoice(3))
+    reopened.close()
+    assert journals().get("invoices", "INV-0003") == _invoice(3)
+
+
+def test_scan_yields_each_record_once_as_of_its_start(journals):
+    journal = journals()
+    journal.put_many("invoices", [_invoice(n) for n in range(5)])
+    scan = journal.scan("invoices")
+    first = next(scan)
+
+    # An update to a record already yielded, one not yet reached, and a new record
+    journal.put("invoices", first["invoice_id"], dict(first, status="paid"))
+    journal.put("invoices", "INV-0003", _invoice(3, "paid"))
+    journal.put("invoices", "INV-0009", _invoice(9))
+    scanned = [first] + list(scan)
+
+    assert sorted(record["invoice_id"] for record in scanned) == [f"INV-{n:04d}" for n in range(5)]
+    assert all(record["status"] == "pending" for record in scanned)
+    assert {record["invoice_id"]: record["status"] for record in journal.scan("invoices")}["INV-0003"] == "paid"
+
+
+def test_updates_trigger_compaction(journals):
+    journal = journals(segment_size=512, compact_ratio=0.5)
+    journal.put_many("invoices", [_invoice(n) for n in range(10)])
+    for _ in range(5):
+        journal.put_many("invoices", [_invoice(n, "paid") for n in range(10)])
+
+    stats = journal.stats()["invoices"]
+    assert 1 - stats["live_bytes"] / stats["bytes"] <= 0.5
+    assert sorted(journal.scan("invoices"), key=lambda r: r["invoice_id"]) == [_invoice(n, "paid") for n in range(10)]
+    # Superseded segments are removed from disk
+    state = journal._collections["invoices"]
+    assert sorted(state.segments()) == sorted(state.readers)
+
+
+def test_compact_keeps_records_and_journal_order(journals):
+    journal = journals(segment_size=256, compact_ratio=1.0)
+    journal.put_many("invoices", [_invoice(n) for n in range(6)])
+    journal.put("invoices", "INV-0002", _invoice(2, "paid"))
+    order = [record["invoice_id"] for record in journal.scan("invoices")]
+
+    sizes = journal.compact()
+    stats = journal.stats()["invoices"]
+    assert sizes["invoices"] == stats["bytes"] == stats["live_bytes"]
+    assert [record["invoice_id"] for record in journal.scan("invoices")] == order
+    assert journal.get("invoices", "INV-0002")["status"] == "paid"
+    journal.close()
+    assert [record["invoice_id"] for record in journals().scan("invoices")] == order
+
+
+def test_compact_waits_for_running_scans(journals):
+    journal = journals(compact_ratio=1.0)
+    journal.put_many("invoices", [_invoice(n) for n in range(4)])
+    for n in range(4):
+        journal.put("invoices", f"INV-{n:04d}", _invoice(n, "paid"))
+    scan = journal.scan("invoices")
+    first = next(scan)
+    segments = journal.stats()["invoices"]["segments"]
+
+    journal.compact()
+    # Nothing moved under the scan
+    assert journal.stats()["invoices"]["segments"] == segments
+    assert [first] + list(scan) == [_invoice(n, "paid") for n in range(4)]
+    # The scan ran the compaction when it finished
+    stats = journal.stats()["invoices"]
+    assert stats["bytes"] == stats["live_bytes"]
+    assert sorted(journal.scan("invoices"), key=lambda r: r["invoice_id"]) == [_invoice(n, "paid") for n in range(4)]
+
+
+def test_changed_since_skips_older_segments(journals):
+    journal = journals(segment_size=200)
+    journal.put_many("invoices", [_invoice(n) for n in range(3)])
+    journal.put("invoices", "INV-0003", _invoice(3))
+    state = journal._collections["invoices"]
+    assert len(state.readers) > 1
+    # Segments last written an hour ago
+    past = time.time() - 3600
+    for segment in state.readers:
+        os.utime(state.path(segment), (past, past))
+
+    since = time.time() - 60
+    assert list(journal.changed_since("invoices", since)) == []
+    journal.put("invoices", "INV-0001", _invoice(1, "paid"))
+    journal.put("invoices", "INV-0004", _invoice(4))
+    # Unchanged records sharing the written segment come too; those in the sealed one do not
+    changed = [record["invoice_id"] for record in journal.changed_since("invoices", since)]
+    assert changed == ["INV-0003", "INV-0001", "INV-0004"]
+    # Compaction rewrites every record
+    journal.compact()
+    assert len(list(journal.changed_since("invoices", since))) == 5
+
+
+def test_insert_refuses_existing_ids(journals):
+    journal = journals()
+    journal.insert("invoices", "INV-0001", _invoice(1))
+    with pytest.raises(RecordExistsError):
+        journal.insert_many("invoices", [_invoice(2), _invoice(1)])
+    assert journal.count("invoices") == 1
+
+
+@pytest.mark.skipif(journal_module.fcntl is None, reason="needs flock()")
+def test_second_opener_is_refused(journals):
+    journals()
+    with pytest.raises(JournalInUseError):
+        journals()
@@ -0,0 +1,135 @@
+import logging
+import os
+import subprocess
+import sys
+import textwrap
+import pytest
+import app as app_module
+from conftest import new_invoice
+from database import BillingDatabase
+from metrics import CONTENT_TYPE, Registry, ValueFile, read_values
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _worker(directory: str, code: str) -> subprocess.Popen:
+    """Start a process that records values into directory, as another worker would"""
+    script = textwrap.dedent(f"""
+        import sys
+        from metrics import ValueFile
+        values = ValueFile({directory!r})
+    """) + textwrap.dedent(code)
+    return subprocess.Popen([sys.executable, "-c", script], cwd=ROOT, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+
+@pytest.fixture
+def registry(tmp_path):
+    registry = Registry()
+    registry._enabled = True
+    registry.values.directory = str(tmp_path / "metrics")
+    return registry
+
+
+def test_values_of_exited_workers_are_merged(tmp_path):
+    directory = str(tmp_path / "metrics")
+    exited = _worker(directory, """
+        values.add([("requests", 3.0), ("errors", 1.0)])
+    """)
+    assert exited.wait() == 0
+    running = _worker(directory, """
+        values.add([("requests", 5.0)])
+        print("ready", flush=True)
+        sys.stdin.read()
+    """)
+    try:
+        assert running.stdout.readline() == b"ready\n"
+        values = ValueFile(directory)
+        values.add([("requests", 1.0)])
+
+        # The exited worker's file was taken over; the running worker keeps its own
+        assert sorted(os.listdir(directory)) == sorted([f"{os.getpid()}.db", f"{running.pid}.db"])
+        assert read_values(directory) == {"requests": 9.0, "errors": 1.0}
+    finally:
+        running.communicate(b"")
+
+
+def test_value_file_grows_past_its_initial_size(tmp_path):
+    directory = str(tmp_path / "metrics")
+    values = ValueFile(directory)
+    keys = [f"sample_{n:05d}_" + "x" * 40 for n in range(2000)]
+    values.add([(key, 1.0) for key in keys])
+    values.add([(keys[0], 1.5)])
+
+    totals = read_values(directory)
+    assert len(totals) == 2000 and totals[keys[0]] == 2.5
+
+
+def test_render_text_format(registry):
+    requests = registry.counter("test_requests_total", "Requests", ["method"])
+    latency = registry.histogram("test_seconds", "Latency", buckets=(0.1, 1.0))
+    registry.gauge("test_queue", "Queue depth", ["state"], collect=lambda: [(("pending",), 3), (("failed",), 0.5)])
+    requests.labels("GET").inc()
+    requests.labels('P"O\\ST').inc(2)
+    for value in (0.05, 0.5, 5.0):
+        latency.observe(value)
+
+    lines = registry.render().splitlines()
+    assert lines[:4] == ["# HELP test_requests_total Requests", "# TYPE test_requests_total counter",
+                         'test_requests_total{method="GET"} 1', 'test_requests_total{method="P\\"O\\\\ST"} 2']
+    assert lines[4:11] == [
+        "# HELP test_seconds Latency", "# TYPE test_seconds histogram",
+        'test_seconds_bucket{le="0.1"} 1', 'test_seconds_bucket{le="1"} 2', 'test_seconds_bucket{le="+Inf"} 3',
+        "test_seconds_sum 5.55", "test_seconds_count 3"
+    ]
+    assert lines[11:] == ["# HELP test_queue Queue depth", "# TYPE test_queue gauge",
+                          'test_queue{state="pending"} 3', 'test_queue{state="failed"} 0.5']
+
+
+def test_render_logs_failing_collectors(registry, caplog):
+    def broken():
+        raise OSError("outbox unavailable")
+
+    registry.gauge("test_broken", "Broken", collect=broken)
+    registry.counter("test_total", "Total").inc()
+    with caplog.at_level(logging.ERROR, logger="app"):
+        text = registry.render()
+
+    assert "test_broken" not in text and "test_total 1" in text
+    assert [record.getMessage() for record in caplog.records] == ["Error collecting metric test_broken"]
+    assert caplog.records[0].exc_info[0] is OSError
+
+
+def test_disabled_registry_records_nothing(tmp_path):
+    registry = Registry()
+    registry._enabled = False
+    registry.values.directory = str(tmp_path / "metrics")
+    registry.counter("test_total", "Total").inc()
+    registry.histogram("test_seconds", "Latency").observe(1.0)
+    assert registry.render() == ""
+    assert not os.path.exists(registry.values.directory)
+
+
+@pytest.fixture
+def client(data_dir, monkeypatch):
+    monkeypatch.setitem(app_module.app.config, "DATABASE", BillingDatabase(data_dir))
+    monkeypatch.setattr(app_module, "db", None)
+    return app_module.app.test_client()
+
+
+def test_metrics_route(client, metrics_dir):
+    invoice_id = client.post("/api/invoices", json=new_invoice()).get_json()["invoice_id"]
+    client.get(f"/api/invoices/{invoice_id}")
+    client.get("/api/invoices/INV-MISSING")
+
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["Content-Type"] == CONTENT_TYPE
+    text = response.get_data(as_text=True)
+    # Labelled by route pattern rather than by invoice ID
+    assert 'billing_http_requests_total{method="GET",endpoint="/api/invoices/<invoice_id>",status="200"} 1' in text
+    assert 'billing_http_requests_total{method="GET",endpoint="/api/invoices/<invoice_id>",status="404"} 1' in text
+    assert 'billing_http_request_duration_seconds_count{method="POST",endpoint="/api/invoices"} 1' in text
+    assert "# TYPE billing_storage_operation_seconds histogram" in text
+
+
+def test_metrics_route_is_off_when_disabled(client):
+    assert client.get("/metrics").status_code == 404
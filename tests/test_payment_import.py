@@ -0,0 +1,101 @@
+from datetime import datetime, timezone
+import io
+import json
+import time
+import pytest
+from conftest import new_invoice
+from database import BillingDatabase
+from payment_import import import_payments, read_rows
+
+
+@pytest.fixture
+def db(data_dir):
+    return BillingDatabase(data_dir)
+
+
+@pytest.fixture
+def new_york(monkeypatch):
+    """Run in a time zone other than UTC, so offset conversion is visible"""
+    if not hasattr(time, "tzset"):
+        pytest.skip("needs time.tzset()")
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def _export(fmt: str, rows: list) -> io.StringIO:
+    if fmt == "csv":
+        lines = ["invoice_id,amount,payment_method,recorded_at"]
+        lines += [",".join(str(row.get(field, "")) for field in ("invoice_id", "amount", "payment_method", "recorded_at"))
+                  for row in rows]
+    else:
+        lines = [json.dumps(row) for row in rows]
+    return io.StringIO("\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_import_converts_offsets_and_rejects_bad_rows(db, new_york, fmt):
+    paid, other = db.create_invoice(new_invoice(amount=100)), db.create_invoice(new_invoice(amount=50))
+    summary = import_payments(db, read_rows(_export(fmt, [
+        {"invoice_id": paid, "amount": 100, "payment_method": "PayPal", "recorded_at": "2024-05-01T10:00:00Z"},
+        {"invoice_id": other, "amount": 20, "payment_method": "PayPal", "recorded_at": "2024-05-01T10:00:00+02:00"},
+        {"invoice_id": other, "amount": 20, "payment_method": "PayPal", "recorded_at": "May 1st"},
+    ]), fmt))
+
+    assert (summary["imported"], summary["rejected_count"], summary["invoices_paid"]) == (2, 1, 1)
+    assert summary["rejected"][0]["line"] == (4 if fmt == "csv" else 3)
+    recorded = sorted(payment["recorded_at"] for payment in db.storage.scan("payments"))
+    assert recorded == ["2024-05-01T04:00:00", "2024-05-01T06:00:00"]
+    assert db.get_invoice(paid)["status"] == "paid"
+    assert db.rollups.payment_count() == 2
+    # A restart finds the rollups in step with storage
+    assert BillingDatabase(db.data_dir).rollups.payment_count() == 2
+
+
+@pytest.mark.parametrize("fmt", ["csv", "ndjson"])
+def test_failed_import_stores_nothing_and_can_be_retried(db, monkeypatch, fmt):
+    invoice_id = db.create_invoice(new_invoice(amount=100))
+    rows = [{"invoice_id": invoice_id, "amount": 100, "payment_method": "PayPal",
+             "recorded_at": datetime(2024, 5, 1, 10).isoformat()}]
+
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(db.storage, "insert_many", fail)
+        with pytest.raises(OSError):
+            import_payments(db, read_rows(_export(fmt, rows), fmt))
+    assert db.storage.count("payments") == 0
+    assert db.rollups.payment_count() == 0
+    assert db.get_invoice(invoice_id)["status"] == "pending"
+
+    summary = import_payments(db, read_rows(_export(fmt, rows), fmt))
+    assert (summary["imported"], summary["invoices_paid"]) == (1, 1)
+    assert db.storage.count("payments") == db.rollups.payment_count() == 1
+    report = db.generate_report("revenue", datetime(2024, 1, 1), datetime(2024, 12, 31, 23, 59, 59))
+    assert report["data"]["total_revenue"] == 100
+
+
+def test_payment_the_rollups_reject_is_not_stored(db, monkeypatch):
+    invoice_id = db.create_invoice(new_invoice(amount=100))
+
+    def reject(*args):
+        raise TypeError("can't subtract offset-naive and offset-aware datetimes")
+
+    monkeypatch.setattr(db.rollups, "_apply", reject)
+    with pytest.raises(TypeError):
+        db.record_payment({"invoice_id": invoice_id, "amount": 100, "payment_method": "PayPal"})
+    assert db.storage.count("payments") == 0
+    assert db.get_invoice(invoice_id)["status"] == "pending"
+
+
+def test_validate_payment_normalizes_recorded_at(db):
+    payment = {"invoice_id": "INV-1", "amount": 10, "payment_method": "PayPal",
+               "recorded_at": "2024-05-01T10:00:00+00:00"}
+    assert db.validate_payment(payment) == []
+    expected = datetime(2024, 5, 1, 10, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert payment["recorded_at"] == expected.isoformat()
+    assert db.validate_payment(dict(payment, recorded_at="2024-05-01")) == []
+    assert db.validate_payment(dict(payment, recorded_at=20240501)) == ["recorded_at must be an ISO date"]
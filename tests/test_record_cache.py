@@ -0,0 +1,61 @@
+import pytest
+from conftest import metric_value, new_invoice
+from database import BillingDatabase
+from record_cache import RecordCache
+from storage import JsonFileStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = JsonFileStorage(str(tmp_path / "data"))
+    yield storage
+    storage.close()
+
+
+def _hits_and_misses(directory: str) -> tuple:
+    return tuple(metric_value(directory, "billing_record_cache_requests_total",
+                              [("collection", "invoices"), ("result", result)]) for result in ("hit", "miss"))
+
+
+def test_cached_record_is_reloaded_when_its_version_changes(storage, metrics_dir):
+    storage.put("invoices", "INV-1", {"invoice_id": "INV-1", "status": "pending"})
+    cache = RecordCache(storage, "invoices")
+    first = cache.get("INV-1")
+    assert cache.get("INV-1") is first
+    assert _hits_and_misses(metrics_dir) == (1, 1)
+
+    # Rewritten without invalidate(), as by another worker
+    storage.put("invoices", "INV-1", {"invoice_id": "INV-1", "status": "paid"})
+    assert storage.version("invoices", "INV-1") != first.version
+    second = cache.get("INV-1")
+    assert second.record["status"] == "paid" and second.etag != first.etag
+    assert _hits_and_misses(metrics_dir) == (1, 2)
+
+
+def test_missing_records_are_not_cached(storage):
+    cache = RecordCache(storage, "invoices")
+    assert cache.get("INV-404") is None
+    storage.put("invoices", "INV-404", {"invoice_id": "INV-404"})
+    assert cache.get("INV-404").record == {"invoice_id": "INV-404"}
+
+
+def test_least_recently_used_records_are_evicted(storage, metrics_dir):
+    for n in range(3):
+        storage.put("invoices", f"INV-{n}", {"invoice_id": f"INV-{n}"})
+    cache = RecordCache(storage, "invoices", max_entries=2)
+    cache.get("INV-0"), cache.get("INV-1"), cache.get("INV-0"), cache.get("INV-2")
+
+    cache.get("INV-0")
+    assert _hits_and_misses(metrics_dir) == (2, 3)
+    cache.get("INV-1")
+    assert _hits_and_misses(metrics_dir) == (2, 4)
+
+
+def test_database_writes_invalidate_the_cache(data_dir):
+    db = BillingDatabase(data_dir)
+    invoice_id = db.create_invoice(new_invoice())
+    etag = db.get_invoice_entry(invoice_id).etag
+
+    db.update_invoice_status(invoice_id, "paid")
+    entry = db.get_invoice_entry(invoice_id)
+    assert entry.record["status"] == "paid" and entry.etag != etag
@@ -0,0 +1,30 @@
+from datetime import datetime
+import json
+from report_cache import ReportCache, estimate_size
+from reports import run_reports
+
+PERIOD = (datetime(2025, 1, 1), datetime(2025, 12, 31, 23, 59, 59))
+
+
+def test_estimate_size_tracks_the_json_length(sample_storage):
+    reports = run_reports(sample_storage, ["revenue", "outstanding", "client_analysis", "service_metrics",
+                                           "payment_trends"], *PERIOD)
+    for report_type, report in reports.items():
+        actual = len(json.dumps(report, default=str))
+        assert 0.75 * actual <= estimate_size(report) <= 1.25 * actual, report_type
+
+
+def test_cache_evicts_by_estimated_size():
+    row = {"invoice_id": "INV-1", "client_name": "Acme"}
+    report = {"rows": [row] * 100}
+    size = estimate_size(report)
+    cache = ReportCache(max_entries=10, max_bytes=2 * size + 1)
+    for key in "abc":
+        cache.put(key, 1, report)
+
+    assert cache.get("a", 1) is None
+    assert cache.get("c", 1) is report
+    assert cache.stats()["bytes"] == 2 * size
+    # A report larger than the whole cache is not kept
+    cache.put("big", 1, {"rows": [row] * 1000})
+    assert cache.get("big", 1) is None
@@ -0,0 +1,63 @@
+from collections import Counter
+from datetime import datetime
+import pytest
+from reports import ACCUMULATORS, REPORT_TYPES, InvoiceJoin, run_reports
+
+PERIOD = (datetime(2025, 3, 1), datetime(2025, 10, 31, 23, 59, 59))
+
+
+@pytest.fixture
+def reads(sample_storage, monkeypatch):
+    """Counts the storage calls made by the reports, by method name"""
+    counts = Counter()
+    for name in ("get", "scan", "query_invoices", "query_payments"):
+        method = getattr(sample_storage, name)
+
+        def counted(*args, _name=name, _method=method, **kwargs):
+            counts[_name] += 1
+            return _method(*args, **kwargs)
+
+        monkeypatch.setattr(sample_storage, name, counted)
+    return counts
+
+
+def _per_invoice_report(storage, report_type: str) -> dict:
+    """A report built the way it was before the join: one invoice read per payment"""
+    accumulator = ACCUMULATORS[report_type](*PERIOD, get_invoice=lambda invoice_id: storage.get("invoices", invoice_id))
+    for collection in accumulator.collections:
+        for record in storage.scan(collection):
+            accumulator.add(record)
+    return accumulator.finish()
+
+
+def test_single_pass_matches_separate_reports(sample_storage, reads, assert_same_report):
+    combined = run_reports(sample_storage, REPORT_TYPES, *PERIOD)
+    # One read of each collection for all five reports
+    assert (reads["query_invoices"], reads["query_payments"]) == (1, 1)
+
+    for report_type in REPORT_TYPES:
+        assert_same_report(combined[report_type], run_reports(sample_storage, [report_type], *PERIOD)[report_type])
+
+
+@pytest.mark.parametrize("report_type", ["client_analysis", "payment_trends"])
+def test_payment_reports_join_invoices_without_reading_each(sample_storage, reads, assert_same_report, report_type):
+    fallback = Counter()
+
+    def get_invoice(invoice_id):
+        fallback[invoice_id] += 1
+        return sample_storage.get("invoices", invoice_id)
+
+    report = run_reports(sample_storage, [report_type], *PERIOD, get_invoice=get_invoice)[report_type]
+    assert reads["get"] == 0 and not fallback
+    assert_same_report(report, _per_invoice_report(sample_storage, report_type))
+
+
+def test_join_falls_back_for_invoices_missing_from_the_pass():
+    calls = []
+    join = InvoiceJoin(["client_name"], lambda invoice_id: calls.append(invoice_id) or {"client_name": "Late"})
+    join.add({"invoice_id": "INV-1", "client_name": "Acme", "amount": 100})
+
+    assert join.get("INV-1") == {"client_name": "Acme"}
+    assert join.get("INV-2") == {"client_name": "Late"}
+    assert calls == ["INV-2"]
+    assert InvoiceJoin(["client_name"]).get("INV-2") is None
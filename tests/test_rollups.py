@@ -0,0 +1,100 @@
+from datetime import datetime
+import os
+import pytest
+from conftest import new_invoice
+from database import BillingDatabase
+from reports import run_reports
+from rollups import RollupStore
+
+PERIODS = [
+    (datetime(2025, 1, 1), datetime(2025, 12, 31, 23, 59, 59, 999999)),
+    (datetime(2025, 3, 14, 12, 0), datetime(2025, 6, 30, 18, 30)),
+    (datetime(2025, 5, 2, 8, 0), datetime(2025, 5, 2, 17, 0))
+]
+
+
+@pytest.fixture
+def rollups(tmp_path):
+    store = RollupStore(str(tmp_path / "rollups.db"))
+    yield store
+    store.close()
+
+
+@pytest.mark.parametrize("start,end", PERIODS)
+def test_rollups_match_a_full_scan(sample_storage, rollups, assert_same_report, start, end):
+    assert rollups.rebuild(sample_storage) == sample_storage.count("payments")
+    expected = run_reports(sample_storage, ["revenue", "payment_trends"], start, end)
+    assert_same_report(rollups.revenue_report(start, end), expected["revenue"], "revenue")
+    assert_same_report(rollups.payment_trends_report(start, end), expected["payment_trends"], "payment_trends")
+
+
+def test_payment_with_null_method_is_counted_as_unknown(rollups):
+    payment = {"payment_id": "PAY-1", "invoice_id": "INV-1", "amount": 120,
+               "payment_method": None, "recorded_at": datetime(2025, 4, 2, 10, 0).isoformat()}
+    rollups.add_payment(payment, {"created_at": datetime(2025, 3, 1).isoformat()})
+    report = rollups.revenue_report(datetime(2025, 4, 1), datetime(2025, 4, 30))
+    assert report["payment_methods"] == {"unknown": 120}
+    assert report["paid_invoices"] == ["INV-1"]
+
+
+def _payment(payment_id: str, invoice_id: str, recorded_at: str, amount: int = 100) -> dict:
+    return {"payment_id": payment_id, "invoice_id": invoice_id, "amount": amount,
+            "payment_method": "PayPal", "recorded_at": recorded_at}
+
+
+def test_sync_folds_in_only_the_missing_payments(sample_storage, rollups, assert_same_report, monkeypatch):
+    rollups.rebuild(sample_storage)
+    assert rollups.sync(sample_storage) is None
+
+    invoice = next(iter(sample_storage.scan("invoices")))
+    # Stored by a worker that stopped before folding it in
+    sample_storage.put("payments", "PAY-LATE", _payment("PAY-LATE", invoice["invoice_id"], "2025-06-01T12:00:00"))
+    scan = sample_storage.scan
+
+    def no_full_scans(collection):
+        raise AssertionError(f"scanned {collection}")
+
+    monkeypatch.setattr(sample_storage, "scan", no_full_scans)
+    assert rollups.sync(sample_storage) == 1
+    assert rollups.payment_count() == sample_storage.count("payments")
+
+    monkeypatch.setattr(sample_storage, "scan", scan)
+    start, end = PERIODS[0]
+    expected = run_reports(sample_storage, ["revenue", "payment_trends"], start, end)
+    assert_same_report(rollups.revenue_report(start, end), expected["revenue"], "revenue")
+    assert_same_report(rollups.payment_trends_report(start, end), expected["payment_trends"], "payment_trends")
+
+
+def test_sync_rebuilds_when_payments_were_removed(sample_storage, rollups, tmp_path):
+    rollups.rebuild(sample_storage)
+    payment = next(iter(sample_storage.scan("payments")))
+    os.remove(os.path.join(sample_storage.data_dir, "payments", f"{payment['payment_id']}.json"))
+
+    assert rollups.sync(sample_storage) == sample_storage.count("payments")
+    assert rollups.sync(sample_storage) is None
+
+
+def test_rebuild_skips_payments_it_cannot_fold(sample_storage, rollups):
+    invoice = next(iter(sample_storage.scan("invoices")))
+    sample_storage.put_many("payments", [
+        _payment("PAY-BAD", invoice["invoice_id"], "last Tuesday"),
+        # Stored with an offset before validation converted them
+        _payment("PAY-AWARE", invoice["invoice_id"], "2025-06-01T12:00:00+00:00")
+    ])
+
+    folded = rollups.rebuild(sample_storage)
+    assert folded == sample_storage.count("payments") - 1
+    assert rollups.payment_count() == folded
+    # The skipped payment does not make the rollups look out of step
+    assert rollups.sync(sample_storage) is None
+
+
+def test_database_starts_with_an_unfoldable_payment(data_dir):
+    db = BillingDatabase(data_dir)
+    invoice_id = db.create_invoice(new_invoice())
+    db.record_payment({"invoice_id": invoice_id, "amount": 100, "payment_method": "PayPal"})
+    db.storage.put("payments", "PAY-BAD", _payment("PAY-BAD", invoice_id, "not a date"))
+    os.remove(os.path.join(data_dir, "rollups.db"))
+
+    restarted = BillingDatabase(data_dir)
+    assert restarted.rollups.payment_count() == 1
@@ -0,0 +1,116 @@
+from datetime import date, datetime
+from decimal import Decimal
+import json
+import os
+import sys
+import pytest
+from flask.json.provider import DefaultJSONProvider
+import manage
+import serializers
+from conftest import sample_records
+from serializers import JsonSerializer, MsgpackSerializer, available_serializers, get_serializer
+from storage import JsonFileStorage
+
+RECORD = {
+    "invoice_id": "INV-1",
+    "amount": Decimal("1234.50"),
+    "created_at": datetime(2025, 3, 1, 9, 30, 15),
+    "due_date": date(2025, 3, 31),
+    "services": ["Hosting", "SEO Setup"],
+    "paid": None,
+    "totals": {2025: 1.5}
+}
+
+
+def _isoformat(value):
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot encode {type(value).__name__}")
+
+
+@pytest.fixture(params=["json", "orjson", "msgpack"])
+def serializer(request, monkeypatch):
+    if request.param == "json":
+        # The standard library fallback used when orjson is not installed
+        monkeypatch.setattr(serializers, "orjson", None)
+    elif request.param == "orjson" and serializers.orjson is None:
+        pytest.skip("orjson is not installed")
+    if request.param == "msgpack":
+        if serializers.msgpack is None:
+            pytest.skip("msgpack is not installed")
+        return MsgpackSerializer()
+    return JsonSerializer()
+
+
+@pytest.mark.parametrize("default", [_isoformat, DefaultJSONProvider.default])
+def test_round_trip_matches_the_standard_encoder(serializer, default):
+    expected = json.loads(json.dumps(RECORD, default=default))
+    decoded = serializer.loads(serializer.dumps(RECORD, default=default))
+    if isinstance(serializer, MsgpackSerializer):
+        # MessagePack keeps integer keys
+        decoded["totals"] = {str(key): value for key, value in decoded["totals"].items()}
+    assert decoded == expected
+    # Dates and amounts go through default however the encoder would write them
+    assert decoded["amount"] == default(RECORD["amount"])
+    assert decoded["created_at"] == default(RECORD["created_at"])
+
+
+def test_unencodable_values_raise_type_error(serializer):
+    with pytest.raises(TypeError):
+        serializer.dumps({"amount": Decimal("1.10")})
+
+
+def test_sorted_keys(serializer):
+    encoded = serializer.dumps({"b": 1, "a": 2, "c": {"z": 1, "y": 2}}, sort_keys=True)
+    assert list(serializer.loads(encoded)) == ["a", "b", "c"]
+
+
+def test_json_output_is_compact(monkeypatch):
+    monkeypatch.setattr(serializers, "orjson", None)
+    assert JsonSerializer().dumps({"a": [1, 2]}) == b'{"a":[1,2]}'
+
+
+def test_unknown_format_is_rejected():
+    with pytest.raises(ValueError):
+        get_serializer("yaml")
+    assert set(available_serializers()) <= {".json", ".msgpack"}
+
+
+def _run_manage(monkeypatch, *args):
+    monkeypatch.setattr(sys, "argv", ["manage.py", *args])
+    manage.main()
+
+
+def _extensions(data_dir: str) -> set:
+    return {os.path.splitext(name)[1] for collection in ("invoices", "payments")
+            for _, _, names in os.walk(os.path.join(data_dir, collection)) for name in names}
+
+
+@pytest.mark.skipif(serializers.msgpack is None, reason="msgpack is not installed")
+@pytest.mark.parametrize("layout", ["flat", "sharded"])
+def test_convert_between_formats(tmp_path, monkeypatch, capsys, layout):
+    data_dir = str(tmp_path / "data")
+    invoices, payments = (sorted(records, key=lambda r: r.get("payment_id", r["invoice_id"]))
+                          for records in sample_records(invoices=20))
+    storage = JsonFileStorage(data_dir, layout=layout)
+    storage.put_many("invoices", invoices)
+    storage.put_many("payments", payments)
+    storage.close()
+
+    _run_manage(monkeypatch, "convert", "--data-dir", data_dir, "--to", "msgpack", "--layout", layout)
+    assert f"Converted {len(invoices)} invoices to msgpack" in capsys.readouterr().out
+    assert _extensions(data_dir) == {".msgpack"}
+    converted = JsonFileStorage(data_dir, layout=layout, serializer=get_serializer("msgpack"))
+    assert sorted(converted.scan("invoices"), key=lambda r: r["invoice_id"]) == invoices
+    # A server still configured for JSON reads the converted records
+    assert JsonFileStorage(data_dir, layout=layout).get("payments", payments[0]["payment_id"]) == payments[0]
+
+    _run_manage(monkeypatch, "convert", "--data-dir", data_dir, "--to", "json", "--layout", layout)
+    assert _extensions(data_dir) == {".json"}
+    restored = JsonFileStorage(data_dir, layout=layout)
+    assert sorted(restored.scan("payments"), key=lambda r: r["payment_id"]) == payments
+    # Nothing is left to move
+    _run_manage(monkeypatch, "convert", "--data-dir", data_dir, "--to", "json", "--layout", layout)
+    assert "Converted 0 invoices to json" in capsys.readouterr().out
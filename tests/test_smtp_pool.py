@@ -0,0 +1,149 @@
+import socketserver
+import threading
+import pytest
+from conftest import metric_value
+from email_service import EmailService
+from smtp_pool import SMTPConnectionPool
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Just enough SMTP for smtplib, with rejections and dropped sessions"""
+
+    def _reply(self, line: str) -> None:
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        sent = 0
+        recipient = None
+        self._reply("220 localhost test server")
+        for line in self.rfile:
+            command = line.decode().strip()
+            upper = command.upper()
+            if upper.startswith("EHLO"):
+                self.wfile.write(b"250-localhost\r\n250 8BITMIME\r\n")
+            elif upper.startswith("RCPT"):
+                recipient = command[command.index("<") + 1:command.index(">")]
+                self._reply("550 No such user" if recipient in server.rejected else "250 OK")
+            elif upper.startswith("DATA"):
+                self._reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with server.lock:
+                    server.received.append(recipient)
+                self._reply("250 OK")
+                sent += 1
+                if sent == server.drop_after:
+                    # Hang up between messages, as servers do on idle or busy sessions
+                    return
+            elif upper.startswith("QUIT"):
+                self._reply("221 Bye")
+                return
+            else:
+                self._reply("250 OK")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.received = []
+        self.rejected = set()
+        self.drop_after = None
+
+
+@pytest.fixture
+def smtp_server():
+    server = _Server()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def _config(port: int) -> dict:
+    return {"host": "127.0.0.1", "port": port, "username": "", "password": "", "use_tls": False,
+            "from_email": "billing@chromapages.com", "from_name": "Chromapages Billing"}
+
+
+def _emails(*recipients) -> list:
+    return [{"to_email": to, "subject": "Invoice", "body": "Your invoice is attached."} for to in recipients]
+
+
+@pytest.fixture
+def service(smtp_server):
+    service = EmailService(_config(smtp_server.server_address[1]))
+    yield service
+    service.pool.close()
+
+
+def test_messages_reuse_one_connection(smtp_server, service):
+    assert service.send_many(_emails("a@example.com", "b@example.com")) == [True, True]
+    assert service._send_email("c@example.com", "Reminder", "Overdue")
+    assert service.send_many(_emails("d@example.com")) == [True]
+
+    assert smtp_server.received == ["a@example.com", "b@example.com", "c@example.com", "d@example.com"]
+    assert smtp_server.connections == 1
+
+
+def test_connections_are_retired_after_max_messages(smtp_server):
+    pool = SMTPConnectionPool(_config(smtp_server.server_address[1]), max_messages=2)
+    service = EmailService(pool.config)
+    service.pool = pool
+    assert service.send_many(_emails(*(f"{n}@example.com" for n in range(5)))) == [True] * 5
+    pool.close()
+    assert len(smtp_server.received) == 5 and smtp_server.connections == 3
+
+
+def test_idle_connections_expire(smtp_server):
+    pool = SMTPConnectionPool(_config(smtp_server.server_address[1]), idle_timeout=0)
+    service = EmailService(pool.config)
+    service.pool = pool
+    service.send_many(_emails("a@example.com"))
+    pool._idle[0].last_used -= 1
+    service.send_many(_emails("b@example.com"))
+    pool.close()
+    assert smtp_server.connections == 2
+
+
+def test_reconnects_after_the_server_hangs_up(smtp_server, service, metrics_dir):
+    smtp_server.drop_after = 2
+    assert service.send_many(_emails(*(f"{n}@example.com" for n in range(4)))) == [True] * 4
+    # A pooled connection the server closed while it sat idle
+    assert service.send_many(_emails("4@example.com", "5@example.com")) == [True, True]
+
+    # Hung up after the 2nd and 4th messages
+    assert len(smtp_server.received) == 6 and smtp_server.connections == 3
+    assert metric_value(metrics_dir, "billing_smtp_send_seconds_count") == 6
+    assert metric_value(metrics_dir, "billing_smtp_failures_total", [("reason", "error")]) == 0
+
+
+def test_rejected_recipients_do_not_fail_the_batch(smtp_server, service, metrics_dir):
+    smtp_server.rejected = {"gone@example.com"}
+    results = service.send_many(_emails("a@example.com", "gone@example.com", "b@example.com"))
+
+    assert results == [True, False, True]
+    assert smtp_server.received == ["a@example.com", "b@example.com"]
+    # The session survived the rejection
+    assert smtp_server.connections == 1
+    assert metric_value(metrics_dir, "billing_smtp_failures_total", [("reason", "rejected")]) == 1
+
+
+def test_unreachable_server_fails_the_whole_batch(smtp_server, metrics_dir):
+    port = smtp_server.server_address[1]
+    smtp_server.shutdown()
+    smtp_server.server_close()
+    service = EmailService(_config(port))
+
+    assert service.send_many(_emails("a@example.com", "b@example.com")) == [False, False]
+    assert not service._send_email("c@example.com", "Reminder", "Overdue")
+    assert metric_value(metrics_dir, "billing_smtp_failures_total", [("reason", "error")]) == 3
+    # Nothing broken was kept for reuse
+    assert service.pool._idle == []
@@ -0,0 +1,126 @@
+from datetime import datetime
+import json
+import os
+import shutil
+import sys
+import pytest
+import manage
+from conftest import sample_records
+from database import BillingDatabase
+from reports import REPORT_TYPES
+from storage import JsonFileStorage, SqliteStorage, StorageBackend
+
+INVOICE_FILTERS = [
+    {"status": "pending"},
+    {"client_name": "Globex"},
+    {"status": "pending", "due_start": datetime(2025, 6, 1), "due_end": datetime(2025, 9, 30, 23, 59, 59)},
+    {"created_start": datetime(2025, 2, 1), "created_end": datetime(2025, 2, 28, 23, 59, 59)},
+    {"client_name": "Acme", "created_end": datetime(2025, 6, 1, 9, 30)},
+]
+PAYMENT_FILTERS = [
+    {"start": datetime(2025, 4, 1), "end": datetime(2025, 4, 30, 23, 59, 59)},
+    {"end": datetime(2025, 3, 1)},
+]
+
+
+def _migrate(monkeypatch, data_dir: str, *args) -> None:
+    monkeypatch.setattr(sys, "argv", ["manage.py", "migrate", "--data-dir", data_dir, *args])
+    manage.main()
+
+
+def _by_id(records, key: str = "invoice_id") -> list:
+    return sorted(records, key=lambda record: record[key])
+
+
+def _unordered(data):
+    """Report data with lists of records sorted, as backends scan in different orders"""
+    if isinstance(data, dict):
+        return {key: _unordered(value) for key, value in data.items()}
+    if isinstance(data, list) and data and isinstance(data[0], dict):
+        return sorted((_unordered(item) for item in data), key=lambda item: json.dumps(item, sort_keys=True))
+    return data
+
+
+@pytest.fixture
+def json_dir(tmp_path):
+    data_dir = str(tmp_path / "json" / "data")
+    storage = JsonFileStorage(data_dir)
+    invoices, payments = sample_records()
+    storage.put_many("invoices", invoices)
+    storage.put_many("payments", payments)
+    storage.close()
+    return data_dir
+
+
+@pytest.fixture
+def sqlite(json_dir, monkeypatch):
+    _migrate(monkeypatch, json_dir, "--batch-size", "7")
+    storage = SqliteStorage(os.path.join(json_dir, "billing.db"))
+    yield storage
+    storage.close()
+
+
+def test_migrate_copies_every_record(json_dir, sqlite, monkeypatch, capsys):
+    source = JsonFileStorage(json_dir)
+    for collection, key in (("invoices", "invoice_id"), ("payments", "payment_id")):
+        assert _by_id(sqlite.scan(collection), key) == _by_id(source.scan(collection), key)
+
+    # Running it again replaces rather than duplicates
+    _migrate(monkeypatch, json_dir)
+    invoices, payments = sample_records()
+    assert f"Imported {len(invoices)} invoices" in capsys.readouterr().out
+    assert (sqlite.count("invoices"), sqlite.count("payments")) == (len(invoices), len(payments))
+
+
+def test_migrate_to_another_path(json_dir, tmp_path, monkeypatch):
+    target = str(tmp_path / "elsewhere.db")
+    _migrate(monkeypatch, json_dir, "--db", target)
+    assert SqliteStorage(target).count("invoices") == len(sample_records()[0])
+    assert not os.path.exists(os.path.join(json_dir, "billing.db"))
+
+
+@pytest.mark.parametrize("filters", INVOICE_FILTERS)
+def test_invoice_queries_match_a_scan(sqlite, filters):
+    expected = _by_id(StorageBackend.query_invoices(sqlite, **filters))
+    assert expected
+    assert _by_id(sqlite.query_invoices(**filters)) == expected
+
+
+@pytest.mark.parametrize("filters", PAYMENT_FILTERS + [{"invoice_id": None}])
+def test_payment_queries_match_a_scan(sqlite, filters):
+    if "invoice_id" in filters:
+        filters = {"invoice_id": next(sqlite.scan("payments"))["invoice_id"]}
+    expected = _by_id(StorageBackend.query_payments(sqlite, **filters), "payment_id")
+    assert expected
+    assert _by_id(sqlite.query_payments(**filters), "payment_id") == expected
+
+
+@pytest.mark.parametrize("collection, filters", [("invoices", f) for f in INVOICE_FILTERS] +
+                                                [("payments", f) for f in PAYMENT_FILTERS])
+def test_queries_use_an_index(sqlite, monkeypatch, collection, filters):
+    statements = []
+    monkeypatch.setattr(sqlite, "_select", lambda sql, params=(): statements.append((sql, params)) or iter(()))
+    list(getattr(sqlite, f"query_{collection}")(**filters))
+
+    sql, params = statements[0]
+    plan = [row[-1] for row in sqlite._conn().execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    # SEARCH ... USING INDEX, rather than SCAN of the whole table
+    assert all(step.startswith("SEARCH") and "USING INDEX" in step for step in plan), plan
+
+
+def test_server_on_migrated_data_matches_json(json_dir, sqlite, tmp_path, monkeypatch, assert_same_report):
+    for name in ("EMAIL_OUTBOX", "METRICS", "INDEX_SNAPSHOT", "REPORT_COLUMNAR"):
+        monkeypatch.setenv(name, "false")
+    # Separate directories, so the two databases keep their own rollups and state
+    sqlite_dir = str(tmp_path / "sqlite" / "data")
+    os.makedirs(sqlite_dir)
+    shutil.copy(sqlite.db_path, sqlite_dir)
+    on_json = BillingDatabase(json_dir, storage=JsonFileStorage(json_dir))
+    on_sqlite = BillingDatabase(sqlite_dir, storage=SqliteStorage(os.path.join(sqlite_dir, "billing.db")))
+
+    period = (datetime(2025, 1, 1), datetime(2025, 12, 31, 23, 59, 59))
+    for report_type in REPORT_TYPES:
+        assert_same_report(_unordered(on_sqlite.generate_report(report_type, *period)["data"]),
+                           _unordered(on_json.generate_report(report_type, *period)["data"]))
+    assert (_by_id(on_sqlite.list_invoices(client_name="Hooli", limit=500)["invoices"])
+            == _by_id(on_json.list_invoices(client_name="Hooli", limit=500)["invoices"]))
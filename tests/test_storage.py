@@ -0,0 +1,177 @@
+from datetime import datetime
+import errno
+import json
+import logging
+import os
+import sqlite3
+import time
+import pytest
+from journal import JournalInUseError, JournalStorage
+from loader import ParallelLoader
+from durable import Durability
+from storage import JsonFileStorage, RecordExistsError, SqliteStorage
+
+
+def _invoice(record_id: str, amount: float = 100) -> dict:
+    return {
+        "invoice_id": record_id,
+        "client_name": "Acme",
+        "amount": amount,
+        "status": "pending",
+        "due_date": datetime(2025, 2, 28).isoformat(),
+        "created_at": datetime(2025, 1, 30).isoformat()
+    }
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = JsonFileStorage(str(tmp_path), loader=ParallelLoader(workers=4, batch_size=8, log_min_files=0))
+    yield storage
+    storage.close()
+
+
+def test_insert_refuses_to_overwrite(storage):
+    storage.insert("invoices", "INV-1", _invoice("INV-1", 100))
+    with pytest.raises(RecordExistsError):
+        storage.insert("invoices", "INV-1", _invoice("INV-1", 200))
+    assert storage.get("invoices", "INV-1")["amount"] == 100
+
+
+def test_insert_many_refuses_an_id_taken_in_another_layout(storage, tmp_path):
+    sharded = JsonFileStorage(str(tmp_path), layout="sharded")
+    sharded.insert("invoices", "INV-20250130-000000001", _invoice("INV-20250130-000000001"))
+    with pytest.raises(RecordExistsError):
+        storage.insert_many("invoices", [_invoice("INV-20250130-000000001", 200)])
+    assert storage.get("invoices", "INV-20250130-000000001")["amount"] == 100
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_scan_survives_relocate(tmp_path, workers):
+    flat = JsonFileStorage(str(tmp_path), loader=ParallelLoader(workers=workers, batch_size=8, log_min_files=0))
+    ids = [f"INV-20250130-{n:09d}" for n in range(100)]
+    flat.put_many("invoices", [_invoice(record_id) for record_id in ids])
+
+    scan = flat.scan("invoices")
+    seen = [next(scan)["invoice_id"]]
+    # manage.py reshard running while the scan is half way through
+    assert JsonFileStorage(str(tmp_path), layout="sharded").relocate("invoices") == 100
+    seen += [invoice["invoice_id"] for invoice in scan]
+    flat.close()
+
+    assert sorted(seen) == ids
+
+
+def test_journal_refuses_a_second_opener(tmp_path):
+    first = JournalStorage(str(tmp_path))
+    # flock() is per open file, so a second open in this process conflicts like another worker's
+    with pytest.raises(JournalInUseError):
+        JournalStorage(str(tmp_path))
+    first.close()
+    JournalStorage(str(tmp_path)).close()
+
+
+def test_sqlite_changed_since_returns_only_later_writes(tmp_path):
+    storage = SqliteStorage(str(tmp_path / "billing.db"))
+    storage.put_many("invoices", [_invoice(f"INV-{n}") for n in range(5)])
+    since = time.time()
+    time.sleep(0.01)
+    storage.put("invoices", "INV-2", dict(_invoice("INV-2"), status="paid"))
+    storage.insert("invoices", "INV-9", _invoice("INV-9"))
+    assert sorted(invoice["invoice_id"] for invoice in storage.changed_since("invoices", since)) == ["INV-2", "INV-9"]
+    storage.close()
+
+
+def test_sqlite_rows_from_before_updated_at_count_as_changed(tmp_path):
+    path = str(tmp_path / "billing.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE invoices (invoice_id TEXT PRIMARY KEY, status TEXT, due_date TEXT, "
+                 "created_at TEXT, client_name TEXT, data TEXT NOT NULL)")
+    conn.execute("INSERT INTO invoices (invoice_id, data) VALUES (?, ?)", ("INV-1", json.dumps(_invoice("INV-1"))))
+    conn.commit()
+    conn.close()
+
+    storage = SqliteStorage(path)
+    assert [invoice["invoice_id"] for invoice in storage.changed_since("invoices", time.time())] == ["INV-1"]
+    storage.close()
+
+
+def test_journal_changed_since_skips_older_segments(tmp_path):
+    # Every append fills a segment, so each record lands in its own
+    storage = JournalStorage(str(tmp_path), segment_size=1)
+    for n in range(4):
+        storage.put("invoices", f"INV-{n}", _invoice(f"INV-{n}"))
+    directory = os.path.join(str(tmp_path), "journal", "invoices")
+    for name in os.listdir(directory):
+        os.utime(os.path.join(directory, name), (time.time() - 600, time.time() - 600))
+    since = time.time() - 60
+    storage.put("invoices", "INV-1", dict(_invoice("INV-1"), status="paid"))
+
+    changed = list(storage.changed_since("invoices", since))
+    assert [(invoice["invoice_id"], invoice["status"]) for invoice in changed] == [("INV-1", "paid")]
+    storage.close()
+
+
+def test_json_changed_since_skips_directories_not_written_to(tmp_path):
+    storage = JsonFileStorage(str(tmp_path), layout="sharded")
+    storage.put_many("invoices", [_invoice(record_id) for record_id in ("INV-20250130-1", "INV-20250215-1")])
+    past = time.time() - 600
+    for directory, _, files in os.walk(os.path.join(str(tmp_path), "invoices")):
+        for name in files + [""]:
+            os.utime(os.path.join(directory, name), (past, past))
+    since = time.time() - 60
+    # A file in a directory nothing was written to is not even looked at
+    os.utime(os.path.join(str(tmp_path), "invoices", "2025", "01", "INV-20250130-1.json"))
+    assert list(storage.changed_since("invoices", since)) == []
+
+    storage.put("invoices", "INV-20250215-2", _invoice("INV-20250215-2"))
+    assert [invoice["invoice_id"] for invoice in storage.changed_since("invoices", since)] == ["INV-20250215-2"]
+    storage.close()
+
+
+@pytest.mark.parametrize("error", [errno.EPERM, errno.EOPNOTSUPP, errno.EXDEV])
+def test_insert_without_hard_links(tmp_path, monkeypatch, error):
+    def link(src, dst):
+        raise OSError(error, os.strerror(error))
+
+    monkeypatch.setattr(os, "link", link)
+    storage = JsonFileStorage(str(tmp_path))
+    storage.insert_many("invoices", [_invoice("INV-1", 100), _invoice("INV-2", 200)])
+    with pytest.raises(RecordExistsError):
+        storage.insert("invoices", "INV-1", _invoice("INV-1", 300))
+
+    assert [storage.get("invoices", record_id)["amount"] for record_id in ("INV-1", "INV-2")] == [100, 200]
+    assert sorted(os.listdir(tmp_path / "invoices")) == ["INV-1.json", "INV-2.json"]
+    storage.close()
+
+
+class _FailingDirectorySync(Durability):
+    """Syncs files but fails on directories, as a full or failing disk might"""
+
+    def __init__(self):
+        super().__init__("none")
+        self.synced = []
+
+    def sync(self, paths):
+        paths = list(paths)
+        self.synced.append(paths)
+        if any(os.path.isdir(path) for path in paths):
+            raise OSError(errno.EIO, os.strerror(errno.EIO))
+
+
+def test_directory_sync_errors_do_not_mask_a_failed_write(tmp_path, caplog):
+    storage = JsonFileStorage(str(tmp_path), durability=_FailingDirectorySync())
+    os.makedirs(tmp_path / "invoices", exist_ok=True)
+    with open(tmp_path / "invoices" / "INV-2.json", "w") as f:
+        json.dump(_invoice("INV-2"), f)
+
+    with caplog.at_level(logging.ERROR, logger="app"):
+        with pytest.raises(RecordExistsError):
+            storage.insert_many("invoices", [_invoice("INV-1"), _invoice("INV-2")])
+    # The record linked before the conflict stays written, and its directory was still synced
+    assert storage.get("invoices", "INV-1") == _invoice("INV-1")
+    assert storage.durability.synced[-1] == [str(tmp_path / "invoices")]
+    assert [record.getMessage() for record in caplog.records] == ["Error syncing invoices directories after a failed write"]
+
+    # A write that succeeded reports the sync error itself
+    with pytest.raises(OSError):
+        storage.put("invoices", "INV-3", _invoice("INV-3"))
@@ -0,0 +1,42 @@
+from typing import Tuple
+from datetime import datetime
+
+
+def _parse(value: str) -> Tuple[datetime, bool]:
+    """Parse an ISO date, returning it as naive local time and whether it had an offset"""
+    if not isinstance(value, str):
+        raise TypeError(f"Expected an ISO date string, got {type(value).__name__}")
+    if value.endswith(("Z", "z")):
+        # fromisoformat() only accepts a "Z" suffix from Python 3.11
+        value = value[:-1] + "+00:00"
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        return parsed, False
+    return parsed.astimezone().replace(tzinfo=None), True
+
+
+def parse_timestamp(value: str) -> datetime:
+    """Parse an ISO 8601 date or timestamp as a naive local time
+
+    Stored timestamps are naive and in the server's local time, like
+    datetime.now(). A timestamp with a UTC offset is converted to local time
+    and made naive, so it compares with the stored ones.
+
+    Raises:
+        TypeError: If value is not a string
+        ValueError: If value is not an ISO date
+    """
+    return _parse(value)[0]
+
+
+def normalize_timestamp(value: str) -> str:
+    """Rewrite an ISO date or timestamp in the stored form (see parse_timestamp)
+
+    Values without an offset are returned unchanged.
+
+    Raises:
+        TypeError: If value is not a string
+        ValueError: If value is not an ISO date
+    """
+    parsed, had_offset = _parse(value)
+    return parsed.isoformat() if had_offset else value